@@ -30,7 +30,7 @@ from typing import TYPE_CHECKING, Dict, Optional, Set, Tuple, NamedTuple, Sequen
 from .crypto import sha256
 from . import bitcoin, util
 from .bitcoin import COINBASE_MATURITY
-from .util import profiler, bfh, TxMinedInfo, UnrelatedTransactionException, with_lock, OldTaskGroup
+from .util import profiler, bfh, TxMinedInfo, UnrelatedTransactionException, with_lock, OldTaskGroup, LRUCache
 from .transaction import Transaction, TxOutput, TxInput, PartialTxInput, TxOutpoint, PartialTransaction
 from .synchronizer import Synchronizer
 from .verifier import SPV
@@ -53,6 +53,9 @@ TX_HEIGHT_UNCONFIRMED = 0
 TX_TIMESTAMP_INF = 999_999_999_999
 TX_HEIGHT_INF = 10 ** 9
 
+# number of domains for which get_history keeps its sorted result
+HISTORY_CACHE_SIZE = 10
+
 
 class HistoryItem(NamedTuple):
     txid: str
@@ -62,6 +65,18 @@ class HistoryItem(NamedTuple):
     balance: int
 
 
+class _HistoryCacheEntry:
+    """get_history result for a domain, without the parts that change with new blocks"""
+
+    def __init__(self, version: int, tx_deltas: Sequence[Tuple[str, int]]):
+        self.version = version  # AddressSynchronizer._history_version this was computed at
+        self.tx_deltas = tx_deltas  # list of (txid, delta), sorted if sort_keys is set
+        self.sort_keys = None  # type: Optional[List[Tuple[int, int]]]
+        self.balances = None  # type: Optional[List[int]]
+        self.items = None  # type: Optional[List[HistoryItem]]
+        self.items_key = None  # (AddressSynchronizer._tx_status_version, local height) of items
+
+
 class AddressSynchronizer(Logger, EventListener):
     """ address database """
 
@@ -87,10 +102,16 @@ class AddressSynchronizer(Logger, EventListener):
         self.unverified_tx = defaultdict(int)  # type: Dict[str, int]  # txid -> height. Access with self.lock.
         # Txs the server claims are in the mempool:
         self.unconfirmed_tx = defaultdict(int)  # type: Dict[str, int]  # txid -> height. Access with self.lock.
+        # incremented when the mined status or the fee of a tx might have changed
+        self._tx_status_version = 0
+        self._tx_status_cache = {}  # type: Dict[str, Tuple[TxMinedInfo, Optional[int]]]  # txid -> (mined info, fee)
+        self._tx_status_cache_height = None  # local height of _tx_status_cache
         # thread local storage for caching stuff
         self.threadlocal_cache = threading.local()
 
         self._get_balance_cache = {}
+        # domain -> _HistoryCacheEntry
+        self._get_history_cache = LRUCache(maxsize=HISTORY_CACHE_SIZE)  # type: Dict[str, _HistoryCacheEntry]
 
         self.load_and_cleanup()
 
@@ -404,6 +425,7 @@ class AddressSynchronizer(Logger, EventListener):
             self.db.remove_verified_tx(tx_hash)
             self.unverified_tx.pop(tx_hash, None)
             self.unconfirmed_tx.pop(tx_hash, None)
+            self._tx_status_changed(tx_hash)
             if tx:
                 for idx, txo in enumerate(tx.outputs()):
                     scripthash = bitcoin.script_to_scripthash(txo.scriptpubkey.hex())
@@ -436,6 +458,7 @@ class AddressSynchronizer(Logger, EventListener):
                     self.unverified_tx.pop(tx_hash, None)
                     self.unconfirmed_tx.pop(tx_hash, None)
                     self.db.remove_verified_tx(tx_hash)
+                    self._tx_status_changed(tx_hash)
                     if self.verifier:
                         self.verifier.remove_spv_proof_for_tx(tx_hash)
             self.db.set_addr_history(addr, hist)
@@ -456,12 +479,19 @@ class AddressSynchronizer(Logger, EventListener):
         # Store fees
         for tx_hash, fee_sat in tx_fees.items():
             self.db.add_tx_fee_from_server(tx_hash, fee_sat)
+            self._tx_status_changed(tx_hash)
 
     @profiler
     def load_local_history(self):
         self._history_local = {}  # type: Dict[str, Set[str]]  # address -> set(txid)
         self._address_history_changed_events = defaultdict(asyncio.Event)  # address -> Event
-        for txid in itertools.chain(self.db.list_txi(), self.db.list_txo()):
+        # index of txi/txo, maintained with _history_local:
+        self._addr_coins = defaultdict(dict)  # type: Dict[str, Dict[str, Tuple[int, bool]]]  # address -> prevout -> (value, is_cb)
+        self._addr_spent = defaultdict(dict)  # type: Dict[str, Dict[str, str]]  # address -> prevout -> spending txid
+        self._coin_addr = {}  # type: Dict[str, str]  # prevout -> address
+        self._tx_deltas = {}  # type: Dict[str, Dict[str, int]]  # txid -> address -> delta
+        self._history_version = 0  # incremented when the above change
+        for txid in set(itertools.chain(self.db.list_txi(), self.db.list_txo())):
             self._add_tx_to_local_history(txid)
 
     @profiler
@@ -490,15 +520,26 @@ class AddressSynchronizer(Logger, EventListener):
             with self.transaction_lock:
                 self.db.clear_history()
                 self._history_local.clear()
+                self._addr_coins.clear()
+                self._addr_spent.clear()
+                self._coin_addr.clear()
+                self._tx_deltas.clear()
+                self._history_version += 1
+                self._tx_status_version += 1
+                self._tx_status_cache.clear()
                 self._get_balance_cache.clear()  # invalidate cache
 
     def _get_tx_sort_key(self, tx_hash: str) -> Tuple[int, int]:
         """Returns a key to be used for sorting txs."""
         with self.lock:
             tx_mined_info = self.get_tx_height(tx_hash)
-            height = self.tx_height_to_sort_height(tx_mined_info.height)
-            txpos = tx_mined_info.txpos or -1
-            return height, txpos
+            return self._tx_mined_info_to_sort_key(tx_mined_info)
+
+    @classmethod
+    def _tx_mined_info_to_sort_key(cls, tx_mined_info: TxMinedInfo) -> Tuple[int, int]:
+        height = cls.tx_height_to_sort_height(tx_mined_info.height)
+        txpos = tx_mined_info.txpos or -1
+        return height, txpos
 
     @classmethod
     def tx_height_to_sort_height(cls, height: int = None):
@@ -533,50 +574,93 @@ class AddressSynchronizer(Logger, EventListener):
     @with_local_height_cached
     def get_history(self, domain) -> Sequence[HistoryItem]:
         domain = set(domain)
-        # 1. Get the history of each address in the domain, maintain the
-        #    delta of a tx as the sum of its deltas on domain addresses
-        tx_deltas = defaultdict(int)  # type: Dict[str, int]
-        for addr in domain:
-            h = self.get_address_history(addr).items()
-            for tx_hash, height in h:
-                tx_deltas[tx_hash] += self.get_tx_delta(tx_hash, addr)
-        # 2. create sorted history
-        history = []
-        for tx_hash in tx_deltas:
-            delta = tx_deltas[tx_hash]
-            tx_mined_status = self.get_tx_height(tx_hash)
-            fee = self.get_tx_fee(tx_hash)
-            history.append((tx_hash, tx_mined_status, delta, fee))
-        history.sort(key = lambda x: self._get_tx_sort_key(x[0]))
-        # 3. add balance
+        cache_key = sha256(','.join(sorted(domain)))
+        entry = self._get_history_cache.get(cache_key)
+        if entry is None or entry.version != self._history_version:
+            # 1. Get the history of each address in the domain, maintain the
+            #    delta of a tx as the sum of its deltas on domain addresses
+            tx_deltas = defaultdict(int)  # type: Dict[str, int]
+            for addr in domain:
+                for tx_hash in self._history_local.get(addr, ()):
+                    tx_deltas[tx_hash] += self._tx_deltas.get(tx_hash, {}).get(addr, 0)
+            entry = _HistoryCacheEntry(self._history_version, list(tx_deltas.items()))
+            self._get_history_cache[cache_key] = entry
+        # 2. the items of the entry only change with the mined status and fees of its txs,
+        #    and with the local height (number of confirmations)
+        items_key = (self._tx_status_version, self.get_local_height())
+        if entry.items is not None and entry.items_key == items_key:
+            return list(entry.items)
+        if self._tx_status_cache_height != items_key[1]:
+            self._tx_status_cache.clear()
+            self._tx_status_cache_height = items_key[1]
+        tx_statuses = {tx_hash: self._get_cached_tx_status(tx_hash) for tx_hash, delta in entry.tx_deltas}
+        # 3. sort history. Heights only change the order (and running balance)
+        #    of the cached entry when a tx gets mined, verified or reorged.
+        tx_mined_infos = [tx_statuses[tx_hash][0] for tx_hash, delta in entry.tx_deltas]
+        sort_keys = [self._tx_mined_info_to_sort_key(info) for info in tx_mined_infos]
+        if sort_keys != entry.sort_keys:
+            order = sorted(range(len(sort_keys)), key=lambda i: sort_keys[i])
+            entry.tx_deltas = [entry.tx_deltas[i] for i in order]
+            tx_mined_infos = [tx_mined_infos[i] for i in order]
+            entry.sort_keys = [sort_keys[i] for i in order]
+            # 4. add balance
+            entry.balances = list(itertools.accumulate(delta for tx_hash, delta in entry.tx_deltas))
         h2 = []
-        balance = 0
-        for tx_hash, tx_mined_status, delta, fee in history:
-            balance += delta
+        for (tx_hash, delta), tx_mined_status, balance in zip(entry.tx_deltas, tx_mined_infos, entry.balances):
             h2.append(HistoryItem(
                 txid=tx_hash,
                 tx_mined_status=tx_mined_status,
                 delta=delta,
-                fee=fee,
+                fee=tx_statuses[tx_hash][1],
                 balance=balance))
+        balance = entry.balances[-1] if entry.balances else 0
         # sanity check
         c, u, x = self.get_balance(domain)
         if balance != c + u + x:
             self.logger.error(f'sanity check failed! c={c},u={u},x={x} while history balance={balance}')
             raise Exception("wallet.get_history() failed balance sanity-check")
-        return h2
+        entry.items, entry.items_key = h2, items_key
+        return list(h2)
+
+    def _tx_status_changed(self, tx_hash: str) -> None:
+        self._tx_status_cache.pop(tx_hash, None)
+        self._tx_status_version += 1
+
+    def _get_cached_tx_status(self, tx_hash: str) -> Tuple[TxMinedInfo, Optional[int]]:
+        status = self._tx_status_cache.get(tx_hash)
+        if status is None:
+            status = self._tx_status_cache[tx_hash] = self.get_tx_height(tx_hash), self.get_tx_fee(tx_hash)
+        return status
 
     def _add_tx_to_local_history(self, txid):
         with self.transaction_lock:
-            for addr in itertools.chain(self.db.get_txi_addresses(txid), self.db.get_txo_addresses(txid)):
+            deltas = {}
+            for addr in set(itertools.chain(self.db.get_txi_addresses(txid), self.db.get_txo_addresses(txid))):
                 cur_hist = self._history_local.get(addr, set())
                 cur_hist.add(txid)
                 self._history_local[addr] = cur_hist
                 self._mark_address_history_changed(addr)
+                # index txi and txo. note: they might have been indexed already
+                delta = 0
+                for n, (v, is_cb) in self.db.get_txo_addr(txid, addr).items():
+                    prevout = f"{txid}:{n}"
+                    self._addr_coins[addr][prevout] = v, is_cb
+                    self._coin_addr[prevout] = addr
+                    delta += v
+                for prevout, v in self.db.get_txi_addr(txid, addr):
+                    self._addr_spent[addr][prevout] = txid
+                    delta -= v
+                deltas[addr] = delta
+            self._tx_deltas[txid] = deltas
+            self._history_version += 1
+            # the fee of children might now be known
+            self._tx_status_cache.pop(txid, None)
+            for n in self.db.get_spent_outpoints(txid):
+                self._tx_status_cache.pop(self.db.get_spent_outpoint(txid, n), None)
 
     def _remove_tx_from_local_history(self, txid):
         with self.transaction_lock:
-            for addr in itertools.chain(self.db.get_txi_addresses(txid), self.db.get_txo_addresses(txid)):
+            for addr in set(itertools.chain(self.db.get_txi_addresses(txid), self.db.get_txo_addresses(txid))):
                 cur_hist = self._history_local.get(addr, set())
                 try:
                     cur_hist.remove(txid)
@@ -585,6 +669,15 @@ class AddressSynchronizer(Logger, EventListener):
                 else:
                     self._history_local[addr] = cur_hist
                     self._mark_address_history_changed(addr)
+                for n in self.db.get_txo_addr(txid, addr):
+                    prevout = f"{txid}:{n}"
+                    self._addr_coins[addr].pop(prevout, None)
+                    self._coin_addr.pop(prevout, None)
+                for prevout, v in self.db.get_txi_addr(txid, addr):
+                    if self._addr_spent[addr].get(prevout) == txid:
+                        self._addr_spent[addr].pop(prevout)
+            self._tx_deltas.pop(txid, None)
+            self._history_version += 1
 
     def _mark_address_history_changed(self, addr: str) -> None:
         def set_and_clear():
@@ -612,26 +705,31 @@ class AddressSynchronizer(Logger, EventListener):
                 with self.lock:
                     self.db.remove_verified_tx(tx_hash)
                     self.unconfirmed_tx[tx_hash] = tx_height
+                    self._tx_status_changed(tx_hash)
                 if self.verifier:
                     self.verifier.remove_spv_proof_for_tx(tx_hash)
         else:
             with self.lock:
-                if tx_height > 0:
-                    self.unverified_tx[tx_hash] = tx_height
-                else:
-                    self.unconfirmed_tx[tx_hash] = tx_height
+                d = self.unverified_tx if tx_height > 0 else self.unconfirmed_tx
+                if d.get(tx_hash) != tx_height:
+                    d[tx_hash] = tx_height
+                    self._tx_status_changed(tx_hash)
+            if tx_height > 0 and self.verifier:
+                self.verifier.add_tx_to_check(tx_hash)
 
     def remove_unverified_tx(self, tx_hash, tx_height):
         with self.lock:
             new_height = self.unverified_tx.get(tx_hash)
             if new_height == tx_height:
                 self.unverified_tx.pop(tx_hash, None)
+                self._tx_status_changed(tx_hash)
 
     def add_verified_tx(self, tx_hash: str, info: TxMinedInfo):
         # Remove from the unverified map and add to the verified map
         with self.lock:
             self.unverified_tx.pop(tx_hash, None)
             self.db.add_verified_tx(tx_hash, info)
+            self._tx_status_changed(tx_hash)
         util.trigger_callback('adb_added_verified_tx', self, tx_hash)
 
     def get_unverified_txs(self) -> Dict[str, int]:
@@ -660,6 +758,7 @@ class AddressSynchronizer(Logger, EventListener):
                         # into unverified_tx with the old height, and if we get
                         # a status update, that will overwrite it.
                         self.unverified_tx[tx_hash] = tx_height
+                        self._tx_status_changed(tx_hash)
                         txs.add(tx_hash)
 
         for tx_hash in txs:
@@ -682,6 +781,7 @@ class AddressSynchronizer(Logger, EventListener):
         with self.lock:
             old_height = self.future_tx.get(txid) or None
             self.future_tx[txid] = wanted_height
+            self._tx_status_changed(txid)
         if old_height != wanted_height:
             util.trigger_callback('adb_set_future_tx', self, txid)
 
@@ -805,20 +905,21 @@ class AddressSynchronizer(Logger, EventListener):
 
     def get_addr_io(self, address: str):
         with self.lock, self.transaction_lock:
-            h = self.get_address_history(address).items()
             received = {}
             sent = {}
-            for tx_hash, height in h:
-                tx_mined_info = self.get_tx_height(tx_hash)
-                txpos = tx_mined_info.txpos if tx_mined_info.txpos is not None else -1
-                d = self.db.get_txo_addr(tx_hash, address)
-                for n, (v, is_cb) in d.items():
-                    received[tx_hash + ':%d'%n] = (height, txpos, v, is_cb)
-                l = self.db.get_txi_addr(tx_hash, address)
-                for txi, v in l:
-                    sent[txi] = tx_hash, height, txpos
+            for prevout, (v, is_cb) in self._addr_coins.get(address, {}).items():
+                height, txpos = self._get_tx_height_and_txpos(prevout[:64])
+                received[prevout] = (height, txpos, v, is_cb)
+            for prevout, tx_hash in self._addr_spent.get(address, {}).items():
+                height, txpos = self._get_tx_height_and_txpos(tx_hash)
+                sent[prevout] = tx_hash, height, txpos
         return received, sent
 
+    def _get_tx_height_and_txpos(self, tx_hash: str) -> Tuple[int, int]:
+        tx_mined_info = self.get_tx_height(tx_hash)
+        txpos = tx_mined_info.txpos if tx_mined_info.txpos is not None else -1
+        return tx_mined_info.height, txpos
+
     def get_addr_outputs(self, address: str) -> Dict[TxOutpoint, PartialTxInput]:
         received, sent = self.get_addr_io(address)
         out = {}
@@ -874,36 +975,33 @@ class AddressSynchronizer(Logger, EventListener):
         if cached_value:
             return cached_value
 
-        coins = {}
-        for address in domain:
-            coins.update(self.get_addr_outputs(address))
-
         c = u = x = 0
         mempool_height = self.get_local_height() + 1  # height of next block
-        for utxo in coins.values():  # type: PartialTxInput
-            if utxo.spent_height is not None:
-                continue
-            if utxo.prevout.to_str() in excluded_coins:
-                continue
-            v = utxo.value_sats()
-            tx_height = utxo.block_height
-            is_cb = utxo.is_coinbase_output()
-            if is_cb and tx_height + COINBASE_MATURITY > mempool_height:
-                x += v
-            elif tx_height > 0:
-                c += v
-            else:
-                txid = utxo.prevout.txid.hex()
+        for address in domain:
+            spent = self._addr_spent.get(address, {})
+            for prevout, (v, is_cb) in self._addr_coins.get(address, {}).items():
+                if prevout in spent:
+                    continue
+                if prevout in excluded_coins:
+                    continue
+                txid = prevout[:64]
+                tx_height = self.get_tx_height(txid).height
+                if is_cb and tx_height + COINBASE_MATURITY > mempool_height:
+                    x += v
+                    continue
+                if tx_height > 0:
+                    c += v
+                    continue
                 tx = self.db.get_transaction(txid)
-                assert tx is not None # txid comes from get_addr_io
+                assert tx is not None  # txid comes from txo
                 # we look at the outputs that are spent by this transaction
                 # if those outputs are ours and confirmed, we count this coin as confirmed
                 confirmed_spent_amount = 0
                 for txin in tx.inputs():
-                    if txin.prevout in coins:
-                        coin = coins[txin.prevout]
-                        if coin.block_height > 0:
-                            confirmed_spent_amount += coin.value_sats()
+                    prevout2 = txin.prevout.to_str()
+                    addr2 = self._coin_addr.get(prevout2)
+                    if addr2 in domain and self.get_tx_height(prevout2[:64]).height > 0:
+                        confirmed_spent_amount += self._addr_coins[addr2][prevout2][0]
                 # Compare amount, in case tx has confirmed and unconfirmed inputs, or is a coinjoin.
                 # (fixme: tx may have multiple change outputs)
                 if confirmed_spent_amount >= v:
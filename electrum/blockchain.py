@@ -20,10 +20,14 @@
 # ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
+import concurrent.futures
+import hashlib
+import mmap
+import multiprocessing
 import os
 import threading
 import time
-from typing import Optional, Dict, Mapping, Sequence, TYPE_CHECKING
+from typing import Optional, Dict, Mapping, Sequence, Union, Any, TYPE_CHECKING
 
 from . import util
 from .bitcoin import hash_encode, int_to_hex, rev_hex
@@ -42,6 +46,17 @@ HEADER_SIZE = 80  # bytes
 # see https://github.com/bitcoin/bitcoin/blob/feedb9c84e72e4fff489810a2bbeec09bcda5763/src/chainparams.cpp#L76
 MAX_TARGET = 0x00000000ffffffffffffffffffffffffffffffffffffffffffffffffffffffff  # compact: 0x1d00ffff
 
+# max number of block hashes cached per Blockchain instance
+HASH_CACHE_SIZE = 50_000
+
+# Each headers file has a sidecar index file, with one fixed-width record per
+# complete retarget period (chunk). Record 'i' describes the last block of chunk i:
+# blockhash (32 bytes, internal byte order), target computed from chunk i (32 bytes, big endian),
+# and chainwork up to and including that block (32 bytes, big endian).
+# Records for chunks that end before the forkpoint of the chain are zeroed.
+CHAINWORK_INDEX_SUFFIX = '.chainwork'
+CHAINWORK_INDEX_RECORD_SIZE = 96
+
 
 class MissingHeader(Exception):
     pass
@@ -74,9 +89,98 @@ def deserialize_header(s: bytes, height: int) -> dict:
     h['block_height'] = height
     return h
 
-def hash_header(header: dict) -> str:
+class BlockHeader:
+    """A block header, kept in its serialized form.
+    Fields are decoded lazily from the raw bytes. For compatibility with
+    code written against deserialize_header, fields can also be accessed
+    like dict items, e.g. header['timestamp'] or header.get('bits').
+    """
+
+    __slots__ = ('raw', 'block_height', '_hash')
+
+    FIELDS = ('version', 'prev_block_hash', 'merkle_root', 'timestamp', 'bits', 'nonce', 'block_height')
+
+    def __init__(self, raw: bytes, block_height: int):
+        if not raw:
+            raise InvalidHeader('Invalid header: {}'.format(raw))
+        if len(raw) != HEADER_SIZE:
+            raise InvalidHeader('Invalid header length: {}'.format(len(raw)))
+        self.raw = bytes(raw)
+        self.block_height = block_height
+        self._hash = None  # type: Optional[str]
+
+    @property
+    def version(self) -> int:
+        return int.from_bytes(self.raw[0:4], byteorder='little')
+
+    @property
+    def prev_block_hash(self) -> str:
+        return hash_encode(self.raw[4:36])
+
+    @property
+    def merkle_root(self) -> str:
+        return hash_encode(self.raw[36:68])
+
+    @property
+    def timestamp(self) -> int:
+        return int.from_bytes(self.raw[68:72], byteorder='little')
+
+    @property
+    def bits(self) -> int:
+        return int.from_bytes(self.raw[72:76], byteorder='little')
+
+    @property
+    def nonce(self) -> int:
+        return int.from_bytes(self.raw[76:80], byteorder='little')
+
+    def prev_hash_bytes(self) -> bytes:
+        """Returns the hash of the previous block, in internal byte order."""
+        return self.raw[4:36]
+
+    def hash_bytes(self) -> bytes:
+        """Returns the hash of this block, in internal byte order."""
+        return sha256d(self.raw)
+
+    def hash(self) -> str:
+        if self._hash is None:
+            self._hash = hash_encode(self.hash_bytes())
+        return self._hash
+
+    def to_dict(self) -> dict:
+        return {key: getattr(self, key) for key in self.FIELDS}
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key not in self.FIELDS:
+            return default
+        return getattr(self, key)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.FIELDS
+
+    def __eq__(self, other):
+        if isinstance(other, BlockHeader):
+            return self.raw == other.raw and self.block_height == other.block_height
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    def __hash__(self):
+        return hash((self.raw, self.block_height))
+
+    def __repr__(self):
+        return f"<BlockHeader height={self.block_height} hash={self.hash()}>"
+
+
+def hash_header(header: Union[dict, BlockHeader, None]) -> str:
     if header is None:
         return '0' * 64
+    if isinstance(header, BlockHeader):
+        return header.hash()
     if header.get('prev_block_hash') is None:
         header['prev_block_hash'] = '00'*32
     return hash_raw_header(serialize_header(header))
@@ -86,6 +190,40 @@ def hash_raw_header(header: str) -> str:
     return hash_encode(sha256d(bfh(header)))
 
 
+def hash_raw_headers(data: bytes) -> Sequence[bytes]:
+    """Hashes all headers in data, a concatenation of serialized headers,
+    in a single pass over the buffer. Hashes are in internal byte order.
+    """
+    if len(data) % HEADER_SIZE != 0:
+        raise InvalidHeader('Invalid headers length: {}'.format(len(data)))
+    view = memoryview(data)
+    sha256 = hashlib.sha256
+    return [sha256(sha256(view[i:i + HEADER_SIZE]).digest()).digest()
+            for i in range(0, len(data), HEADER_SIZE)]
+
+
+_header_hash_executor = None  # type: Optional[concurrent.futures.Executor]
+
+
+def get_header_hash_executor(num_processes: int) -> Optional[concurrent.futures.Executor]:
+    """Returns a process pool that can run hash_raw_headers, or None if
+    num_processes is not positive or the platform does not support it.
+    """
+    global _header_hash_executor
+    if num_processes <= 0:
+        return None
+    if _header_hash_executor is None:
+        try:
+            _header_hash_executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=num_processes,
+                mp_context=multiprocessing.get_context('spawn'))
+        except (ImportError, NotImplementedError, OSError) as e:
+            # e.g. Android does not have working multiprocessing semaphores
+            _logger.warning(f"cannot create process pool for header hashing: {repr(e)}")
+            return None
+    return _header_hash_executor
+
+
 pow_hash_header = hash_header
 
 
@@ -107,7 +245,9 @@ def read_blockchains(config: 'SimpleConfig'):
         header_after_cp = best_chain.read_header(constants.net.max_checkpoint()+1)
         if not header_after_cp or not best_chain.can_connect(header_after_cp, check_height=False):
             _logger.info("[blockchain] deleting best chain. cannot connect header after last cp to last cp.")
+            best_chain._close_mmap()
             os.unlink(best_chain.path())
+            best_chain.delete_chainwork_index()
             best_chain.update_size()
     # forks
     fdir = os.path.join(util.get_headers_dir(config), 'forks')
@@ -119,6 +259,9 @@ def read_blockchains(config: 'SimpleConfig'):
     def delete_chain(filename, reason):
         _logger.info(f"[blockchain] deleting chain {filename}: {reason}")
         os.unlink(os.path.join(fdir, filename))
+        index_path = os.path.join(fdir, filename + CHAINWORK_INDEX_SUFFIX)
+        if os.path.exists(index_path):
+            os.unlink(index_path)
 
     def instantiate_chain(filename):
         __, forkpoint, prev_hash, first_hash = filename.split('_')
@@ -156,6 +299,9 @@ def read_blockchains(config: 'SimpleConfig'):
     for filename in l:
         instantiate_chain(filename)
 
+    for b in list(blockchains.values()):
+        b.load_chainwork_index()
+
 
 def get_best_chain() -> 'Blockchain':
     return blockchains[constants.net.GENESIS]
@@ -171,6 +317,7 @@ def init_headers_file_for_best_chain():
     filename = b.path()
     length = HEADER_SIZE * len(constants.net.CHECKPOINTS) * 2016
     if not os.path.exists(filename) or os.path.getsize(filename) < length:
+        b._close_mmap()
         with open(filename, 'wb') as f:
             if length > 0:
                 f.seek(length - 1)
@@ -199,6 +346,9 @@ class Blockchain(Logger):
         self._forkpoint_hash = forkpoint_hash  # blockhash at forkpoint. "first hash"
         self._prev_hash = prev_hash  # blockhash immediately before forkpoint
         self.lock = threading.RLock()
+        self._mmap = None  # type: Optional[mmap.mmap]  # read-only view of our headers file
+        self._hash_cache = {}  # type: Dict[int, str]  # height -> blockhash, only for heights >= forkpoint
+        self._target_cache = {}  # type: Dict[int, int]  # chunk index -> target
         self.update_size()
 
     @property
@@ -249,7 +399,7 @@ class Blockchain(Logger):
     def get_name(self) -> str:
         return self.get_hash(self.get_max_forkpoint()).lstrip('0')[0:10]
 
-    def check_header(self, header: dict) -> bool:
+    def check_header(self, header: Union[dict, BlockHeader]) -> bool:
         header_hash = hash_header(header)
         height = header.get('block_height')
         return self.check_hash(height, header_hash)
@@ -264,7 +414,7 @@ class Blockchain(Logger):
         except Exception:
             return False
 
-    def fork(parent, header: dict) -> 'Blockchain':
+    def fork(parent, header: Union[dict, BlockHeader]) -> 'Blockchain':
         if not parent.can_connect(header, check_height=False):
             raise Exception("forking header does not connect to parent chain")
         forkpoint = header.get('block_height')
@@ -294,10 +444,35 @@ class Blockchain(Logger):
     @with_lock
     def update_size(self) -> None:
         p = self.path()
+        self._close_mmap()
         self._size = os.path.getsize(p)//HEADER_SIZE if os.path.exists(p) else 0
+        self._invalidate_caches(from_height=self.height() + 1)
+
+    @with_lock
+    def _close_mmap(self) -> None:
+        # note: the mapping must be closed before the file is truncated, replaced or deleted
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    @with_lock
+    def _get_mmap(self) -> Optional[mmap.mmap]:
+        if self._mmap is None and self._size > 0:
+            name = self.path()
+            self.assert_headers_file_available(name)
+            with open(name, 'rb') as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mmap
+
+    @with_lock
+    def _invalidate_caches(self, *, from_height: int) -> None:
+        """Forgets cached data derived from headers at or above from_height."""
+        self._hash_cache = {h: v for h, v in self._hash_cache.items() if h < from_height}
+        from_index = max(0, from_height) // 2016
+        self._target_cache = {i: v for i, v in self._target_cache.items() if i < from_index}
 
     @classmethod
-    def verify_header(cls, header: dict, prev_hash: str, target: int, expected_header_hash: str=None) -> None:
+    def verify_header(cls, header: Union[dict, BlockHeader], prev_hash: str, target: int, expected_header_hash: str=None) -> None:
         _hash = hash_header(header)
         if expected_header_hash and expected_header_hash != _hash:
             raise InvalidHeader("hash mismatches with expected: {} vs {}".format(expected_header_hash, _hash))
@@ -306,21 +481,36 @@ class Blockchain(Logger):
         if constants.net.TESTNET:
             return
 
-    def verify_chunk(self, index: int, data: bytes) -> None:
+    def verify_chunk(self, index: int, data: bytes, *, header_hashes: Sequence[bytes] = None) -> None:
+        """Verifies the headers in data, which are to be saved as chunk 'index'.
+        header_hashes, if given, must be hash_raw_headers(data), e.g. computed in another process.
+        """
         num = len(data) // HEADER_SIZE
         start_height = index * 2016
-        prev_hash = self.get_hash(start_height - 1)
-        target = self.get_target(index-1)
+        prev_hash = bfh(self.get_hash(start_height - 1))[::-1]
+        if header_hashes is None:
+            header_hashes = hash_raw_headers(data)
+        if len(header_hashes) != num:
+            raise InvalidHeader(f"expected {num} header hashes, got {len(header_hashes)}")
+        # heights above this cannot have an expected hash: no header, and no checkpoint either
+        max_known_height = max(self.height(), constants.net.max_checkpoint())
         for i in range(num):
             height = start_height + i
-            try:
-                expected_header_hash = self.get_hash(height)
-            except MissingHeader:
-                expected_header_hash = None
-            raw_header = data[i*HEADER_SIZE : (i+1)*HEADER_SIZE]
-            header = deserialize_header(raw_header, index*2016 + i)
-            self.verify_header(header, prev_hash, target, expected_header_hash)
-            prev_hash = hash_header(header)
+            _hash = header_hashes[i]
+            if height <= max_known_height:
+                try:
+                    expected_header_hash = self.get_hash(height)
+                except MissingHeader:
+                    expected_header_hash = None
+                if expected_header_hash and expected_header_hash != hash_encode(_hash):
+                    raise InvalidHeader("hash mismatches with expected: {} vs {}".format(
+                        expected_header_hash, hash_encode(_hash)))
+            offset = i * HEADER_SIZE
+            header_prev_hash = data[offset + 4:offset + 36]
+            if prev_hash != header_prev_hash:
+                raise InvalidHeader("prev hash mismatch: %s vs %s" % (
+                    hash_encode(prev_hash), hash_encode(header_prev_hash)))
+            prev_hash = _hash
 
     @with_lock
     def path(self):
@@ -355,6 +545,7 @@ class Blockchain(Logger):
         truncate = not chunk_within_checkpoint_region
         self.write(chunk, delta_bytes, truncate)
         self.swap_with_parent()
+        self.update_chainwork_index()
 
     def swap_with_parent(self) -> None:
         with self.lock, blockchains_lock:
@@ -388,6 +579,9 @@ class Blockchain(Logger):
         parent = self.parent  # type: Optional[Blockchain]
         child_old_id = self.get_id()
         parent_old_id = parent.get_id()
+        # both files are about to change; their indexes get rebuilt below
+        self.delete_chainwork_index()
+        parent.delete_chainwork_index()
         # swap files
         # child takes parent's name
         # parent's new name will be something new (not child's old name)
@@ -409,9 +603,15 @@ class Blockchain(Logger):
         self._forkpoint_hash, parent._forkpoint_hash = parent._forkpoint_hash, hash_raw_header(parent_data[:HEADER_SIZE].hex())
         self._prev_hash, parent._prev_hash = parent._prev_hash, self._prev_hash
         # parent's new name
+        self._close_mmap()
+        parent._close_mmap()
         os.replace(child_old_name, parent.path())
         self.update_size()
         parent.update_size()
+        self._invalidate_caches(from_height=0)
+        parent._invalidate_caches(from_height=0)
+        self.update_chainwork_index()
+        parent.update_chainwork_index()
         # update pointers
         blockchains.pop(child_old_id, None)
         blockchains.pop(parent_old_id, None)
@@ -434,6 +634,12 @@ class Blockchain(Logger):
     def write(self, data: bytes, offset: int, truncate: bool=True) -> None:
         filename = self.path()
         self.assert_headers_file_available(filename)
+        self._close_mmap()
+        self._invalidate_caches(from_height=self.forkpoint + offset // HEADER_SIZE)
+        if truncate:
+            # note: non-truncating writes are only done in the checkpoint region,
+            #       where the index is derived from the checkpoints
+            self._truncate_chainwork_index(from_height=self.forkpoint + offset // HEADER_SIZE)
         with open(filename, 'rb+') as f:
             if truncate and offset != self._size * HEADER_SIZE:
                 f.seek(offset)
@@ -445,36 +651,44 @@ class Blockchain(Logger):
         self.update_size()
 
     @with_lock
-    def save_header(self, header: dict) -> None:
+    def save_header(self, header: Union[dict, BlockHeader]) -> None:
         delta = header.get('block_height') - self.forkpoint
-        data = bfh(serialize_header(header))
+        if isinstance(header, BlockHeader):
+            data = header.raw
+        else:
+            data = bfh(serialize_header(header))
         # headers are only _appended_ to the end:
         assert delta == self.size(), (delta, self.size())
         assert len(data) == HEADER_SIZE
         self.write(data, delta*HEADER_SIZE)
         self.swap_with_parent()
+        self.update_chainwork_index()
 
     @with_lock
-    def read_header(self, height: int) -> Optional[dict]:
+    def read_raw_header(self, height: int) -> Optional[bytes]:
+        """Returns the serialized header at height, sliced out of the mapped headers file."""
         if height < 0:
             return
         if height < self.forkpoint:
-            return self.parent.read_header(height)
+            return self.parent.read_raw_header(height)
         if height > self.height():
             return
         delta = height - self.forkpoint
-        name = self.path()
-        self.assert_headers_file_available(name)
-        with open(name, 'rb') as f:
-            f.seek(delta * HEADER_SIZE)
-            h = f.read(HEADER_SIZE)
-            if len(h) < HEADER_SIZE:
-                raise Exception('Expected to read a full header. This was only {} bytes'.format(len(h)))
-        if h == bytes([0])*HEADER_SIZE:
+        m = self._get_mmap()
+        h = m[delta * HEADER_SIZE:(delta + 1) * HEADER_SIZE] if m is not None else b''
+        if len(h) < HEADER_SIZE:
+            raise Exception('Expected to read a full header. This was only {} bytes'.format(len(h)))
+        if h == bytes(HEADER_SIZE):
+            return None
+        return h
+
+    def read_header(self, height: int) -> Optional[BlockHeader]:
+        h = self.read_raw_header(height)
+        if h is None:
             return None
-        return deserialize_header(h, height)
+        return BlockHeader(h, height)
 
-    def header_at_tip(self) -> Optional[dict]:
+    def header_at_tip(self) -> Optional[BlockHeader]:
         """Return latest header."""
         height = self.height()
         return self.read_header(height)
@@ -507,11 +721,21 @@ class Blockchain(Logger):
             index = height // 2016
             h, t = self.checkpoints[index]
             return h
-        else:
-            header = self.read_header(height)
-            if header is None:
+        elif height < self.forkpoint:
+            return self.parent.get_hash(height)
+        with self.lock:
+            header_hash = self._hash_cache.get(height)
+            if header_hash is not None:
+                return header_hash
+            raw_header = self.read_raw_header(height)
+            if raw_header is None:
                 raise MissingHeader(height)
-            return hash_header(header)
+            header_hash = hash_encode(sha256d(raw_header))
+            if len(self._hash_cache) >= HASH_CACHE_SIZE:
+                # evict oldest entry
+                self._hash_cache.pop(next(iter(self._hash_cache)))
+            self._hash_cache[height] = header_hash
+            return header_hash
 
     def get_target(self, index: int) -> int:
         # compute target from chunk x, used in chunk x+1
@@ -522,6 +746,19 @@ class Blockchain(Logger):
         if index < len(self.checkpoints):
             h, t = self.checkpoints[index]
             return t
+        if index * 2016 + 2015 < self.forkpoint:
+            return self.parent.get_target(index)
+        if index * 2016 < self.forkpoint:
+            # window straddles our forkpoint; not cached as it depends on our parent's headers
+            return self._compute_target(index)
+        with self.lock:
+            target = self._target_cache.get(index)
+            if target is None:
+                target = self._compute_target(index)
+                self._target_cache[index] = target
+            return target
+
+    def _compute_target(self, index: int) -> int:
         # new target
         first = self.read_header(index * 2016)
         last = self.read_header(index * 2016 + 2015)
@@ -610,7 +847,93 @@ class Blockchain(Logger):
         work_in_last_partial_chunk = (height % 2016 + 1) * work_in_single_header
         return running_total + work_in_last_partial_chunk
 
-    def can_connect(self, header: dict, check_height: bool=True) -> bool:
+    def chainwork_index_path(self) -> str:
+        return self.path() + CHAINWORK_INDEX_SUFFIX
+
+    @with_lock
+    def delete_chainwork_index(self) -> None:
+        path = self.chainwork_index_path()
+        if os.path.exists(path):
+            os.unlink(path)
+
+    @with_lock
+    def load_chainwork_index(self) -> None:
+        """Populates the chainwork and target caches from our index file,
+        so that they need not be recomputed from headers after a restart.
+        Records that do not match our headers are discarded.
+        """
+        if constants.net.TESTNET:
+            return
+        path = self.chainwork_index_path()
+        if not os.path.exists(path):
+            return
+        with open(path, 'rb') as f:
+            data = f.read()
+        num_records = len(data) // CHAINWORK_INDEX_RECORD_SIZE
+        num_valid = 0
+        for index in range(num_records):
+            height = index * 2016 + 2015
+            if height < self.forkpoint:
+                num_valid += 1
+                continue
+            record = data[index * CHAINWORK_INDEX_RECORD_SIZE:(index + 1) * CHAINWORK_INDEX_RECORD_SIZE]
+            block_hash = hash_encode(record[0:32])
+            if not self.check_hash(height, block_hash):
+                break
+            if index * 2016 >= self.forkpoint:
+                self._target_cache[index] = int.from_bytes(record[32:64], byteorder='big')
+            _CHAINWORK_CACHE[block_hash] = int.from_bytes(record[64:96], byteorder='big')
+            num_valid += 1
+        if num_valid < num_records or len(data) % CHAINWORK_INDEX_RECORD_SIZE:
+            self.logger.info(f"discarding {num_records - num_valid} invalid records of chainwork index")
+            with open(path, 'rb+') as f:
+                f.truncate(num_valid * CHAINWORK_INDEX_RECORD_SIZE)
+
+    @with_lock
+    def _truncate_chainwork_index(self, *, from_height: int) -> None:
+        """Drops the records of chunks that end at or after from_height."""
+        path = self.chainwork_index_path()
+        if not os.path.exists(path):
+            return
+        num_keep = max(0, from_height) // 2016
+        if os.path.getsize(path) > num_keep * CHAINWORK_INDEX_RECORD_SIZE:
+            with open(path, 'rb+') as f:
+                f.truncate(num_keep * CHAINWORK_INDEX_RECORD_SIZE)
+
+    @with_lock
+    def update_chainwork_index(self) -> None:
+        """Appends records for the chunks completed since the last update."""
+        if constants.net.TESTNET:
+            return
+        path = self.chainwork_index_path()
+        num_records = os.path.getsize(path) // CHAINWORK_INDEX_RECORD_SIZE if os.path.exists(path) else 0
+        last_index = (self.height() + 1) // 2016 - 1
+        if num_records > last_index:
+            return
+        first_index = self.forkpoint // 2016  # first chunk that ends in our branch
+        records = []
+        for index in range(num_records, last_index + 1):
+            if index < first_index:
+                records.append(bytes(CHAINWORK_INDEX_RECORD_SIZE))
+                continue
+            height = index * 2016 + 2015
+            try:
+                block_hash = self.get_hash(height)
+                target = self.get_target(index)
+                chainwork = self.get_chainwork(height)
+            except MissingHeader:
+                break
+            records.append(bfh(block_hash)[::-1]
+                           + target.to_bytes(32, byteorder='big')
+                           + chainwork.to_bytes(32, byteorder='big'))
+        if not records:
+            return
+        with open(path, 'rb+' if os.path.exists(path) else 'wb') as f:
+            f.seek(num_records * CHAINWORK_INDEX_RECORD_SIZE)
+            f.truncate()
+            f.write(b''.join(records))
+
+    def can_connect(self, header: Union[dict, BlockHeader], check_height: bool=True) -> bool:
         if header is None:
             return False
         height = header['block_height']
@@ -634,11 +957,11 @@ class Blockchain(Logger):
             return False
         return True
 
-    def connect_chunk(self, idx: int, hexdata: str) -> bool:
+    def connect_chunk(self, idx: int, hexdata: str, *, header_hashes: Sequence[bytes] = None) -> bool:
         assert idx >= 0, idx
         try:
             data = bfh(hexdata)
-            self.verify_chunk(idx, data)
+            self.verify_chunk(idx, data, header_hashes=header_hashes)
             self.save_chunk(idx, data)
             return True
         except BaseException as e:
@@ -656,9 +979,9 @@ class Blockchain(Logger):
         return cp
 
 
-def check_header(header: dict) -> Optional[Blockchain]:
+def check_header(header: Union[dict, BlockHeader]) -> Optional[Blockchain]:
     """Returns any Blockchain that contains header, or None."""
-    if type(header) is not dict:
+    if type(header) is not dict and not isinstance(header, BlockHeader):
         return None
     with blockchains_lock: chains = list(blockchains.values())
     for b in chains:
@@ -667,7 +990,7 @@ def check_header(header: dict) -> Optional[Blockchain]:
     return None
 
 
-def can_connect(header: dict) -> Optional[Blockchain]:
+def can_connect(header: Union[dict, BlockHeader]) -> Optional[Blockchain]:
     """Returns the Blockchain that has a tip that directly links up
     with header, or None.
     """
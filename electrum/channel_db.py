@@ -34,13 +34,17 @@ import asyncio
 import threading
 from enum import IntEnum
 import functools
+import hashlib
+import struct
+import concurrent.futures
+import multiprocessing
 
 from aiorpcx import NetAddress
 
 from .sql_db import SqlDB, sql
 from . import constants, util
 from .util import profiler, get_headers_dir, is_ip_address, json_normalize, UserFacingException
-from .logging import Logger
+from .logging import Logger, get_logger
 from .lnutil import (LNPeerAddr, format_short_channel_id, ShortChannelID,
                      validate_features, IncompatibleOrInsaneFeatures, InvalidGossipMsg)
 from .lnverifier import LNChannelVerifier, verify_sig_for_channel_update
@@ -59,6 +63,43 @@ if TYPE_CHECKING:
 FLAG_DISABLE   = 1 << 1
 FLAG_DIRECTION = 1 << 0
 
+# gossip signatures are sent to worker processes in batches of this size
+GOSSIP_VERIFY_BATCH_SIZE = 500
+
+_logger = get_logger(__name__)
+_gossip_verify_executor = None  # type: Optional[concurrent.futures.Executor]
+
+
+def verify_gossip_signatures(items: Sequence[Tuple[bytes, Sequence[Tuple[bytes, bytes]]]]) -> List[bool]:
+    """For each (signed_data, [(pubkey, sig), ...]) in items, returns
+    whether all sigs are valid for sha256d(signed_data).
+    This is run in worker processes, see get_gossip_verify_executor.
+    """
+    results = []
+    for signed_data, sigs in items:
+        h = sha256d(signed_data)
+        results.append(all(ecc.verify_signature(pubkey, sig, h) for pubkey, sig in sigs))
+    return results
+
+
+def get_gossip_verify_executor(num_processes: int) -> Optional[concurrent.futures.Executor]:
+    """Returns a process pool that can run verify_gossip_signatures, or None if
+    num_processes is not positive or the platform does not support it.
+    """
+    global _gossip_verify_executor
+    if num_processes <= 0:
+        return None
+    if _gossip_verify_executor is None:
+        try:
+            _gossip_verify_executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=num_processes,
+                mp_context=multiprocessing.get_context('spawn'))
+        except (ImportError, NotImplementedError, OSError) as e:
+            # e.g. Android does not have working multiprocessing semaphores
+            _logger.warning(f"cannot create process pool for gossip verification: {repr(e)}")
+            return None
+    return _gossip_verify_executor
+
 
 class ChannelDBNotLoaded(UserFacingException): pass
 
@@ -231,6 +272,132 @@ class NodeInfo(NamedTuple):
         return addresses
 
 
+class GossipSnapshot:
+    """Decoded rows of the channel_info, policy and node_info tables.
+
+    Decoding every stored message in load_data is slow, so the decoded rows
+    are also saved to a file, as fixed-width records (node records are
+    followed by their features and alias). Each record holds a fingerprint
+    of the raw message it was decoded from: rows whose message changed since
+    the snapshot was written get decoded again.
+    """
+    MAGIC = b'ELGOSSIP'
+    VERSION = 1
+
+    # magic, version, chain hash, number of channels, policies, nodes
+    _HEADER = struct.Struct('>8sH32sIII')
+    # scid, fingerprint, node1_id, node2_id
+    _CHANNEL = struct.Struct('>8s16s33s33s')
+    # key, fingerprint, cltv_delta, htlc_minimum_msat, has_htlc_maximum_msat, htlc_maximum_msat,
+    # fee_base_msat, fee_proportional_millionths, channel_flags, message_flags, timestamp
+    _POLICY = struct.Struct('>41s16sHQ?QIIBBI')
+    # node_id, fingerprint, timestamp, len(features), len(alias)
+    _NODE = struct.Struct('>33s16sIHB')
+
+    def __init__(self):
+        self.channels = {}  # type: Dict[bytes, Tuple[bytes, ChannelInfo]]  # scid -> (fingerprint, ChannelInfo)
+        self.policies = {}  # type: Dict[bytes, Tuple[bytes, Policy]]  # key -> (fingerprint, Policy)
+        self.nodes = {}  # type: Dict[bytes, Tuple[bytes, NodeInfo]]  # node_id -> (fingerprint, NodeInfo)
+
+    @staticmethod
+    def fingerprint(raw_msg: bytes) -> bytes:
+        return hashlib.sha256(raw_msg).digest()[:16]
+
+    def serialize(self) -> bytes:
+        parts = [self._HEADER.pack(
+            self.MAGIC, self.VERSION, constants.net.rev_genesis_bytes(),
+            len(self.channels), len(self.policies), len(self.nodes))]
+        for scid, (fp, ci) in self.channels.items():
+            parts.append(self._CHANNEL.pack(scid, fp, ci.node1_id, ci.node2_id))
+        for key, (fp, p) in self.policies.items():
+            has_htlc_maximum_msat = p.htlc_maximum_msat is not None
+            parts.append(self._POLICY.pack(
+                key, fp, p.cltv_delta, p.htlc_minimum_msat,
+                has_htlc_maximum_msat, p.htlc_maximum_msat if has_htlc_maximum_msat else 0,
+                p.fee_base_msat, p.fee_proportional_millionths,
+                p.channel_flags, p.message_flags, p.timestamp))
+        for node_id, (fp, n) in self.nodes.items():
+            features = n.features.to_bytes((n.features.bit_length() + 7) // 8, 'big')
+            alias = n.alias.encode('utf8')
+            parts.append(self._NODE.pack(node_id, fp, n.timestamp, len(features), len(alias)))
+            parts.append(features)
+            parts.append(alias)
+        return b''.join(parts)
+
+    @classmethod
+    def deserialize(cls, data: bytes) -> Optional['GossipSnapshot']:
+        """Returns None if the snapshot was written by another version,
+        or for another chain. Raises struct.error if data is truncated.
+        """
+        magic, version, chain_hash, num_channels, num_policies, num_nodes = cls._HEADER.unpack_from(data, 0)
+        if magic != cls.MAGIC or version != cls.VERSION or chain_hash != constants.net.rev_genesis_bytes():
+            return None
+        snapshot = GossipSnapshot()
+        offset = cls._HEADER.size
+        for scid, fp, node1_id, node2_id in cls._CHANNEL.iter_unpack(
+                data[offset:offset + num_channels * cls._CHANNEL.size]):
+            snapshot.channels[scid] = fp, ChannelInfo(
+                short_channel_id=ShortChannelID(scid),
+                node1_id=node1_id,
+                node2_id=node2_id,
+                capacity_sat=None)
+        offset += num_channels * cls._CHANNEL.size
+        for (key, fp, cltv_delta, htlc_minimum_msat, has_htlc_maximum_msat, htlc_maximum_msat,
+             fee_base_msat, fee_proportional_millionths, channel_flags, message_flags, timestamp) \
+                in cls._POLICY.iter_unpack(data[offset:offset + num_policies * cls._POLICY.size]):
+            snapshot.policies[key] = fp, Policy(
+                key=key,
+                cltv_delta=cltv_delta,
+                htlc_minimum_msat=htlc_minimum_msat,
+                htlc_maximum_msat=htlc_maximum_msat if has_htlc_maximum_msat else None,
+                fee_base_msat=fee_base_msat,
+                fee_proportional_millionths=fee_proportional_millionths,
+                channel_flags=channel_flags,
+                message_flags=message_flags,
+                timestamp=timestamp)
+        offset += num_policies * cls._POLICY.size
+        for _ in range(num_nodes):
+            node_id, fp, timestamp, features_len, alias_len = cls._NODE.unpack_from(data, offset)
+            offset += cls._NODE.size
+            features = int.from_bytes(data[offset:offset + features_len], 'big')
+            offset += features_len
+            alias = data[offset:offset + alias_len].decode('utf8')
+            offset += alias_len
+            snapshot.nodes[node_id] = fp, NodeInfo(
+                node_id=node_id, features=features, timestamp=timestamp, alias=alias)
+        if offset != len(data):
+            raise struct.error('unexpected snapshot size')
+        return snapshot
+
+    @classmethod
+    def read(cls, path: str) -> Optional['GossipSnapshot']:
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return cls.deserialize(f.read())
+        except (OSError, struct.error, UnicodeDecodeError) as e:
+            _logger.warning(f"cannot read gossip snapshot: {repr(e)}")
+            return None
+
+    def write(self, path: str) -> None:
+        tmp_path = path + '.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(self.serialize())
+            os.replace(tmp_path, path)
+        except OSError as e:
+            _logger.warning(f"cannot write gossip snapshot: {repr(e)}")
+
+
+class GraphEdge(NamedTuple):
+    short_channel_id: ShortChannelID
+    start_node: bytes
+    channel_info: ChannelInfo
+    policy: Optional[Policy]  # of start_node
+    policy_backwards: Optional[Policy]  # of the end node
+
+
 class UpdateStatus(IntEnum):
     ORPHANED   = 0
     EXPIRED    = 1
@@ -339,6 +506,9 @@ class ChannelDB(SqlDB):
         self._chans_with_0_policies = set()  # type: Set[ShortChannelID]
         self._chans_with_1_policies = set()  # type: Set[ShortChannelID]
         self._chans_with_2_policies = set()  # type: Set[ShortChannelID]
+        # node_id -> edges towards node_id, see get_graph_edges_for_node.
+        # built lazily, entries are removed when a channel or policy of the node changes
+        self._graph_edges_for_node = {}  # type: Dict[bytes, Tuple[GraphEdge, ...]]
 
         self.data_loaded = asyncio.Event()
         self.network = network # only for callback
@@ -347,6 +517,9 @@ class ChannelDB(SqlDB):
     def get_file_path(cls, config: 'SimpleConfig') -> str:
         return os.path.join(get_headers_dir(config), 'gossip_db')
 
+    def get_snapshot_path(self) -> str:
+        return self.path + '_snapshot'
+
     def update_counts(self):
         self.num_nodes = len(self._nodes)
         self.num_channels = len(self._channels)
@@ -473,8 +646,10 @@ class ChannelDB(SqlDB):
             self.logger.info(f'policy unchanged: {old_policy.timestamp} -> {new_policy.timestamp}')
         return changed
 
-    def add_channel_update(
-            self, payload, *, max_age=None, verify=True, verbose=True) -> UpdateStatus:
+    def _check_channel_update(self, payload, *, max_age=None) -> Optional[UpdateStatus]:
+        """Returns the status of an update that is not going to be added, or None.
+        Sets payload['start_node'] if the channel is known.
+        """
         now = int(time.time())
         short_channel_id = ShortChannelID(payload['short_channel_id'])
         timestamp = payload['timestamp']
@@ -490,12 +665,26 @@ class ChannelDB(SqlDB):
         start_node = channel_info.node1_id if direction == 0 else channel_info.node2_id
         payload['start_node'] = start_node
         # compare updates to existing database entries
-        short_channel_id = ShortChannelID(payload['short_channel_id'])
         key = (start_node, short_channel_id)
         old_policy = self._policies.get(key)
         if old_policy and timestamp <= old_policy.timestamp + 60:
             return UpdateStatus.DEPRECATED
-        if verify:
+        return None
+
+    def add_channel_update(
+            self, payload, *, max_age=None, verify=True, verbose=True,
+            verified_sigs: Set[Tuple[bytes, bytes]] = frozenset()) -> UpdateStatus:
+        """verified_sigs: (raw msg, start_node) of updates whose signature
+        has already been verified, see get_channel_updates_to_verify.
+        """
+        status = self._check_channel_update(payload, max_age=max_age)
+        if status is not None:
+            return status
+        start_node = payload['start_node']
+        short_channel_id = ShortChannelID(payload['short_channel_id'])
+        key = (start_node, short_channel_id)
+        old_policy = self._policies.get(key)
+        if verify and (payload.get('raw'), start_node) not in verified_sigs:
             self.verify_channel_update(payload)
         policy = Policy.from_msg(payload)
         with self.lock:
@@ -508,14 +697,30 @@ class ChannelDB(SqlDB):
         else:
             return UpdateStatus.GOOD
 
-    def add_channel_updates(self, payloads, max_age=None) -> CategorizedChannelUpdates:
+    def get_channel_updates_to_verify(self, payloads, max_age=None) -> Sequence[dict]:
+        """Returns the payloads whose signature add_channel_updates would verify.
+        Their signatures can then be verified out of the lock, in batch.
+        """
+        to_verify = []
+        for payload in payloads:
+            if self._check_channel_update(payload, max_age=max_age) is not None:
+                continue
+            if constants.net.rev_genesis_bytes() != payload['chain_hash']:
+                raise InvalidGossipMsg('wrong chain hash')
+            to_verify.append(payload)
+        return to_verify
+
+    def add_channel_updates(
+            self, payloads, max_age=None, *,
+            verified_sigs: Set[Tuple[bytes, bytes]] = frozenset()) -> CategorizedChannelUpdates:
         orphaned = []
         expired = []
         deprecated = []
         unchanged = []
         good = []
         for payload in payloads:
-            r = self.add_channel_update(payload, max_age=max_age, verbose=False, verify=True)
+            r = self.add_channel_update(
+                payload, max_age=max_age, verbose=False, verify=True, verified_sigs=verified_sigs)
             if r == UpdateStatus.ORPHANED:
                 orphaned.append(payload)
             elif r == UpdateStatus.EXPIRED:
@@ -600,21 +805,31 @@ class ChannelDB(SqlDB):
 
     @classmethod
     def verify_channel_announcement(cls, payload) -> None:
-        h = sha256d(payload['raw'][2+256:])
-        pubkeys = [payload['node_id_1'], payload['node_id_2'], payload['bitcoin_key_1'], payload['bitcoin_key_2']]
-        sigs = [payload['node_signature_1'], payload['node_signature_2'], payload['bitcoin_signature_1'], payload['bitcoin_signature_2']]
-        for pubkey, sig in zip(pubkeys, sigs):
-            if not ecc.verify_signature(pubkey, sig, h):
-                raise InvalidGossipMsg('signature failed')
+        if not verify_gossip_signatures([cls.get_signatures_of_channel_announcement(payload)])[0]:
+            raise InvalidGossipMsg('signature failed')
 
     @classmethod
     def verify_node_announcement(cls, payload) -> None:
-        pubkey = payload['node_id']
-        signature = payload['signature']
-        h = sha256d(payload['raw'][66:])
-        if not ecc.verify_signature(pubkey, signature, h):
+        if not verify_gossip_signatures([cls.get_signatures_of_node_announcement(payload)])[0]:
             raise InvalidGossipMsg('signature failed')
 
+    # The following return (signed_data, [(pubkey, sig), ...]) for verify_gossip_signatures
+
+    @classmethod
+    def get_signatures_of_channel_announcement(cls, payload) -> Tuple[bytes, List[Tuple[bytes, bytes]]]:
+        pubkeys = [payload['node_id_1'], payload['node_id_2'], payload['bitcoin_key_1'], payload['bitcoin_key_2']]
+        sigs = [payload['node_signature_1'], payload['node_signature_2'], payload['bitcoin_signature_1'], payload['bitcoin_signature_2']]
+        return payload['raw'][2+256:], list(zip(pubkeys, sigs))
+
+    @classmethod
+    def get_signatures_of_node_announcement(cls, payload) -> Tuple[bytes, List[Tuple[bytes, bytes]]]:
+        return payload['raw'][66:], [(payload['node_id'], payload['signature'])]
+
+    @classmethod
+    def get_signatures_of_channel_update(cls, payload) -> Tuple[bytes, List[Tuple[bytes, bytes]]]:
+        # note: payload['start_node'] is set by get_channel_updates_to_verify
+        return payload['raw'][2+64:], [(payload['start_node'], payload['signature'])]
+
     def add_node_announcements(self, msg_payloads):
         # note: signatures have already been verified.
         if type(msg_payloads) is dict:
@@ -726,6 +941,8 @@ class ChannelDB(SqlDB):
             if channel_info:
                 self._channels_for_node[channel_info.node1_id].remove(channel_info.short_channel_id)
                 self._channels_for_node[channel_info.node2_id].remove(channel_info.short_channel_id)
+                self._graph_edges_for_node.pop(channel_info.node1_id, None)
+                self._graph_edges_for_node.pop(channel_info.node2_id, None)
         self._update_num_policies_for_chan(short_channel_id)
         # delete from database
         self._db_delete_channel(short_channel_id)
@@ -753,7 +970,8 @@ class ChannelDB(SqlDB):
     def load_data(self):
         if self.data_loaded.is_set():
             return
-        # Note: this method takes several seconds... mostly due to lnmsg.decode_msg being slow.
+        # Note: lnmsg.decode_msg is slow, so decoded rows are taken from the
+        #       snapshot written by the previous call, if their message is unchanged.
         def maybe_abort():
             if self.stopping:
                 self.logger.info("load_data() was asked to stop. exiting early.")
@@ -775,34 +993,58 @@ class ChannelDB(SqlDB):
             return newest_ts
         sorted_node_ids = sorted(self._addresses.keys(), key=newest_ts_for_node_id, reverse=True)
         self._recent_peers = sorted_node_ids[:self.NUM_MAX_RECENT_PEERS]
+        snapshot = GossipSnapshot.read(self.get_snapshot_path()) or GossipSnapshot()
+        new_snapshot = GossipSnapshot()
+        num_decoded = 0
         c.execute("""SELECT * FROM channel_info""")
         for short_channel_id, msg in c:
             maybe_abort()
-            try:
-                ci = ChannelInfo.from_raw_msg(msg)
-            except IncompatibleOrInsaneFeatures:
-                continue
-            except FailedToParseMsg:
-                continue
-            self._channels[ShortChannelID.normalize(short_channel_id)] = ci
+            fp = GossipSnapshot.fingerprint(msg)
+            cached = snapshot.channels.get(short_channel_id)
+            if cached and cached[0] == fp:
+                ci = cached[1]
+            else:
+                try:
+                    ci = ChannelInfo.from_raw_msg(msg)
+                except IncompatibleOrInsaneFeatures:
+                    continue
+                except FailedToParseMsg:
+                    continue
+                num_decoded += 1
+            new_snapshot.channels[short_channel_id] = fp, ci
+            self._channels[ci.short_channel_id] = ci
         c.execute("""SELECT * FROM node_info""")
         for node_id, msg in c:
             maybe_abort()
-            try:
-                node_info, node_addresses = NodeInfo.from_raw_msg(msg)
-            except IncompatibleOrInsaneFeatures:
-                continue
-            except FailedToParseMsg:
-                continue
+            fp = GossipSnapshot.fingerprint(msg)
+            cached = snapshot.nodes.get(node_id)
+            if cached and cached[0] == fp:
+                node_info = cached[1]
+            else:
+                try:
+                    node_info, node_addresses = NodeInfo.from_raw_msg(msg)
+                except IncompatibleOrInsaneFeatures:
+                    continue
+                except FailedToParseMsg:
+                    continue
+                num_decoded += 1
             # don't load node_addresses because they dont have timestamps
+            new_snapshot.nodes[node_id] = fp, node_info
             self._nodes[node_id] = node_info
         c.execute("""SELECT * FROM policy""")
         for key, msg in c:
             maybe_abort()
-            try:
-                p = Policy.from_raw_msg(key, msg)
-            except FailedToParseMsg:
-                continue
+            fp = GossipSnapshot.fingerprint(msg)
+            cached = snapshot.policies.get(key)
+            if cached and cached[0] == fp:
+                p = cached[1]
+            else:
+                try:
+                    p = Policy.from_raw_msg(key, msg)
+                except FailedToParseMsg:
+                    continue
+                num_decoded += 1
+            new_snapshot.policies[key] = fp, p
             self._policies[(p.start_node, p.short_channel_id)] = p
         for channel_info in self._channels.values():
             self._channels_for_node[channel_info.node1_id].add(channel_info.short_channel_id)
@@ -816,6 +1058,11 @@ class ChannelDB(SqlDB):
                          f'0p: {nchans_with_0p}, 1p: {nchans_with_1p}, 2p: {nchans_with_2p}')
         self.asyncio_loop.call_soon_threadsafe(self.data_loaded.set)
         util.trigger_callback('gossip_db_loaded')
+        num_cached = len(new_snapshot.channels) + len(new_snapshot.policies) + len(new_snapshot.nodes) - num_decoded
+        self.logger.info(f'{num_cached} rows loaded from snapshot, {num_decoded} decoded')
+        # rows that were removed from the db also make the snapshot stale
+        if num_decoded or num_cached != len(snapshot.channels) + len(snapshot.policies) + len(snapshot.nodes):
+            new_snapshot.write(self.get_snapshot_path())
 
     def _update_num_policies_for_chan(self, short_channel_id: ShortChannelID) -> None:
         channel_info = self.get_channel_info(short_channel_id)
@@ -828,6 +1075,8 @@ class ChannelDB(SqlDB):
         p1 = self.get_policy_for_node(short_channel_id, channel_info.node1_id)
         p2 = self.get_policy_for_node(short_channel_id, channel_info.node2_id)
         with self.lock:
+            self._graph_edges_for_node.pop(channel_info.node1_id, None)
+            self._graph_edges_for_node.pop(channel_info.node2_id, None)
             self._chans_with_0_policies.discard(short_channel_id)
             self._chans_with_1_policies.discard(short_channel_id)
             self._chans_with_2_policies.discard(short_channel_id)
@@ -914,6 +1163,33 @@ class ChannelDB(SqlDB):
                     relevant_channels.add(route_edge.short_channel_id)
         return relevant_channels
 
+    def get_graph_edges_for_node(self, node_id: bytes) -> Tuple['GraphEdge', ...]:
+        """Returns the publicly announced channels of node_id, as edges
+        towards node_id, i.e. edge.start_node is the other participant.
+        Unlike get_channels_for_node, this does not include private channels.
+        """
+        edges = self._graph_edges_for_node.get(node_id)
+        if edges is not None:
+            return edges
+        if not self.data_loaded.is_set():
+            raise ChannelDBNotLoaded("channelDB data not loaded yet!")
+        with self.lock:
+            edges = []
+            for short_channel_id in self._channels_for_node.get(node_id, ()):
+                channel_info = self._channels.get(short_channel_id)
+                if channel_info is None:
+                    continue
+                start_node = channel_info.node2_id if channel_info.node1_id == node_id else channel_info.node1_id
+                edges.append(GraphEdge(
+                    short_channel_id=short_channel_id,
+                    start_node=start_node,
+                    channel_info=channel_info,
+                    policy=self._policies.get((start_node, short_channel_id)),
+                    policy_backwards=self._policies.get((node_id, short_channel_id))))
+            edges = tuple(edges)
+            self._graph_edges_for_node[node_id] = edges
+        return edges
+
     def get_endnodes_for_chan(self, short_channel_id: ShortChannelID, *,
                               my_channels: Dict[ShortChannelID, 'Channel'] = None) -> Optional[Tuple[bytes, bytes]]:
         channel_info = self.get_channel_info(short_channel_id)
@@ -775,12 +775,13 @@ class Commands:
 
     @command('w')
     async def onchain_history(self, year=None, show_addresses=False, show_fiat=False, wallet: Abstract_Wallet = None,
-                              from_height=None, to_height=None):
+                              from_height=None, to_height=None, cost_basis=None):
         """Wallet onchain history. Returns the transaction history of your wallet."""
         kwargs = {
             'show_addresses': show_addresses,
             'from_height': from_height,
             'to_height': to_height,
+            'cost_basis': cost_basis,
         }
         if year:
             import time
@@ -986,6 +987,15 @@ class Commands:
             raise Exception("This wallet is not deterministic.")
         return wallet.change_gap_limit(new_limit)
 
+    @command('w')
+    async def setwalletdbengine(self, engine, wallet: Abstract_Wallet = None):
+        """Set where the transaction history of the wallet is stored: 'json' (in the
+        wallet file) or 'sqlite' (in a separate, unencrypted file next to it).
+        Existing data is migrated."""
+        wallet.db.set_storage_engine(engine)
+        wallet.save_db()
+        return True
+
     @command('wn')
     async def getminacceptablegap(self, wallet: Abstract_Wallet = None):
         """Returns the minimum value for gap limit that would be sufficient to discover all
@@ -1408,6 +1418,7 @@ param_descriptions = {
     'pubkey': 'Public key',
     'message': 'Clear text message. Use quotes if it contains spaces.',
     'encrypted': 'Encrypted message',
+    'engine': 'Wallet storage engine: json or sqlite',
     'amount': 'Amount to be sent (in BTC). Type \'!\' to send the maximum available.',
     'outputs': 'list of ["address", amount]',
     'redeem_script': 'redeem script (hexadecimal)',
@@ -1459,6 +1470,7 @@ command_options = {
     'year':        (None, "Show history for a given year"),
     'from_height': (None, "Only show transactions that confirmed after given block height"),
     'to_height':   (None, "Only show transactions that confirmed before given block height"),
+    'cost_basis':  (None, "How the acquisition price of spent coins is computed: 'average' or 'fifo'"),
     'iknowwhatimdoing': (None, "Acknowledge that I understand the full implications of what I am about to do"),
     'gossip':      (None, "Apply command to gossip node instead of wallet"),
     'connection_string':      (None, "Lightning network node ID or network address"),
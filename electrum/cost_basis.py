@@ -0,0 +1,170 @@
+import bisect
+import time
+from collections import deque
+from decimal import Decimal
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple
+
+from .bitcoin import COIN
+
+if TYPE_CHECKING:
+    from .exchange_rate import FxThread
+    from .transaction import PartialTxInput
+    from .wallet import Abstract_Wallet
+
+
+# acquisition price of a coin is the (weighted) average of the coins spent by the tx that created it
+COST_BASIS_AVERAGE = 'average'
+# acquisition price of spent coins is the price of the oldest coins of the wallet
+COST_BASIS_FIFO = 'fifo'
+COST_BASIS_METHODS = (COST_BASIS_AVERAGE, COST_BASIS_FIFO)
+
+
+class CostBasis:
+    """Acquisition prices of the coins of a wallet, in the currency of fx.
+
+    Prices are computed for the whole on-chain history at once: historical
+    rates are looked up once per day, and the tx graph is walked
+    iteratively, parents first, so that each tx is priced only once.
+    """
+
+    def __init__(self, wallet: 'Abstract_Wallet', fx: 'FxThread', *, method: str = COST_BASIS_AVERAGE):
+        if method not in COST_BASIS_METHODS:
+            raise ValueError(f"unknown cost basis method: {method!r}")
+        self.wallet = wallet
+        self.db = wallet.db
+        self.fx = fx
+        self.ccy = fx.ccy
+        self.method = method
+        self._history = list(wallet.get_onchain_history())
+        # the rates of unconfirmed txs are the ones of the time we were created at
+        now = time.time()
+        self._timestamps = {item['txid']: item['timestamp'] or now for item in self._history}
+        self._rates = fx.timestamp_rates(self._timestamps.values())  # type: Dict[float, Decimal]
+        self._average_prices = {}  # type: Dict[str, Decimal]
+        self._fifo_prices = {}  # type: Dict[str, Decimal]
+        self._fifo_heights = []  # type: List[int]
+        self._fifo_holdings = []  # type: List[Decimal]
+        if method == COST_BASIS_FIFO:
+            self._run_fifo()
+
+    def get_rate(self, txid: str) -> Decimal:
+        """Returns fiat price of bitcoin at the time tx got confirmed."""
+        timestamp = self._timestamps.get(txid)
+        if timestamp is None:
+            # not in our history, e.g. a parent tx
+            timestamp = self.wallet.adb.get_tx_height(txid).timestamp or time.time()
+            self._timestamps[txid] = timestamp
+        rate = self._rates.get(timestamp)
+        if rate is None:
+            rate = self._rates[timestamp] = self.fx.timestamp_rate(timestamp)
+        return rate
+
+    def _get_inputs(self, txid: str) -> List[Tuple[str, Optional[int]]]:
+        """Returns (prev_txid, value) of the ismine inputs of a tx."""
+        inputs = []
+        for addr in self.db.get_txi_addresses(txid):
+            for ser, v in self.db.get_txi_addr(txid, addr):
+                inputs.append((ser.split(':')[0], v))
+        return inputs
+
+    def _compute_average_price(self, txid: str) -> Decimal:
+        # depth-first walk over the ancestors of txid that are not priced yet.
+        # this is iterative, as chains of txs can be longer than the recursion limit
+        stack = [txid]
+        while stack:
+            tx_hash = stack[-1]
+            if tx_hash in self._average_prices:
+                stack.pop()
+                continue
+            inputs = self._get_inputs(tx_hash)
+            missing = [prev_txid for prev_txid, v in inputs
+                       if v is not None and prev_txid not in self._average_prices
+                       and self.db.get_txi_addresses(prev_txid)]
+            if missing:
+                stack.extend(missing)
+                continue
+            stack.pop()
+            if not inputs:
+                self._average_prices[tx_hash] = Decimal('NaN')
+                continue
+            input_value = 0
+            total_price = 0
+            for prev_txid, v in inputs:
+                input_value += v
+                total_price += self.coin_price(prev_txid, v)
+            self._average_prices[tx_hash] = total_price / (input_value/Decimal(COIN))
+        return self._average_prices[txid]
+
+    def average_price(self, txid: str) -> Decimal:
+        """Average acquisition price of the inputs of a transaction."""
+        price = self._average_prices.get(txid)
+        if price is None:
+            price = self._compute_average_price(txid)
+        return price
+
+    def coin_price(self, txid: str, txin_value: Optional[int]) -> Decimal:
+        """
+        Acquisition price of a coin created by txid.
+        This assumes that either all inputs are mine, or no input is mine.
+        """
+        if txin_value is None:
+            return Decimal('NaN')
+        if self.db.get_txi_addresses(txid):
+            return self.average_price(txid) * txin_value/Decimal(COIN)
+        fiat_value = self.wallet.get_fiat_value(txid, self.ccy)
+        if fiat_value is not None:
+            return fiat_value
+        return self.get_rate(txid) * txin_value/Decimal(COIN)
+
+    def _run_fifo(self) -> None:
+        lots = deque()  # [value, cost] of the coins we hold, oldest first
+        holdings = Decimal(0)
+        for item in self._history:
+            txid = item['txid']
+            value = item['bc_value'].value
+            if value > 0:
+                fiat_value = self.wallet.get_fiat_value(txid, self.ccy)
+                cost = fiat_value if fiat_value is not None else self.get_rate(txid) * value/Decimal(COIN)
+                lots.append([value, cost])
+                holdings += cost
+            elif value < 0:
+                to_spend = -value
+                price = Decimal(0)
+                while to_spend and lots:
+                    lot = lots[0]
+                    if lot[0] <= to_spend:
+                        lots.popleft()
+                        to_spend -= lot[0]
+                        price += lot[1]
+                    else:
+                        cost = lot[1] * to_spend / lot[0]
+                        lot[0] -= to_spend
+                        lot[1] -= cost
+                        price += cost
+                        to_spend = 0
+                holdings -= price
+                # more was spent than we knew of (e.g. txs out of order): no gain on the rest
+                price += self.get_rate(txid) * to_spend/Decimal(COIN)
+                self._fifo_prices[txid] = price
+            if item['height'] > 0:
+                self._fifo_heights.append(item['height'])
+                self._fifo_holdings.append(holdings)
+
+    def get_acquisition_price(self, txid: str, value: int) -> Decimal:
+        """Acquisition price of the coins of the wallet spent by a tx, worth value."""
+        if self.method == COST_BASIS_FIFO:
+            price = self._fifo_prices.get(txid)
+            if price is not None:
+                return price
+        return value / Decimal(COIN) * self.average_price(txid)
+
+    def get_holdings_acquisition_price(self, coins: Sequence['PartialTxInput'], height: Optional[int]) -> Decimal:
+        """Acquisition price of coins, the confirmed coins we held at height."""
+        if self.method == COST_BASIS_FIFO:
+            if height is None:
+                i = len(self._fifo_heights)
+            else:
+                i = bisect.bisect_right(self._fifo_heights, height)
+            return self._fifo_holdings[i - 1] if i > 0 else Decimal(0)
+        return Decimal(sum(self.coin_price(coin.prevout.txid.hex(), self.wallet.adb.get_txin_value(coin))
+                           for coin in coins))
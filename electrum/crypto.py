@@ -387,7 +387,7 @@ def chacha20_poly1305_decrypt(
     assert isinstance(key, (bytes, bytearray))
     assert isinstance(nonce, (bytes, bytearray))
     assert isinstance(associated_data, (bytes, bytearray, type(None)))
-    assert isinstance(data, (bytes, bytearray))
+    assert isinstance(data, (bytes, bytearray, memoryview))
     assert len(key) == 32, f"unexpected key size: {len(key)} (expected: 32)"
     assert len(nonce) == 12, f"unexpected nonce size: {len(nonce)} (expected: 12)"
     if HAS_CRYPTODOME:
@@ -8,7 +8,7 @@ import time
 import csv
 import decimal
 from decimal import Decimal
-from typing import Sequence, Optional, Mapping, Dict, Union, Any
+from typing import Sequence, Optional, Mapping, Dict, Union, Any, Iterable
 
 from aiorpcx.curio import timeout_after, TaskTimeout, ignore_after
 import aiohttp
@@ -491,5 +491,18 @@ class FxThread(ThreadJob, EventListener, NetworkRetryManager[str]):
         date = timestamp_to_datetime(timestamp)
         return self.history_rate(date)
 
+    def timestamp_rates(self, timestamps: Iterable[Optional[int]]) -> Dict[Optional[int], Decimal]:
+        """Like timestamp_rate, for many timestamps. Rates are looked up once per day."""
+        rates_by_day = {}
+        rates = {}
+        for timestamp in set(timestamps):
+            date = timestamp_to_datetime(timestamp)
+            day = date.date() if date is not None else None
+            rate = rates_by_day.get(day)
+            if rate is None:
+                rate = rates_by_day[day] = self.history_rate(date)
+            rates[timestamp] = rate
+        return rates
+
 
 assert globals().get(SimpleConfig.FX_EXCHANGE.get_default_value()), f"default exchange {SimpleConfig.FX_EXCHANGE.get_default_value()} does not exist"
@@ -25,7 +25,7 @@
 
 import enum
 from enum import IntEnum
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple
 
 from PyQt5.QtCore import Qt, QPersistentModelIndex, QModelIndex
 from PyQt5.QtGui import QStandardItemModel, QStandardItem, QFont
@@ -76,6 +76,46 @@ class AddressTypeFilter(IntEnum):
         }[self]
 
 
+class AddressModel(QStandardItemModel):
+    """Rows are created in pages, when the view needs them."""
+
+    PAGE_SIZE = 500
+
+    def __init__(self, address_list: 'AddressList'):
+        QStandardItemModel.__init__(self, address_list)
+        self.address_list = address_list
+        self._pending = []  # type: List[str]  # addresses that have no row yet
+
+    def set_pending(self, addresses: Sequence[str]) -> None:
+        self._pending = list(reversed(addresses))
+
+    def add_pending(self, addresses: Sequence[str]) -> None:
+        if not addresses:
+            return
+        had_pending = bool(self._pending)
+        self._pending[:0] = reversed(addresses)
+        if self.address_list.needs_all_rows():
+            self.fetch_all()
+        elif not had_pending:
+            # the view might not ask again
+            self.fetchMore(QModelIndex())
+
+    def canFetchMore(self, parent: QModelIndex) -> bool:
+        return not parent.isValid() and bool(self._pending)
+
+    def fetchMore(self, parent: QModelIndex) -> None:
+        if parent.isValid():
+            return
+        n = min(self.PAGE_SIZE, len(self._pending))
+        addresses = self._pending[len(self._pending)-n:]
+        del self._pending[len(self._pending)-n:]
+        self.address_list.add_rows(list(reversed(addresses)))
+
+    def fetch_all(self) -> None:
+        while self._pending:
+            self.fetchMore(QModelIndex())
+
+
 class AddressList(MyTreeView):
 
     class Columns(MyTreeView.BaseColumnsEnum):
@@ -111,12 +151,19 @@ class AddressList(MyTreeView):
         self.used_button.currentIndexChanged.connect(self.toggle_used)
         for addr_usage_state in AddressUsageStateFilter.__members__.values():  # type: AddressUsageStateFilter
             self.used_button.addItem(addr_usage_state.ui_text())
-        self.std_model = QStandardItemModel(self)
+        self.std_model = AddressModel(self)
+        self.shown_addresses = []  # type: List[str]  # all addresses that pass the filters
+        self.address_rows = {}  # type: Dict[str, int]  # address -> row, for rows that were created
+        self.row_states = {}  # type: Dict[str, tuple]  # address -> get_row_state, when the row was refreshed
+        self.addresses_beyond_gap_limit = set()
+        self._update_key = None
+        self._sorted_by_default = True  # by address index, on which the pages are based
         self.proxy = MySortModel(self, sort_role=self.ROLE_SORT_ORDER)
         self.proxy.setSourceModel(self.std_model)
         self.setModel(self.proxy)
         self.update()
         self.sortByColumn(self.Columns.TYPE, Qt.AscendingOrder)
+        self.header().sortIndicatorChanged.connect(self.on_sort_indicator_changed)
         if self.config:
             self.configvar_show_toolbar = self.config.cv.GUI_QT_ADDRESSES_TAB_SHOW_TOOLBAR
 
@@ -171,6 +218,38 @@ class AddressList(MyTreeView):
         self.show_used = AddressUsageStateFilter(state)
         self.update()
 
+    def get_address_state(self, address: str) -> Tuple[int, bool]:
+        """Returns (balance, is_used) of address."""
+        is_used = self.wallet.adb.is_used(address)
+        # an address without history has no coins
+        balance = sum(self.wallet.get_addr_balance(address)) if is_used else 0
+        return balance, is_used
+
+    def should_show_address(self, address: str) -> bool:
+        if self.show_used == AddressUsageStateFilter.ALL:
+            return True
+        balance, is_used = self.get_address_state(address)
+        is_used_and_empty = is_used and balance == 0
+        if self.show_used == AddressUsageStateFilter.UNUSED and (balance or is_used_and_empty):
+            return False
+        if self.show_used == AddressUsageStateFilter.FUNDED and balance == 0:
+            return False
+        if self.show_used == AddressUsageStateFilter.USED_AND_EMPTY and not is_used_and_empty:
+            return False
+        if self.show_used == AddressUsageStateFilter.FUNDED_OR_UNUSED and is_used_and_empty:
+            return False
+        return True
+
+    def get_row_state(self, address: str) -> tuple:
+        """What refresh_row displays, except for fiat values."""
+        return (
+            self.wallet.get_label_for_address(address),
+            self.wallet.adb.get_address_history_len(address),
+            self.wallet.get_addr_balance(address),
+            self.wallet.is_frozen_address(address),
+            address in self.addresses_beyond_gap_limit,
+        )
+
     @profiler
     def update(self):
         if self.maybe_defer_update():
@@ -182,26 +261,54 @@ class AddressList(MyTreeView):
             addr_list = self.wallet.get_change_addresses()
         else:
             addr_list = self.wallet.get_addresses()
+        self.addresses_beyond_gap_limit = self.wallet.get_all_known_addresses_beyond_gap_limit()
+        addr_list = [address for address in addr_list if self.should_show_address(address)]
+        update_key = (self.show_change, self.show_used, self.should_show_fiat())
+        num_shown = len(self.shown_addresses)
+        if update_key == self._update_key and addr_list[:num_shown] == self.shown_addresses:
+            # same rows as before, and maybe new addresses at the end.
+            # only refresh the rows that were created, if they changed.
+            for address, row in self.address_rows.items():
+                row_state = self.get_row_state(address)
+                if row_state != self.row_states[address]:
+                    self.refresh_row(address, row, row_state=row_state)
+            self.std_model.add_pending(addr_list[num_shown:])
+            self.shown_addresses = addr_list
+            self.num_addr_label.setText(_("{} addresses").format(len(addr_list)))
+            return
+        self._update_key = update_key
         self.proxy.setDynamicSortFilter(False)  # temp. disable re-sorting after every change
         self.std_model.clear()
+        self.std_model.set_pending(addr_list)
+        self.address_rows.clear()
+        self.row_states.clear()
+        self.shown_addresses = addr_list
         self.refresh_headers()
-        fx = self.main_window.fx
+        if current_address in addr_list:
+            while current_address not in self.address_rows:
+                self.std_model.fetchMore(QModelIndex())
+        else:
+            self.std_model.fetchMore(QModelIndex())
+        if self.needs_all_rows():
+            self.std_model.fetch_all()
         set_address = None
-        num_shown = 0
-        self.addresses_beyond_gap_limit = self.wallet.get_all_known_addresses_beyond_gap_limit()
-        for address in addr_list:
-            c, u, x = self.wallet.get_addr_balance(address)
-            balance = c + u + x
-            is_used_and_empty = self.wallet.adb.is_used(address) and balance == 0
-            if self.show_used == AddressUsageStateFilter.UNUSED and (balance or is_used_and_empty):
-                continue
-            if self.show_used == AddressUsageStateFilter.FUNDED and balance == 0:
-                continue
-            if self.show_used == AddressUsageStateFilter.USED_AND_EMPTY and not is_used_and_empty:
-                continue
-            if self.show_used == AddressUsageStateFilter.FUNDED_OR_UNUSED and is_used_and_empty:
-                continue
-            num_shown += 1
+        if current_address in self.address_rows:
+            address_idx = self.std_model.index(self.address_rows[current_address], self.Columns.LABEL)
+            set_address = QPersistentModelIndex(address_idx)
+        self.set_current_idx(set_address)
+        # show/hide columns
+        if self.should_show_fiat():
+            self.showColumn(self.Columns.FIAT_BALANCE)
+        else:
+            self.hideColumn(self.Columns.FIAT_BALANCE)
+        self.filter()
+        self.proxy.setDynamicSortFilter(True)
+        # update counter
+        self.num_addr_label.setText(_("{} addresses").format(len(addr_list)))
+
+    def add_rows(self, addresses: Sequence[str]) -> None:
+        """Called by AddressModel.fetchMore"""
+        for address in addresses:
             labels = [""] * len(self.Columns)
             labels[self.Columns.ADDRESS] = address
             address_item = [QStandardItem(e) for e in labels]
@@ -228,27 +335,38 @@ class AddressList(MyTreeView):
             # add item
             count = self.std_model.rowCount()
             self.std_model.insertRow(count, address_item)
+            self.address_rows[address] = count
             self.refresh_row(address, count)
-            address_idx = self.std_model.index(count, self.Columns.LABEL)
-            if address == current_address:
-                set_address = QPersistentModelIndex(address_idx)
-        self.set_current_idx(set_address)
-        # show/hide columns
-        if self.should_show_fiat():
-            self.showColumn(self.Columns.FIAT_BALANCE)
-        else:
-            self.hideColumn(self.Columns.FIAT_BALANCE)
-        self.filter()
-        self.proxy.setDynamicSortFilter(True)
-        # update counter
-        self.num_addr_label.setText(_("{} addresses").format(num_shown))
-
-    def refresh_row(self, key, row):
+            if self.current_filter:
+                self.hide_row(self.proxy.mapFromSource(self.std_model.index(count, 0)).row())
+
+    def needs_all_rows(self) -> bool:
+        """Rows that are not created yet cannot be searched, nor sorted
+        by anything other than the order in which they are created.
+        """
+        return bool(self.current_filter) or not self._sorted_by_default
+
+    def on_sort_indicator_changed(self, column: int, order: Qt.SortOrder) -> None:
+        self._sorted_by_default = column == self.Columns.TYPE and order == Qt.AscendingOrder
+        if self.needs_all_rows():
+            self.std_model.fetch_all()
+
+    def filter(self, p=None):
+        search = p.lower() if p is not None else self.current_filter
+        if search:
+            self.std_model.fetch_all()
+        super().filter(p)
+
+    def find_row_by_key(self, key) -> Optional[int]:
+        return self.address_rows.get(key)
+
+    def refresh_row(self, key, row, *, row_state: tuple = None):
         assert row is not None
         address = key
-        label = self.wallet.get_label_for_address(address)
-        num = self.wallet.adb.get_address_history_len(address)
-        c, u, x = self.wallet.get_addr_balance(address)
+        if row_state is None:
+            row_state = self.get_row_state(address)
+        self.row_states[address] = row_state
+        label, num, (c, u, x), is_frozen, is_beyond_gap_limit = row_state
         balance = c + u + x
         balance_text = self.main_window.format_amount(balance, whitespaces=True)
         balance_text_nots = self.main_window.format_amount(balance, whitespaces=False, add_thousands_sep=False)
@@ -270,9 +388,9 @@ class AddressList(MyTreeView):
         address_item[self.Columns.FIAT_BALANCE].setData(balance, self.ROLE_SORT_ORDER)
         address_item[self.Columns.FIAT_BALANCE].setData(fiat_balance_str_nots, self.ROLE_CLIPBOARD_DATA)
         address_item[self.Columns.NUM_TXS].setText("%d"%num)
-        c = ColorScheme.BLUE.as_color(True) if self.wallet.is_frozen_address(address) else self._default_bg_brush
+        c = ColorScheme.BLUE.as_color(True) if is_frozen else self._default_bg_brush
         address_item[self.Columns.ADDRESS].setBackground(c)
-        if address in self.addresses_beyond_gap_limit:
+        if is_beyond_gap_limit:
             address_item[self.Columns.ADDRESS].setBackground(ColorScheme.RED.as_color(True))
 
     def create_menu(self, position):
@@ -38,6 +38,18 @@ class CustomNode:
         child._row = len(self._children)
         self._children.append(child)
 
+    def insertChild(self, row, child):
+        child._parent = self
+        self._children.insert(row, child)
+        for i in range(row, len(self._children)):
+            self._children[i]._row = i
+
+    def removeChild(self, row):
+        child = self._children.pop(row)
+        for i in range(row, len(self._children)):
+            self._children[i]._row = i
+        return child
+
 
 
 class CustomModel(QtCore.QAbstractItemModel):
@@ -28,7 +28,7 @@ import sys
 import time
 import datetime
 from datetime import date
-from typing import TYPE_CHECKING, Tuple, Dict, Any
+from typing import TYPE_CHECKING, Tuple, Dict, Any, Optional, Sequence
 import threading
 import enum
 from decimal import Decimal
@@ -229,6 +229,9 @@ class HistoryNode(CustomNode):
 
 class HistoryModel(CustomModel, Logger):
 
+    # beyond this, resetting all rows is cheaper than inserting/removing them one by one
+    MAX_ROWS_INSERTED_OR_REMOVED = 100
+
     def __init__(self, window: 'ElectrumWindow'):
         CustomModel.__init__(self, window, len(HistoryColumns))
         Logger.__init__(self)
@@ -236,6 +239,7 @@ class HistoryModel(CustomModel, Logger):
         self.view = None  # type: HistoryList
         self.transactions = OrderedDictWithIndex()
         self.tx_status_cache = {}  # type: Dict[str, Tuple[int, str]]
+        self._history_params = None  # arguments of get_full_history that are not the domain
 
     def set_view(self, history_list: 'HistoryList'):
         # FIXME HistoryModel and HistoryList mutually depend on each other.
@@ -284,42 +288,29 @@ class HistoryModel(CustomModel, Logger):
         if fx: fx.history_used_spot = False
         wallet = self.window.wallet
         self.set_visibility_of_columns()
+        history_params = (self.should_include_lightning_payments(), self.should_show_fiat())
         transactions = wallet.get_full_history(
             self.window.fx,
             onchain_domain=self.get_domain(),
-            include_lightning=self.should_include_lightning_payments(),
-            include_fiat=self.should_show_fiat(),
+            include_lightning=history_params[0],
+            include_fiat=history_params[1],
         )
+        # compute balance before comparing, as it is stored in the items
+        balance = 0
+        for tx_item in transactions.values():
+            balance += tx_item['value'].value
+            tx_item['balance'] = Satoshis(balance)
         if transactions == self.transactions:
             return
-        old_length = self._root.childCount()
-        if old_length != 0:
-            self.beginRemoveRows(QModelIndex(), 0, old_length)
-            self.transactions.clear()
-            self._root = HistoryNode(self, None)
-            self.endRemoveRows()
-        parents = {}
-        for tx_item in transactions.values():
-            node = HistoryNode(self, tx_item)
-            self._root.addChild(node)
-            for child_item in tx_item.get('children', []):
-                child_node = HistoryNode(self, child_item)
-                # add child to parent
-                node.addChild(child_node)
-
-        # compute balance once all children have beed added
-        balance = 0
-        for node in self._root._children:
-            balance += node._data['value'].value
-            node._data['balance'] = Satoshis(balance)
-
-        new_length = self._root.childCount()
-        self.beginInsertRows(QModelIndex(), 0, new_length-1)
-        self.transactions = transactions
-        self.endInsertRows()
-
-        if selected_row:
-            self.view.selectionModel().select(self.createIndex(selected_row, 0), QItemSelectionModel.Rows | QItemSelectionModel.SelectCurrent)
+        changed_keys = None
+        if history_params == self._history_params:
+            changed_keys = self._apply_history_delta(transactions)
+        if changed_keys is None:
+            self._rebuild(transactions)
+            changed_keys = transactions.keys()
+            if selected_row:
+                self.view.selectionModel().select(self.createIndex(selected_row, 0), QItemSelectionModel.Rows | QItemSelectionModel.SelectCurrent)
+        self._history_params = history_params
         self.view.filter()
         # update time filter
         if not self.view.years and self.transactions:
@@ -331,8 +322,11 @@ class HistoryModel(CustomModel, Logger):
             self.view.years = [str(i) for i in range(start_date.year, end_date.year + 1)]
             self.view.period_combo.insertItems(1, self.view.years)
         # update tx_status_cache
-        self.tx_status_cache.clear()
-        for txid, tx_item in self.transactions.items():
+        for txid in list(self.tx_status_cache):
+            if txid not in self.transactions:
+                del self.tx_status_cache[txid]
+        for txid in changed_keys:
+            tx_item = self.transactions[txid]
             if not tx_item.get('lightning', False):
                 tx_mined_info = self._tx_mined_info_from_tx_item(tx_item)
                 self.tx_status_cache[txid] = self.window.wallet.get_tx_status(txid, tx_mined_info)
@@ -341,6 +335,85 @@ class HistoryModel(CustomModel, Logger):
         if self.view:
             self.view.num_tx_label.setText(_("{} transactions").format(num_tx))
 
+    def _rebuild(self, transactions: OrderedDictWithIndex) -> None:
+        old_length = self._root.childCount()
+        if old_length != 0:
+            self.beginRemoveRows(QModelIndex(), 0, old_length)
+            self.transactions.clear()
+            self._root = HistoryNode(self, None)
+            self.endRemoveRows()
+        for tx_item in transactions.values():
+            self._root.addChild(self._create_node(tx_item))
+        new_length = self._root.childCount()
+        self.beginInsertRows(QModelIndex(), 0, new_length-1)
+        self.transactions = transactions
+        self.endInsertRows()
+
+    def _create_node(self, tx_item) -> HistoryNode:
+        node = HistoryNode(self, tx_item)
+        for child_item in tx_item.get('children', []):
+            child_node = HistoryNode(self, child_item)
+            # add child to parent
+            node.addChild(child_node)
+        return node
+
+    def _apply_history_delta(self, transactions: OrderedDictWithIndex) -> Optional[Sequence[str]]:
+        """Turns self.transactions into transactions, with row inserts,
+        removals and updates. Returns the keys of new and modified items,
+        or None if the rows would have to be reordered.
+        """
+        old = self.transactions
+        removed = [k for k in old if k not in transactions]
+        added = [k for k in transactions if k not in old]
+        if len(removed) + len(added) > self.MAX_ROWS_INSERTED_OR_REMOVED:
+            return None
+        if [k for k in old if k in transactions] != [k for k in transactions if k in old]:
+            return None
+        for key in reversed(removed):
+            row = old.pos_from_key(key)
+            self.beginRemoveRows(QModelIndex(), row, row)
+            self._root.removeChild(row)
+            self.endRemoveRows()
+        for key in added:
+            row = transactions.pos_from_key(key)
+            self.beginInsertRows(QModelIndex(), row, row)
+            self._root.insertChild(row, self._create_node(transactions[key]))
+            self.endInsertRows()
+        changed_keys = list(added)
+        added = set(added)
+        first_changed_row = last_changed_row = None
+        for row, (key, tx_item) in enumerate(transactions.items()):
+            if key in added:
+                continue
+            node = self._root.child(row)
+            old_item = node.get_data()
+            node._data = tx_item
+            if old_item == tx_item:
+                for child_node, child_item in zip(node._children, tx_item.get('children', [])):
+                    child_node._data = child_item
+                continue
+            changed_keys.append(key)
+            if old_item.get('children') != tx_item.get('children'):
+                parent_index = self.createIndex(row, 0, node)
+                if node.childCount():
+                    self.beginRemoveRows(parent_index, 0, node.childCount() - 1)
+                    node._children = []
+                    self.endRemoveRows()
+                if tx_item.get('children'):
+                    self.beginInsertRows(parent_index, 0, len(tx_item['children']) - 1)
+                    for child_item in tx_item['children']:
+                        node.addChild(HistoryNode(self, child_item))
+                    self.endInsertRows()
+            if first_changed_row is None:
+                first_changed_row = row
+            last_changed_row = row
+        self.transactions = transactions
+        if first_changed_row is not None:
+            topLeft = self.createIndex(first_changed_row, 0, self._root.child(first_changed_row))
+            bottomRight = self.createIndex(last_changed_row, len(HistoryColumns) - 1, self._root.child(last_changed_row))
+            self.dataChanged.emit(topLeft, bottomRight)
+        return changed_keys
+
     def set_visibility_of_columns(self):
         def set_visible(col: int, b: bool):
             self.view.showColumn(col) if b else self.view.hideColumn(col)
@@ -29,6 +29,7 @@ import sys
 import traceback
 import asyncio
 import socket
+import time
 from typing import Tuple, Union, List, TYPE_CHECKING, Optional, Set, NamedTuple, Any, Sequence, Dict
 from collections import defaultdict
 from ipaddress import IPv4Network, IPv6Network, ip_address, IPv6Address, IPv4Address
@@ -36,6 +37,7 @@ import itertools
 import logging
 import hashlib
 import functools
+import concurrent.futures
 
 import aiorpcx
 from aiorpcx import RPCSession, Notification, NetAddress, NewlineFramer
@@ -178,6 +180,67 @@ class NotificationSession(RPCSession):
             self.maybe_log(f"--> {response} (id: {msg_id})")
             return response
 
+    async def send_request_batch(
+            self,
+            requests: Sequence[Tuple[str, Sequence]],
+            *,
+            timeout=None,
+    ) -> List[Any]:
+        """Sends all (method, params) in 'requests' as a single JSON-RPC batch.
+        Returns the results in the same order. If the server returned an error
+        for some of the requests, the error (a CodeMessageError) is in place of
+        the result, so that the caller can handle it per-request.
+        """
+        assert requests
+        msg_id = next(self._msg_counter)
+        methods = sorted(set(method for method, params in requests))
+        self.maybe_log(f"<-- batch of {len(requests)} {methods} (id: {msg_id})")
+
+        async def send_batch():
+            async with self.send_batch(raise_errors=False) as batch:
+                for method, params in requests:
+                    batch.add_request(method, params)
+            return batch.results
+
+        start_time = time.monotonic()
+        try:
+            # note: RPCSession.send_batch raises TaskTimeout in case of a timeout.
+            results = await util.wait_for2(send_batch(), timeout)
+        except (TaskTimeout, asyncio.TimeoutError) as e:
+            if len(requests) == 1:
+                raise RequestTimedOut(f'batch request timed out: {len(requests)} {methods} (id: {msg_id})') from e
+            # The response to a batch is a single message, which aiorpcx drops if it is larger
+            # than NETWORK_MAX_INCOMING_MSG_SIZE, so that the batch can only time out.
+            # Retry with separate requests, each of which has to fit on its own.
+            if self.interface:
+                self.interface.logger.info(
+                    f"batch of {len(requests)} {methods} timed out, retrying as single requests (id: {msg_id})")
+            return await self._send_requests_separately(requests, timeout=timeout)
+        num_errors = len([r for r in results if isinstance(r, Exception)])
+        self.maybe_log(f"--> batch of {len(results)} results, {num_errors} errors (id: {msg_id})")
+        if self.interface:
+            self.interface.logger.info(
+                f"batch of {len(requests)} {methods} took {time.monotonic() - start_time:.3f} sec"
+                + (f" ({num_errors} errors)" if num_errors else ""))
+        return list(results)
+
+    async def _send_requests_separately(
+            self,
+            requests: Sequence[Tuple[str, Sequence]],
+            *,
+            timeout=None,
+    ) -> List[Any]:
+        """Like send_request_batch, but sends each request on its own."""
+        async def send_one(method, params):
+            try:
+                return await self.send_request(method, params, timeout=timeout)
+            except CodeMessageError as e:
+                return e
+
+        async with OldTaskGroup() as group:
+            tasks = [await group.spawn(send_one(method, params)) for method, params in requests]
+        return [task.result() for task in tasks]
+
     def set_default_timeout(self, timeout):
         self.sent_request_timeout = timeout
         self.max_send_delay = timeout
@@ -194,6 +257,24 @@ class NotificationSession(RPCSession):
             self.cache[key] = result
         await queue.put(params + [result])
 
+    async def subscribe_batch(self, method: str, params_list: Sequence[List], queue: asyncio.Queue):
+        """Like subscribe, for many params at once. Subscriptions that are not
+        cached yet are sent as a single batch. Raises the first error returned
+        by the server, if any.
+        """
+        keys = [self.get_hashable_key_for_rpc_call(method, params) for params in params_list]
+        for key in keys:
+            self.subscriptions[key].append(queue)
+        to_request = [(params, key) for params, key in zip(params_list, keys) if key not in self.cache]
+        if to_request:
+            results = await self.send_request_batch([(method, params) for params, key in to_request])
+            for (params, key), result in zip(to_request, results):
+                if isinstance(result, Exception):
+                    raise result
+                self.cache[key] = result
+        for params, key in zip(params_list, keys):
+            await queue.put(params + [self.cache[key]])
+
     def unsubscribe(self, queue):
         """Unsubscribe a callback to free object references to enable GC."""
         # note: we can't unsubscribe from the server, so we keep receiving
@@ -622,7 +703,7 @@ class Interface(Logger):
         # use lower timeout as we usually have network.bhi_lock here
         timeout = self.network.get_network_timeout_seconds(NetworkTimeout.Urgent)
         res = await self.session.send_request('blockchain.block.header', [height], timeout=timeout)
-        return blockchain.deserialize_header(bytes.fromhex(res), height)
+        return blockchain.BlockHeader(bytes.fromhex(res), height)
 
     async def request_chunk(self, height: int, tip=None, *, can_return_early=False):
         if not is_non_negative_integer(height):
@@ -637,9 +718,22 @@ class Interface(Logger):
             size = max(size, 0)
         try:
             self._requested_chunks.add(index)
-            res = await self.session.send_request('blockchain.block.headers', [index * 2016, size])
+            chunk_hex = await self._fetch_chunk(index, size)
         finally:
             self._requested_chunks.discard(index)
+        conn = self.blockchain.connect_chunk(index, chunk_hex)
+        if not conn:
+            return conn, 0
+        return conn, size
+
+    def is_requesting_chunk(self, index: int) -> bool:
+        return index in self._requested_chunks
+
+    async def _fetch_chunk(self, index: int, size: int) -> str:
+        """Downloads the headers of chunk 'index' (at most 2016), without connecting them.
+        Returns the headers as hex.
+        """
+        res = await self.session.send_request('blockchain.block.headers', [index * 2016, size])
         assert_dict_contains_field(res, field_name='count')
         assert_dict_contains_field(res, field_name='hex')
         assert_dict_contains_field(res, field_name='max')
@@ -653,10 +747,114 @@ class Interface(Logger):
             raise RequestCorrupted(f"server uses too low 'max' count for block.headers: {res['max']} < 2016")
         if res['count'] != size:
             raise RequestCorrupted(f"expected {size} headers but only got {res['count']}")
-        conn = self.blockchain.connect_chunk(index, res['hex'])
-        if not conn:
-            return conn, 0
-        return conn, res['count']
+        return res['hex']
+
+    def _get_interfaces_for_chunk_pipeline(self) -> Sequence['Interface']:
+        """Returns the interfaces that may serve chunk requests for our catch-up.
+        We are always first. Chunks served by other interfaces get verified
+        against our chain just the same, so trusting them is not required.
+        """
+        ifaces = [self]
+        other_ifaces = getattr(self.network, 'interfaces', None)
+        if not other_ifaces:
+            return ifaces
+        with self.network.interfaces_lock:
+            other_ifaces = list(other_ifaces.values())
+        for iface in other_ifaces:
+            if iface is self or not iface.is_connected_and_ready():
+                continue
+            ifaces.append(iface)
+        return ifaces
+
+    async def _fetch_chunk_with_fallback(self, index: int, size: int, iface: 'Interface') -> str:
+        if iface is not self:
+            try:
+                return await iface._fetch_chunk(index, size)
+            except Exception as e:
+                # not our server, so not our problem. we retry with our own server below.
+                self.logger.info(f"failed to get chunk {index} from {iface.diagnostic_name()}: {repr(e)}")
+        return await self._fetch_chunk(index, size)
+
+    async def _fetch_and_hash_chunk(
+            self, index: int, size: int, iface: 'Interface',
+            executor: Optional[concurrent.futures.Executor],
+    ) -> Tuple[str, Optional[Sequence[bytes]]]:
+        chunk_hex = await self._fetch_chunk_with_fallback(index, size, iface)
+        header_hashes = None
+        if executor is not None:
+            # hash in another process, while earlier chunks are being connected
+            loop = asyncio.get_running_loop()
+            header_hashes = await loop.run_in_executor(
+                executor, blockchain.hash_raw_headers, bytes.fromhex(chunk_hex))
+        return chunk_hex, header_hashes
+
+    async def request_chunks_pipelined(self, height: int, tip: int) -> Tuple[bool, int]:
+        """Downloads and connects all chunks from 'height' up to 'tip',
+        keeping several 'blockchain.block.headers' requests in flight.
+        Requests might be spread over other connected interfaces.
+        Chunks are connected strictly in order, as they become available.
+
+        Returns (could_connect, num_headers), where num_headers is the number of headers
+        connected counting from the start of the chunk that contains 'height'.
+        If could_connect is False, the chunk after those headers failed verification.
+        """
+        if not is_non_negative_integer(height):
+            raise Exception(f"{repr(height)} is not a block height")
+        assert height <= tip, (height, tip)
+        depth = max(1, self.network.config.NETWORK_HEADER_CHUNK_PIPELINE_DEPTH)
+        first_index = height // 2016
+        last_index = tip // 2016
+        ifaces = self._get_interfaces_for_chunk_pipeline()
+        executor = blockchain.get_header_hash_executor(self.network.config.NETWORK_HEADER_HASH_PROCESSES)
+        self.logger.info(
+            f"requesting chunks {first_index}-{last_index} with pipeline depth {depth} "
+            f"over {len(ifaces)} interface(s)")
+
+        def chunk_size(index: int) -> int:
+            return min(2016, tip - index * 2016 + 1)
+
+        pending = {}  # type: Dict[int, Tuple[asyncio.Task, Interface]]
+        next_index = first_index
+        num_headers = 0
+        could_connect = True
+        start_time = time.monotonic()
+        try:
+            async with OldTaskGroup() as group:
+                for index in range(first_index, last_index + 1):
+                    # top up the pipeline
+                    while next_index <= last_index and len(pending) < depth:
+                        iface = ifaces[(next_index - first_index) % len(ifaces)]
+                        if iface.tip < next_index * 2016 + chunk_size(next_index) - 1:
+                            iface = self
+                        self._requested_chunks.add(next_index)
+                        task = await group.spawn(
+                            self._fetch_and_hash_chunk(next_index, chunk_size(next_index), iface, executor))
+                        pending[next_index] = (task, iface)
+                        next_index += 1
+                    task, iface = pending.pop(index)
+                    chunk_hex, header_hashes = await task
+                    self._requested_chunks.discard(index)
+                    conn = self.blockchain.connect_chunk(index, chunk_hex, header_hashes=header_hashes)
+                    if not conn and iface is not self:
+                        self.logger.info(f"chunk {index} from {iface.diagnostic_name()} did not connect. "
+                                         f"retrying with our own server")
+                        chunk_hex = await self._fetch_chunk(index, chunk_size(index))
+                        conn = self.blockchain.connect_chunk(index, chunk_hex)
+                    if not conn:
+                        could_connect = False
+                        break
+                    num_headers += chunk_size(index)
+                    util.trigger_callback('network_updated')
+                await group.cancel_remaining()
+        finally:
+            for index in pending:
+                self._requested_chunks.discard(index)
+        elapsed = time.monotonic() - start_time
+        num_connected = max(0, first_index * 2016 + num_headers - height)
+        self.logger.info(
+            f"pipelined catch-up connected {num_connected} headers in {elapsed:.2f} sec "
+            f"({num_connected / max(elapsed, 1e-6):.0f} headers/sec)")
+        return could_connect, num_headers
 
     def is_main_server(self) -> bool:
         return (self.network.interface == self or
@@ -752,7 +950,7 @@ class Interface(Logger):
             item = await header_queue.get()
             raw_header = item[0]
             height = raw_header['height']
-            header = blockchain.deserialize_header(bfh(raw_header['hex']), height)
+            header = blockchain.BlockHeader(bfh(raw_header['hex']), height)
             self.tip_header = header
             self.tip = height
             if self.tip < constants.net.max_checkpoint():
@@ -790,7 +988,15 @@ class Interface(Logger):
         while last is None or height <= next_height:
             prev_last, prev_height = last, height
             if next_height > height + 10:
-                could_connect, num_headers = await self.request_chunk(height, next_height)
+                if self._should_pipeline_chunks(height, next_height):
+                    could_connect, num_headers = await self.request_chunks_pipelined(height, next_height)
+                    if not could_connect and num_headers > height % 2016:
+                        # made some progress before a chunk did not connect; retry from there
+                        height = (height // 2016 * 2016) + num_headers
+                        last = 'catchup'
+                        continue
+                else:
+                    could_connect, num_headers = await self.request_chunk(height, next_height)
                 if not could_connect:
                     if height <= constants.net.max_checkpoint():
                         raise GracefulDisconnect('server chain conflicts with checkpoints or genesis')
@@ -805,6 +1011,10 @@ class Interface(Logger):
             assert (prev_last, prev_height) != (last, height), 'had to prevent infinite loop in interface.sync_until'
         return last, height
 
+    def _should_pipeline_chunks(self, height: int, next_height: int) -> bool:
+        depth = self.network.config.NETWORK_HEADER_CHUNK_PIPELINE_DEPTH
+        return depth > 1 and next_height // 2016 > height // 2016
+
     async def step(self, height, header=None):
         assert 0 <= height <= self.tip, (height, self.tip)
         if header is None:
@@ -965,7 +1175,27 @@ class Interface(Logger):
             raise Exception(f"{repr(tx_height)} is not a block height")
         # do request
         res = await self.session.send_request('blockchain.transaction.get_merkle', [tx_hash, tx_height])
-        # check response
+        return self._check_merkle_for_transaction(res)
+
+    async def get_merkles_for_transactions(
+            self, tx_hashes: Sequence[str], tx_height: int,
+    ) -> List[Union[dict, aiorpcx.jsonrpc.RPCError]]:
+        """Batched version of get_merkle_for_transaction, for txs mined at the same height.
+        Errors returned by the server for individual txs (e.g. tx not at that height)
+        are returned in place of the proof, for the caller to handle.
+        """
+        for tx_hash in tx_hashes:
+            if not is_hash256_str(tx_hash):
+                raise Exception(f"{repr(tx_hash)} is not a txid")
+        if not is_non_negative_integer(tx_height):
+            raise Exception(f"{repr(tx_height)} is not a block height")
+        results = await self.session.send_request_batch(
+            [('blockchain.transaction.get_merkle', [tx_hash, tx_height]) for tx_hash in tx_hashes])
+        return [res if isinstance(res, Exception) else self._check_merkle_for_transaction(res)
+                for res in results]
+
+    @classmethod
+    def _check_merkle_for_transaction(cls, res: Any) -> dict:
         block_height = assert_dict_contains_field(res, field_name='block_height')
         merkle = assert_dict_contains_field(res, field_name='merkle')
         pos = assert_dict_contains_field(res, field_name='pos')
@@ -981,7 +1211,23 @@ class Interface(Logger):
         if not is_hash256_str(tx_hash):
             raise Exception(f"{repr(tx_hash)} is not a txid")
         raw = await self.session.send_request('blockchain.transaction.get', [tx_hash], timeout=timeout)
-        # validate response
+        return self._check_raw_transaction(tx_hash, raw)
+
+    async def get_transactions(self, tx_hashes: Sequence[str], *, timeout=None) -> List[Union[str, aiorpcx.jsonrpc.RPCError]]:
+        """Batched version of get_transaction.
+        Errors returned by the server for individual txs (e.g. tx not found)
+        are returned in place of the raw tx, for the caller to handle.
+        """
+        for tx_hash in tx_hashes:
+            if not is_hash256_str(tx_hash):
+                raise Exception(f"{repr(tx_hash)} is not a txid")
+        results = await self.session.send_request_batch(
+            [('blockchain.transaction.get', [tx_hash]) for tx_hash in tx_hashes], timeout=timeout)
+        return [raw if isinstance(raw, Exception) else self._check_raw_transaction(tx_hash, raw)
+                for tx_hash, raw in zip(tx_hashes, results)]
+
+    @classmethod
+    def _check_raw_transaction(cls, tx_hash: str, raw: Any) -> str:
         if not is_hex_str(raw):
             raise RequestCorrupted(f"received garbage (non-hex) as tx data (txid {tx_hash}): {raw!r}")
         tx = Transaction(raw)
@@ -998,7 +1244,24 @@ class Interface(Logger):
             raise Exception(f"{repr(sh)} is not a scripthash")
         # do request
         res = await self.session.send_request('blockchain.scripthash.get_history', [sh])
-        # check response
+        return self._check_history_for_scripthash(sh, res)
+
+    async def get_histories_for_scripthashes(self, shs: Sequence[str]) -> List[List[dict]]:
+        """Batched version of get_history_for_scripthash.
+        Raises the first error returned by the server, if any.
+        """
+        for sh in shs:
+            if not is_hash256_str(sh):
+                raise Exception(f"{repr(sh)} is not a scripthash")
+        results = await self.session.send_request_batch(
+            [('blockchain.scripthash.get_history', [sh]) for sh in shs])
+        for res in results:
+            if isinstance(res, Exception):
+                raise res
+        return [self._check_history_for_scripthash(sh, res) for sh, res in zip(shs, results)]
+
+    @classmethod
+    def _check_history_for_scripthash(cls, sh: str, res: Any) -> List[dict]:
         assert_list_or_tuple(res)
         prev_height = 1
         for tx_item in res:
@@ -25,7 +25,8 @@
 import threading
 import copy
 import json
-from typing import TYPE_CHECKING
+import re
+from typing import TYPE_CHECKING, Callable, Optional
 import jsonpatch
 
 from . import util
@@ -81,6 +82,16 @@ def stored_in(name, _type=dict):
     return decorator
 
 
+# number of patch records decoded before they are applied to the base document
+PATCH_BATCH_SIZE = 1000
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+def _skip_whitespace(s: str, pos: int) -> int:
+    return _WHITESPACE.match(s, pos).end()
+
+
 def key_path(path, key):
     def to_str(x):
         if isinstance(x, int):
@@ -210,13 +221,15 @@ class StoredList(list):
 
 class JsonDB(Logger):
 
-    def __init__(self, s: str, storage=None, encoder=None, upgrader=None):
+    def __init__(self, s: str, storage=None, encoder=None, upgrader=None, progress_cb=None):
+        """'progress_cb' is called with the fraction of 's' loaded so far"""
         Logger.__init__(self)
         self.lock = threading.RLock()
         self.storage = storage
         self.encoder = encoder
         self.pending_changes = []
         self._modified = False
+        self._progress_cb = progress_cb  # type: Optional[Callable[[float], None]]
         # load data
         data = self.load_data(s)
         if upgrader:
@@ -232,26 +245,77 @@ class JsonDB(Logger):
         """ overloaded in wallet_db """
         if s == '':
             return {}
+        decoder = json.JSONDecoder()
         try:
-            data = json.loads('[' + s + ']')
-            data, patches = data[0], data[1:]
+            data, pos = decoder.raw_decode(s, _skip_whitespace(s, 0))
+            self._next_record(s, pos)
         except Exception:
             if r := self.maybe_load_ast_data(s):
-                data, patches = r, []
+                data, pos = r, len(s)
             elif r := self.maybe_load_incomplete_data(s):
-                data, patches = r, []
+                data, pos = r, len(s)
             else:
                 raise WalletFileException("Cannot read wallet file. (parsing failed)")
         if not isinstance(data, dict):
             raise WalletFileException("Malformed wallet file (not dict)")
-        if patches:
-            # apply patches
-            self.logger.info('found %d patches'%len(patches))
-            patch = jsonpatch.JsonPatch(patches)
-            data = patch.apply(data)
-            self.set_modified(True)
+        self._replay_patches(s, pos, data, decoder)
         return data
 
+    @staticmethod
+    def _next_record(s: str, pos: int) -> Optional[int]:
+        """Returns the position of the record after the one ending at pos,
+        or None at the end of the file. Records are separated by ','.
+        """
+        pos = _skip_whitespace(s, pos)
+        if pos == len(s):
+            return None
+        if s[pos] != ',':
+            raise ValueError(f"unexpected character at position {pos}")
+        return _skip_whitespace(s, pos + 1)
+
+    def _replay_patches(self, s: str, pos: int, data: dict, decoder: json.JSONDecoder) -> None:
+        """Applies the patches appended after the base document, in place.
+        Only PATCH_BATCH_SIZE decoded patches are held in memory at a time.
+        """
+        n = 0
+        batch = []
+        next_progress = 0.1
+        while True:
+            try:
+                pos = self._next_record(s, pos)
+                if pos is None:
+                    break
+                patch, pos = decoder.raw_decode(s, pos)
+            except ValueError:
+                # the last record might have been written partially.
+                # records are written on a line each, so any other line after it means corruption
+                end = s.find('\n', pos)
+                if end != -1 and s[end:].strip():
+                    raise WalletFileException("Cannot read wallet file. (parsing failed)")
+                # make sure the file gets rewritten without it.
+                self.logger.info(f'found incomplete data {s[pos:pos+30]!r}...')
+                self.set_modified(True)
+                break
+            batch.append(patch)
+            if len(batch) >= PATCH_BATCH_SIZE:
+                n += self._apply_patches(data, batch)
+                batch = []
+            if self._progress_cb and pos / len(s) >= next_progress:
+                self._progress_cb(pos / len(s))
+                next_progress += 0.1
+        n += self._apply_patches(data, batch)
+        if n:
+            self.logger.info('applied %d patches' % n)
+            self.set_modified(True)
+        if self._progress_cb:
+            self._progress_cb(1.0)
+
+    @staticmethod
+    def _apply_patches(data: dict, patches: list) -> int:
+        if patches:
+            jsonpatch.JsonPatch(patches).apply(data, in_place=True)
+        return len(patches)
+
     def maybe_load_ast_data(self, s):
         """ for old wallets """
         try:
@@ -382,7 +446,6 @@ class JsonDB(Logger):
     @locked
     def write(self):
         if (not self.storage.file_exists()
-                or self.storage.is_encrypted()
                 or self.storage.needs_consolidation()):
             self.write_and_force_consolidation()
         else:
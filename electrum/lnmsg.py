@@ -1,6 +1,7 @@
 import os
 import csv
 import io
+import struct
 from typing import Callable, Tuple, Any, Dict, List, Sequence, Union, Optional
 from collections import OrderedDict
 
@@ -278,6 +279,156 @@ def _resolve_field_count(field_count_str: str, *, vars_dict: dict, allow_any=Fal
     return field_count
 
 
+# lengths of the field types that can appear in messages (outside of tlv streams)
+_FIXED_FIELD_TYPE_LEN = {
+    'byte': 1,
+    'u8': 1,
+    'u16': 2,
+    'u32': 4,
+    'u64': 8,
+    'chain_hash': 32,
+    'channel_id': 32,
+    'sha256': 32,
+    'signature': 64,
+    'point': 33,
+    'short_channel_id': 8,
+}
+_INT_FIELD_STRUCT_FORMAT = {'u8': 'B', 'u16': 'H', 'u32': 'I', 'u64': 'Q'}
+
+# steps of a _CompiledMsgScheme
+_STEP_STRUCT = 0  # consecutive fields with a static size, read with a single struct
+_STEP_VAR = 1     # field whose count is given by a previous field
+_STEP_TLVS = 2    # tlv stream, until the end of the message
+
+
+class _CompiledMsgScheme:
+    """Decoder and encoder for one message type, built once from its scheme.
+
+    Behaves like the generic code in LNSerializer.decode_msg/encode_msg,
+    but does not interpret the csv rows, nor go through io.BytesIO, for
+    every message. Returns None from compile() for schemes it does not
+    handle, which are then left to the generic code.
+    """
+
+    def __init__(self, decode_steps: Sequence[tuple], encode_steps: Sequence[tuple]):
+        self.decode_steps = decode_steps
+        self.encode_steps = encode_steps
+
+    @classmethod
+    def compile(cls, scheme: Sequence[Sequence]) -> Optional['_CompiledMsgScheme']:
+        decode_steps = []
+        encode_steps = []
+        struct_format = ''
+        struct_fields = []
+
+        def flush_struct():
+            nonlocal struct_format, struct_fields
+            if struct_fields:
+                decode_steps.append((_STEP_STRUCT, struct.Struct('>' + struct_format), tuple(struct_fields)))
+            struct_format = ''
+            struct_fields = []
+
+        for row in scheme:
+            if row[0] == "msgtype":
+                continue
+            if row[0] != "msgdata":
+                return None
+            # msgdata,<msgname>,<fieldname>,<typename>,[<count>][,<option>]
+            field_name, field_type, field_count_str = row[2], row[3], row[4]
+            if field_name == "tlvs":
+                flush_struct()
+                decode_steps.append((_STEP_TLVS, field_type))
+                encode_steps.append((_STEP_TLVS, field_type))
+                continue
+            type_len = _FIXED_FIELD_TYPE_LEN.get(field_type)
+            if type_len is None or field_count_str == "...":
+                return None
+            is_int = field_type in _INT_FIELD_STRUCT_FORMAT
+            if field_count_str == "":
+                count = 1
+            else:
+                try:
+                    count = int(field_count_str)
+                except ValueError:
+                    count = field_count_str  # name of a previous field
+            if isinstance(count, str):
+                if is_int:
+                    return None
+                flush_struct()
+                decode_steps.append((_STEP_VAR, field_name, type_len, count))
+            else:
+                if is_int and count != 1:
+                    return None
+                struct_format += _INT_FIELD_STRUCT_FORMAT[field_type] if is_int and count == 1 else f'{count * type_len}s'
+                struct_fields.append(field_name)
+            encode_steps.append((_STEP_VAR, field_name, type_len, count, field_type == 'byte'))
+        flush_struct()
+        return _CompiledMsgScheme(decode_steps, encode_steps)
+
+    def decode(self, serializer: 'LNSerializer', data: bytes) -> dict:
+        """Decodes the payload of a message, data[2:]"""
+        if not isinstance(data, bytes):
+            data = bytes(data)
+        parsed = {}
+        offset = 2
+        end = len(data)
+        for step in self.decode_steps:
+            kind = step[0]
+            if kind == _STEP_STRUCT:
+                _, st, field_names = step
+                if offset + st.size > end:
+                    raise UnexpectedEndOfStream()
+                parsed.update(zip(field_names, st.unpack_from(data, offset)))
+                offset += st.size
+            elif kind == _STEP_VAR:
+                _, field_name, type_len, count_name = step
+                count = parsed[count_name]
+                if isinstance(count, (bytes, bytearray)):
+                    count = int.from_bytes(count, byteorder="big")
+                assert isinstance(count, int)
+                total_len = count * type_len
+                if offset + total_len > end:
+                    raise UnexpectedEndOfStream()
+                parsed[field_name] = data[offset:offset + total_len]
+                offset += total_len
+            else:
+                tlv_stream_name = step[1]
+                with io.BytesIO(data[offset:]) as fd:
+                    parsed[tlv_stream_name] = serializer.read_tlv_stream(fd=fd, tlv_stream_name=tlv_stream_name)
+                offset = end
+        return parsed
+
+    def encode(self, serializer: 'LNSerializer', msg_type_bytes: bytes, kwargs: dict) -> bytes:
+        parts = [msg_type_bytes]
+        for step in self.encode_steps:
+            if step[0] == _STEP_TLVS:
+                tlv_stream_name = step[1]
+                if tlv_stream_name in kwargs:
+                    with io.BytesIO() as fd:
+                        serializer.write_tlv_stream(fd=fd, tlv_stream_name=tlv_stream_name, **(kwargs[tlv_stream_name]))
+                        parts.append(fd.getvalue())
+                continue
+            _, field_name, type_len, count, is_byte = step
+            if isinstance(count, str):
+                count = kwargs[count]
+                if isinstance(count, (bytes, bytearray)):
+                    count = int.from_bytes(count, byteorder="big")
+                assert isinstance(count, int)
+                assert count >= 0, f"{count!r} must be non-neg int"
+            if count == 0:
+                continue
+            value = kwargs.get(field_name, 0)  # default mandatory fields to zero
+            total_len = count * type_len
+            if isinstance(value, int) and (count == 1 or is_byte):
+                value = int.to_bytes(value, length=total_len, byteorder="big", signed=False)
+            if not isinstance(value, (bytes, bytearray)):
+                raise Exception(f"can only write bytes into fd. got: {value!r}")
+            if total_len != len(value):
+                raise UnexpectedFieldSizeForEncoder(f"expected: {total_len}, got {len(value)}")
+            parts.append(value)
+        return b''.join(parts)
+
+
 def _parse_msgtype_intvalue_for_onion_wire(value: str) -> int:
     msg_type_int = 0
     for component in value.split("|"):
@@ -290,9 +441,10 @@ def _parse_msgtype_intvalue_for_onion_wire(value: str) -> int:
 
 class LNSerializer:
 
-    def __init__(self, *, for_onion_wire: bool = False):
+    def __init__(self, *, for_onion_wire: bool = False, compile_schemes: bool = True):
         # TODO msg_type could be 'int' everywhere...
         self.msg_scheme_from_type = {}  # type: Dict[bytes, List[Sequence[str]]]
+        self.compiled_msg_scheme_from_type = {}  # type: Dict[bytes, _CompiledMsgScheme]
         self.msg_type_from_name = {}  # type: Dict[str, bytes]
 
         self.in_tlv_stream_get_tlv_record_scheme_from_type = {}  # type: Dict[str, Dict[int, List[Sequence[str]]]]
@@ -350,6 +502,11 @@ class LNSerializer:
                     self.in_tlv_stream_get_tlv_record_scheme_from_type[tlv_stream_name][tlv_record_type].append(tuple(row))
                 else:
                     pass  # TODO
+        if compile_schemes:
+            for msg_type_bytes, scheme in self.msg_scheme_from_type.items():
+                compiled = _CompiledMsgScheme.compile(scheme)
+                if compiled is not None:
+                    self.compiled_msg_scheme_from_type[msg_type_bytes] = compiled
 
     def write_tlv_stream(self, *, fd: io.BytesIO, tlv_stream_name: str, **kwargs) -> None:
         scheme_map = self.in_tlv_stream_get_tlv_record_scheme_from_type[tlv_stream_name]
@@ -433,6 +590,9 @@ class LNSerializer:
         """
         #print(f">>> encode_msg. msg_type={msg_type}, payload={kwargs!r}")
         msg_type_bytes = self.msg_type_from_name[msg_type]
+        compiled = self.compiled_msg_scheme_from_type.get(msg_type_bytes)
+        if compiled is not None:
+            return compiled.encode(self, msg_type_bytes, kwargs)
         scheme = self.msg_scheme_from_type[msg_type_bytes]
         with io.BytesIO() as fd:
             fd.write(msg_type_bytes)
@@ -486,8 +646,11 @@ class LNSerializer:
                 raise UnknownOptionalMsgType(f"msg_type={msg_type_int}")
         assert scheme[0][2] == msg_type_int
         msg_type_name = scheme[0][1]
+        compiled = self.compiled_msg_scheme_from_type.get(msg_type_bytes)
         parsed = {}
         try:
+            if compiled is not None:
+                return msg_type_name, compiled.decode(self, data)
             with io.BytesIO(data[2:]) as fd:
                 for row in scheme:
                     #print(f"row: {row!r}")
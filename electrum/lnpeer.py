@@ -75,6 +75,11 @@ class Peer(Logger):
         'ping', 'pong', 'channel_announcement', 'node_announcement', 'channel_update',)
 
     DELAY_INC_MSG_PROCESSING_SLEEP = 0.01
+    # max number of gossip messages waiting for verification. beyond that, we stop
+    # reading from peers we have no channels with, and drop gossip from the others
+    GOSSIP_QUEUE_MAX_SIZE = 10_000
+    # while reading is stopped, how often to check whether gossip is still enabled
+    GOSSIP_QUEUE_RECHECK_INTERVAL = 5
 
     def __init__(
             self,
@@ -104,6 +109,7 @@ class Peer(Logger):
         self.reply_channel_range = asyncio.Queue()
         # gossip uses a single queue to preserve message order
         self.gossip_queue = asyncio.Queue()
+        self._gossip_queue_drained = asyncio.Event()
         self.ordered_message_queues = defaultdict(asyncio.Queue)  # type: Dict[bytes, asyncio.Queue] # for messages that are ordered
         self.temp_id_to_id = {}  # type: Dict[bytes, Optional[bytes]]   # to forward error messages
         self.funding_created_sent = set() # for channels in PREOPENING
@@ -370,17 +376,22 @@ class Peer(Logger):
         self.maybe_set_initialized()
 
     def on_node_announcement(self, payload):
-        if not self.lnworker.uses_trampoline():
-            self.gossip_queue.put_nowait(('node_announcement', payload))
+        self._queue_gossip('node_announcement', payload)
 
     def on_channel_announcement(self, payload):
-        if not self.lnworker.uses_trampoline():
-            self.gossip_queue.put_nowait(('channel_announcement', payload))
+        self._queue_gossip('channel_announcement', payload)
 
     def on_channel_update(self, payload):
         self.maybe_save_remote_update(payload)
-        if not self.lnworker.uses_trampoline():
-            self.gossip_queue.put_nowait(('channel_update', payload))
+        self._queue_gossip('channel_update', payload)
+
+    def _queue_gossip(self, name: str, payload) -> None:
+        if self.lnworker.uses_trampoline():
+            return
+        if self.gossip_queue.qsize() >= self.GOSSIP_QUEUE_MAX_SIZE and self.channels:
+            # we keep reading from peers we have channels with, see _message_loop
+            return
+        self.gossip_queue.put_nowait((name, payload))
 
     def maybe_save_remote_update(self, payload):
         if not self.channels:
@@ -448,6 +459,10 @@ class Peer(Logger):
         while True:
             await asyncio.sleep(5)
             if not self.network.lngossip:
+                # gossip got stopped: drop what we have, and resume reading
+                while not self.gossip_queue.empty():
+                    self.gossip_queue.get_nowait()
+                self._gossip_queue_drained.set()
                 continue
             chan_anns = []
             chan_upds = []
@@ -464,6 +479,7 @@ class Peer(Logger):
                     raise Exception('unknown message')
                 if self.gossip_queue.empty():
                     break
+            self._gossip_queue_drained.set()
             if self.network.lngossip:
                 await self.network.lngossip.process_gossip(chan_anns, node_anns, chan_upds)
 
@@ -603,11 +619,24 @@ class Peer(Logger):
             raise GracefulDisconnect(f'initialize failed: {repr(e)}') from e
         async for msg in self.transport.read_messages():
             self.process_message(msg)
+            if self.gossip_queue.qsize() >= self.GOSSIP_QUEUE_MAX_SIZE and not self.channels:
+                # note: with a channel peer, this would also hold up the channel messages
+                await self._wait_for_gossip_queue_drained()
             if self.DELAY_INC_MSG_PROCESSING_SLEEP:
                 # rate-limit message-processing a bit, to make it harder
                 # for a single peer to bog down the event loop / cpu:
                 await asyncio.sleep(self.DELAY_INC_MSG_PROCESSING_SLEEP)
 
+    async def _wait_for_gossip_queue_drained(self):
+        # back-pressure: stop reading until process_gossip caught up.
+        # gossip might get stopped meanwhile, hence we do not wait forever
+        while self.gossip_queue.qsize() >= self.GOSSIP_QUEUE_MAX_SIZE and self.network.lngossip:
+            self._gossip_queue_drained.clear()
+            try:
+                await util.wait_for2(self._gossip_queue_drained.wait(), self.GOSSIP_QUEUE_RECHECK_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
     def on_reply_short_channel_ids_end(self, payload):
         self.querying.set()
 
@@ -23,9 +23,10 @@
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-import queue
+import heapq
 from collections import defaultdict
-from typing import Sequence, Tuple, Optional, Dict, TYPE_CHECKING, Set
+from typing import Sequence, Tuple, Optional, Dict, TYPE_CHECKING, Set, List
+import functools
 import time
 import threading
 from threading import RLock
@@ -35,8 +36,8 @@ from math import inf
 from .util import profiler, with_lock
 from .logging import Logger
 from .lnutil import (NUM_MAX_EDGES_IN_PAYMENT_PATH, ShortChannelID, LnFeatures,
-                     NBLOCK_CLTV_DELTA_TOO_FAR_INTO_FUTURE, PaymentFeeBudget)
-from .channel_db import ChannelDB, Policy, NodeInfo
+                     NBLOCK_CLTV_DELTA_TOO_FAR_INTO_FUTURE, PaymentFeeBudget, NoPathFound)
+from .channel_db import ChannelDB, Policy, NodeInfo, ChannelInfo, GraphEdge
 
 if TYPE_CHECKING:
     from .lnchannel import Channel
@@ -55,6 +56,9 @@ class NoChannelPolicy(Exception):
 class LNPathInconsistent(Exception): pass
 
 
+class PathFindingTimeout(NoPathFound): pass
+
+
 def fee_for_edge_msat(forwarded_amount_msat: int, fee_base_msat: int, fee_proportional_millionths: int) -> int:
     return fee_base_msat \
            + (forwarded_amount_msat * fee_proportional_millionths // 1_000_000)
@@ -396,6 +400,11 @@ class LiquidityHintMgr:
         return string
 
 
+@functools.lru_cache(maxsize=1024)
+def _supports_var_onion(node_features: int) -> bool:
+    return LnFeatures(node_features).supports(LnFeatures.VAR_ONION_OPT)
+
+
 class LNPathFinder(Logger):
 
     def __init__(self, channel_db: ChannelDB):
@@ -472,25 +481,33 @@ class LNPathFinder(Logger):
             my_channels: Dict[ShortChannelID, 'Channel'] = None,
             private_route_edges: Dict[ShortChannelID, RouteEdge] = None,
             now: int,  # unix ts
+            channel_info: ChannelInfo = None,
+            channel_policy: Policy = None,
+            channel_policy_backwards: Policy = None,
     ) -> Tuple[float, int]:
         """Heuristic cost (distance metric) of going through a channel.
         Returns (heuristic_cost, fee_for_edge_msat).
+        channel_info and policies can be passed if they are already known,
+        otherwise they are looked up.
         """
         if self._is_edge_blacklisted(short_channel_id, now=now):
             return float('inf'), 0
         if private_route_edges is None:
             private_route_edges = {}
-        channel_info = self.channel_db.get_channel_info(
-            short_channel_id, my_channels=my_channels, private_route_edges=private_route_edges)
+        if channel_info is None:
+            channel_info = self.channel_db.get_channel_info(
+                short_channel_id, my_channels=my_channels, private_route_edges=private_route_edges)
         if channel_info is None:
             return float('inf'), 0
-        channel_policy = self.channel_db.get_policy_for_node(
-            short_channel_id, start_node, my_channels=my_channels, private_route_edges=private_route_edges, now=now)
+        if channel_policy is None:
+            channel_policy = self.channel_db.get_policy_for_node(
+                short_channel_id, start_node, my_channels=my_channels, private_route_edges=private_route_edges, now=now)
         if channel_policy is None:
             return float('inf'), 0
         # channels that did not publish both policies often return temporary channel failure
-        channel_policy_backwards = self.channel_db.get_policy_for_node(
-            short_channel_id, end_node, my_channels=my_channels, private_route_edges=private_route_edges, now=now)
+        if channel_policy_backwards is None:
+            channel_policy_backwards = self.channel_db.get_policy_for_node(
+                short_channel_id, end_node, my_channels=my_channels, private_route_edges=private_route_edges, now=now)
         if (channel_policy_backwards is None
                 and not is_mine
                 and short_channel_id not in private_route_edges):
@@ -511,17 +528,22 @@ class LNPathFinder(Logger):
             if node_info:
                 # it's ok if we are missing the node_announcement (node_info) for this node,
                 # but if we have it, we enforce that they support var_onion_optin
-                node_features = LnFeatures(node_info.features)
-                if not node_features.supports(LnFeatures.VAR_ONION_OPT):  # note: this is kind of slow. could be cached.
+                if not _supports_var_onion(node_info.features):
                     return float('inf'), 0
-            route_edge = RouteEdge.from_channel_policy(
-                channel_policy=channel_policy,
-                short_channel_id=short_channel_id,
-                start_node=start_node,
-                end_node=end_node,
-                node_info=node_info)
-        if not route_edge.is_sane_to_use(payment_amt_msat):
-            return float('inf'), 0  # thanks but no thanks
+            # same checks as RouteEdge.is_sane_to_use, without creating
+            # a RouteEdge for each of the edges we look at
+            cltv_delta = channel_policy.cltv_delta
+            fee_msat = fee_for_edge_msat(
+                forwarded_amount_msat=payment_amt_msat,
+                fee_base_msat=channel_policy.fee_base_msat,
+                fee_proportional_millionths=channel_policy.fee_proportional_millionths)
+            if cltv_delta > 14 * 144 or fee_msat > get_default_fee_budget_msat(invoice_amount_msat=payment_amt_msat):
+                return float('inf'), 0  # thanks but no thanks
+        else:
+            if not route_edge.is_sane_to_use(payment_amt_msat):
+                return float('inf'), 0  # thanks but no thanks
+            cltv_delta = route_edge.cltv_delta
+            fee_msat = route_edge.fee_for_edge(payment_amt_msat)
         # Distance metric notes:  # TODO constants are ad-hoc
         # ( somewhat based on https://github.com/lightningnetwork/lnd/pull/1358 )
         # - Edges have a base cost. (more edges -> less likely none will fail)
@@ -530,8 +552,7 @@ class LNPathFinder(Logger):
         # - Paying lower fees is better. :)
         if ignore_costs:
             return DEFAULT_PENALTY_BASE_MSAT, 0
-        fee_msat = route_edge.fee_for_edge(payment_amt_msat)
-        cltv_cost = route_edge.cltv_delta * payment_amt_msat * 15 / 1_000_000_000
+        cltv_cost = cltv_delta * payment_amt_msat * 15 / 1_000_000_000
         # the liquidty penalty takes care we favor edges that should be able to forward
         # the payment and penalize edges that cannot
         liquidity_penalty = self.liquidity_hints.penalty(start_node, end_node, short_channel_id, payment_amt_msat)
@@ -546,52 +567,78 @@ class LNPathFinder(Logger):
             invoice_amount_msat: int,
             my_sending_channels: Dict[ShortChannelID, 'Channel'] = None,
             private_route_edges: Dict[ShortChannelID, RouteEdge] = None,
+            deadline: Optional[float] = None,  # time.monotonic() value
     ) -> Dict[bytes, PathEdge]:
         # note: we don't lock self.channel_db, so while the path finding runs,
         #       the underlying graph could potentially change... (not good but maybe ~OK?)
+        if my_sending_channels is None:
+            my_sending_channels = {}
+        if private_route_edges is None:
+            private_route_edges = {}
+        # Public channels come from the adjacency cache of channel_db. Our own
+        # channels and private route hints are indexed by node once per search.
+        my_channels_for_node = defaultdict(list)  # type: Dict[bytes, List[ShortChannelID]]
+        for chan in my_sending_channels.values():
+            for node_id in (chan.node_id, chan.get_local_pubkey()):
+                my_channels_for_node[node_id].append(chan.short_channel_id)
+        private_channels_for_node = defaultdict(list)  # type: Dict[bytes, List[ShortChannelID]]
+        for route_edge in private_route_edges.values():
+            for node_id in (route_edge.start_node, route_edge.end_node):
+                private_channels_for_node[node_id].append(route_edge.short_channel_id)
 
         # run Dijkstra
         # The search is run in the REVERSE direction, from nodeB to nodeA,
         # to properly calculate compound routing fees.
-        distance_from_start = defaultdict(lambda: float('inf'))
-        distance_from_start[nodeB] = 0
+        distance_from_start = {nodeB: 0}  # type: Dict[bytes, float]
         previous_hops = {}  # type: Dict[bytes, PathEdge]
-        nodes_to_explore = queue.PriorityQueue()
-        nodes_to_explore.put((0, invoice_amount_msat, nodeB))  # order of fields (in tuple) matters!
+        nodes_to_explore = [(0, invoice_amount_msat, nodeB)]  # order of fields (in tuple) matters!
         now = int(time.time())
 
         # main loop of search
-        while nodes_to_explore.qsize() > 0:
-            dist_to_edge_endnode, amount_msat, edge_endnode = nodes_to_explore.get()
+        while nodes_to_explore:
+            if deadline is not None and time.monotonic() > deadline:
+                raise PathFindingTimeout()
+            dist_to_edge_endnode, amount_msat, edge_endnode = heapq.heappop(nodes_to_explore)
             if edge_endnode == nodeA and previous_hops:  # previous_hops check for circular paths
                 self.logger.info("found a path")
                 break
-            if dist_to_edge_endnode != distance_from_start[edge_endnode]:
-                # queue.PriorityQueue does not implement decrease_priority,
+            if dist_to_edge_endnode != distance_from_start.get(edge_endnode, inf):
+                # heapq does not implement decrease_priority,
                 # so instead of decreasing priorities, we add items again into the queue.
                 # so there are duplicates in the queue, that we discard now:
                 continue
 
             if nodeA == nodeB:  # we want circular paths
                 if not previous_hops:  # in the first node exploration step, we only take receiving channels
-                    channels_for_endnode = self.channel_db.get_channels_for_node(
-                        edge_endnode, my_channels={}, private_route_edges=private_route_edges)
+                    extra_channels = private_channels_for_node.get(edge_endnode, [])
                 else:  # in the next steps, we only take sending channels
-                    channels_for_endnode = self.channel_db.get_channels_for_node(
-                        edge_endnode, my_channels=my_sending_channels, private_route_edges={})
+                    extra_channels = my_channels_for_node.get(edge_endnode, [])
             else:
-                channels_for_endnode = self.channel_db.get_channels_for_node(
-                    edge_endnode, my_channels=my_sending_channels, private_route_edges=private_route_edges)
+                extra_channels = my_channels_for_node.get(edge_endnode, []) + private_channels_for_node.get(edge_endnode, [])
+            edges = self.channel_db.get_graph_edges_for_node(edge_endnode)
+            if extra_channels:
+                edges = list(edges)
+                for edge_channel_id in set(extra_channels):
+                    if self.channel_db.get_channel_info(edge_channel_id) is not None:
+                        continue  # public channel, already in edges
+                    channel_info = self.channel_db.get_channel_info(
+                        edge_channel_id, my_channels=my_sending_channels, private_route_edges=private_route_edges)
+                    if channel_info is None:
+                        continue
+                    edge_startnode = channel_info.node2_id if channel_info.node1_id == edge_endnode else channel_info.node1_id
+                    edges.append(GraphEdge(
+                        short_channel_id=edge_channel_id,
+                        start_node=edge_startnode,
+                        channel_info=channel_info,
+                        policy=None,
+                        policy_backwards=None))
 
-            for edge_channel_id in channels_for_endnode:
-                assert isinstance(edge_channel_id, bytes)
+            dist_to_edge_endnode = distance_from_start[edge_endnode]
+            for edge in edges:
+                edge_channel_id = edge.short_channel_id
                 if self._is_edge_blacklisted(edge_channel_id, now=now):
                     continue
-                channel_info = self.channel_db.get_channel_info(
-                    edge_channel_id, my_channels=my_sending_channels, private_route_edges=private_route_edges)
-                if channel_info is None:
-                    continue
-                edge_startnode = channel_info.node2_id if channel_info.node1_id == edge_endnode else channel_info.node1_id
+                edge_startnode = edge.start_node
                 is_mine = edge_channel_id in my_sending_channels
                 if is_mine:
                     if edge_startnode == nodeA:  # payment outgoing, on our channel
@@ -607,20 +654,23 @@ class LNPathFinder(Logger):
                     my_channels=my_sending_channels,
                     private_route_edges=private_route_edges,
                     now=now,
+                    channel_info=edge.channel_info,
+                    channel_policy=edge.policy,
+                    channel_policy_backwards=edge.policy_backwards,
                 )
-                alt_dist_to_neighbour = distance_from_start[edge_endnode] + edge_cost
-                if alt_dist_to_neighbour < distance_from_start[edge_startnode]:
+                alt_dist_to_neighbour = dist_to_edge_endnode + edge_cost
+                if alt_dist_to_neighbour < distance_from_start.get(edge_startnode, inf):
                     distance_from_start[edge_startnode] = alt_dist_to_neighbour
                     previous_hops[edge_startnode] = PathEdge(
                         start_node=edge_startnode,
                         end_node=edge_endnode,
                         short_channel_id=ShortChannelID(edge_channel_id))
                     amount_to_forward_msat = amount_msat + fee_for_edge_msat
-                    nodes_to_explore.put((alt_dist_to_neighbour, amount_to_forward_msat, edge_startnode))
+                    heapq.heappush(nodes_to_explore, (alt_dist_to_neighbour, amount_to_forward_msat, edge_startnode))
             # for circular paths, we already explored the end node, but this
             # is also our start node, so set it to unexplored
             if edge_endnode == nodeB and nodeA == nodeB:
-                distance_from_start[edge_endnode] = float('inf')
+                distance_from_start[edge_endnode] = inf
         return previous_hops
 
     @profiler
@@ -632,6 +682,7 @@ class LNPathFinder(Logger):
             invoice_amount_msat: int,
             my_sending_channels: Dict[ShortChannelID, 'Channel'] = None,
             private_route_edges: Dict[ShortChannelID, RouteEdge] = None,
+            deadline: Optional[float] = None,
     ) -> Optional[LNPaymentPath]:
         """Return a path from nodeA to nodeB."""
         assert type(nodeA) is bytes
@@ -645,7 +696,8 @@ class LNPathFinder(Logger):
             nodeB=nodeB,
             invoice_amount_msat=invoice_amount_msat,
             my_sending_channels=my_sending_channels,
-            private_route_edges=private_route_edges)
+            private_route_edges=private_route_edges,
+            deadline=deadline)
 
         if nodeA not in previous_hops:
             return None  # no path found
@@ -708,6 +760,7 @@ class LNPathFinder(Logger):
             path = None,
             my_sending_channels: Dict[ShortChannelID, 'Channel'] = None,
             private_route_edges: Dict[ShortChannelID, RouteEdge] = None,
+            deadline: Optional[float] = None,
     ) -> Optional[LNPaymentRoute]:
         route = None
         if not path:
@@ -716,7 +769,8 @@ class LNPathFinder(Logger):
                 nodeB=nodeB,
                 invoice_amount_msat=invoice_amount_msat,
                 my_sending_channels=my_sending_channels,
-                private_route_edges=private_route_edges)
+                private_route_edges=private_route_edges,
+                deadline=deadline)
         if path:
             route = self.create_route_from_path(
                 path, my_channels=my_sending_channels, private_route_edges=private_route_edges)
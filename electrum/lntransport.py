@@ -94,6 +94,7 @@ class LNTransportBase:
     writer: StreamWriter
     privkey: bytes
     peer_addr: Optional[LNPeerAddr] = None
+    READ_SIZE = 2**16  # max bytes per read from the socket, unless a message needs more
 
     def name(self) -> str:
         pubkey = self.remote_pubkey()
@@ -115,29 +116,48 @@ class LNTransportBase:
         self.writer.write(lc+c)
 
     async def read_messages(self):
+        async for msgs in self.read_message_batches():
+            for msg in msgs:
+                yield msg
+
+    async def read_message_batches(self):
+        """Yields lists of messages, decrypted from what was read from the socket.
+
+        We read as much as is available, at least what the message being
+        received still needs. Ciphertexts are decrypted from memoryviews of
+        the buffer, and the buffer is only compacted once per read.
+        """
         buffer = bytearray()
+        length = None  # of the next message, once its length prefix is decrypted
         while True:
-            rn_l, rk_l = self.rn()
-            rn_m, rk_m = self.rn()
-            while True:
-                if len(buffer) >= 18:
-                    lc = bytes(buffer[:18])
-                    l = aead_decrypt(rk_l, rn_l, b'', lc)
-                    length = int.from_bytes(l, 'big')
-                    offset = 18 + length + 16
-                    if len(buffer) >= offset:
-                        c = bytes(buffer[18:offset])
-                        del buffer[:offset]  # much faster than: buffer=buffer[offset:]
-                        msg = aead_decrypt(rk_m, rn_m, b'', c)
-                        yield msg
+            msgs = []
+            pos = 0
+            with memoryview(buffer) as view:
+                while True:
+                    if length is None:
+                        if len(buffer) - pos < 18:
+                            break
+                        rn_l, rk_l = self.rn()
+                        l = aead_decrypt(rk_l, rn_l, b'', view[pos:pos+18])
+                        length = int.from_bytes(l, 'big')
+                        pos += 18
+                    if len(buffer) - pos < length + 16:
                         break
-                try:
-                    s = await self.reader.read(2**10)
-                except Exception:
-                    s = None
-                if not s:
-                    raise LightningPeerConnectionClosed()
-                buffer += s
+                    rn_m, rk_m = self.rn()
+                    msgs.append(aead_decrypt(rk_m, rn_m, b'', view[pos:pos+length+16]))
+                    pos += length + 16
+                    length = None
+            del buffer[:pos]  # much faster than: buffer=buffer[pos:]
+            if msgs:
+                yield msgs
+            needed = (18 if length is None else length + 16) - len(buffer)
+            try:
+                s = await self.reader.read(max(self.READ_SIZE, needed))
+            except Exception:
+                s = None
+            if not s:
+                raise LightningPeerConnectionClosed()
+            buffer += s
 
     def rn(self):
         o = self._rn, self.rk
@@ -84,13 +84,13 @@ from .channel_db import UpdateStatus, ChannelDBNotLoaded
 from .channel_db import get_mychannel_info, get_mychannel_policy
 from .submarine_swaps import SwapManager
 from .channel_db import ChannelInfo, Policy
+from .channel_db import ChannelDB, GOSSIP_VERIFY_BATCH_SIZE, verify_gossip_signatures, get_gossip_verify_executor
 from .mpp_split import suggest_splits, SplitConfigRating
 from .trampoline import create_trampoline_route_and_onion, TRAMPOLINE_FEES, is_legacy_relay
 
 if TYPE_CHECKING:
     from .network import Network
     from .wallet import Abstract_Wallet
-    from .channel_db import ChannelDB
     from .simple_config import SimpleConfig
 
 
@@ -563,6 +563,13 @@ class LNGossip(LNWorker):
         node_keypair = generate_keypair(BIP32Node.from_xkey(xprv), LnKeyFamily.NODE_KEY)
         LNWorker.__init__(self, node_keypair, LNGOSSIP_FEATURES, config=config)
         self.unknown_ids = set()
+        # gossip signature verification. batches in flight are limited, so that
+        # peers sending faster than we can verify get back-pressure
+        num_processes = self.config.LIGHTNING_GOSSIP_VERIFY_PROCESSES
+        self._gossip_verify_semaphore = asyncio.Semaphore(max(1, num_processes) * 2)
+        self._gossip_verify_start_time = time.monotonic()
+        self.num_gossip_verified = 0
+        self.num_gossip_rejected = 0
 
     def start_network(self, network: 'Network'):
         super().start_network(network)
@@ -579,8 +586,46 @@ class LNGossip(LNWorker):
             if len(self.unknown_ids) == 0:
                 self.channel_db.prune_old_policies(self.max_age)
                 self.channel_db.prune_orphaned_channels()
+            verified_rate, rejected_rate = self.get_gossip_verify_rates()
+            self.logger.info(
+                f"gossip signatures: {self.num_gossip_verified} verified ({verified_rate:.1f} msg/s), "
+                f"{self.num_gossip_rejected} rejected ({rejected_rate:.1f} msg/s)")
             await asyncio.sleep(120)
 
+    def get_gossip_verify_rates(self) -> Tuple[float, float]:
+        """Returns the number of gossip messages verified and rejected
+        per second, on average since startup.
+        """
+        elapsed = max(time.monotonic() - self._gossip_verify_start_time, 1e-6)
+        return self.num_gossip_verified / elapsed, self.num_gossip_rejected / elapsed
+
+    async def _verify_gossip(self, payloads: Sequence[dict], get_signatures) -> None:
+        """Verifies the signatures of gossip messages in batches, using a
+        process pool if configured. Raises InvalidGossipMsg if any is invalid.
+        """
+        if not payloads:
+            return
+        items = [get_signatures(payload) for payload in payloads]
+        executor = get_gossip_verify_executor(self.config.LIGHTNING_GOSSIP_VERIFY_PROCESSES)
+        loop = asyncio.get_running_loop()
+
+        async def verify_batch(batch):
+            async with self._gossip_verify_semaphore:
+                if executor is None:
+                    return await run_in_thread(partial(verify_gossip_signatures, batch))
+                return await loop.run_in_executor(executor, verify_gossip_signatures, batch)
+
+        start_time = time.monotonic()
+        results = await asyncio.gather(*[verify_batch(batch) for batch in chunks(items, GOSSIP_VERIFY_BATCH_SIZE)])
+        num_valid = sum(sum(batch_results) for batch_results in results)
+        num_rejected = len(items) - num_valid
+        self.num_gossip_verified += num_valid
+        self.num_gossip_rejected += num_rejected
+        elapsed = max(time.monotonic() - start_time, 1e-6)
+        self.logger.debug(f'verified {len(items)} gossip signatures in {elapsed:.3f} sec ({len(items) / elapsed:.0f} msg/s)')
+        if num_rejected:
+            raise InvalidGossipMsg('signature failed')
+
     async def add_new_ids(self, ids: Iterable[bytes]):
         known = self.channel_db.get_channel_ids()
         new = set(ids) - set(known)
@@ -626,22 +671,22 @@ class LNGossip(LNWorker):
         await self.channel_db.data_loaded.wait()
         self.logger.debug(f'process_gossip {len(chan_anns)} {len(node_anns)} {len(chan_upds)}')
         # channel announcements
-        def process_chan_anns():
-            for payload in chan_anns:
-                self.channel_db.verify_channel_announcement(payload)
-            self.channel_db.add_channel_announcements(chan_anns)
-        await run_in_thread(process_chan_anns)
+        await self._verify_gossip(chan_anns, ChannelDB.get_signatures_of_channel_announcement)
+        await run_in_thread(partial(self.channel_db.add_channel_announcements, chan_anns))
         # node announcements
-        def process_node_anns():
-            for payload in node_anns:
-                self.channel_db.verify_node_announcement(payload)
-            self.channel_db.add_node_announcements(node_anns)
-        await run_in_thread(process_node_anns)
+        await self._verify_gossip(node_anns, ChannelDB.get_signatures_of_node_announcement)
+        await run_in_thread(partial(self.channel_db.add_node_announcements, node_anns))
         # channel updates
+        to_verify = await run_in_thread(partial(
+            self.channel_db.get_channel_updates_to_verify,
+            chan_upds,
+            max_age=self.max_age))
+        await self._verify_gossip(to_verify, ChannelDB.get_signatures_of_channel_update)
         categorized_chan_upds = await run_in_thread(partial(
             self.channel_db.add_channel_updates,
             chan_upds,
-            max_age=self.max_age))
+            max_age=self.max_age,
+            verified_sigs={(payload['raw'], payload['start_node']) for payload in to_verify}))
         orphaned = categorized_chan_upds.orphaned
         if orphaned:
             self.logger.info(f'adding {len(orphaned)} unknown channel ids')
@@ -1925,6 +1970,10 @@ class LNWallet(LNWorker):
                 chan.is_active() and not chan.is_frozen_for_sending()]
         # try random order
         random.shuffle(my_active_channels)
+        deadline = time.monotonic() + self.config.LIGHTNING_PATHFINDING_TIMEOUT
+        # path finding tasks, by (sending channel, amount, fee budget) of a part.
+        # split configurations often have parts in common, these are only searched once.
+        route_tasks = {}  # type: Dict[Tuple[Optional[bytes], int, PaymentFeeBudget], asyncio.Future]
         split_configurations = self.suggest_splits(
             amount_msat=amount_msat,
             final_total_msat=paysession.amount_to_pay,
@@ -2019,34 +2068,47 @@ class LNWallet(LNWorker):
                             raise NoPathFound()
                 else:
                     # We atomically loop through a split configuration. If there was
-                    # a failure to find a path for a single part, we try the next configuration
+                    # a failure to find a path for a single part, we try the next configuration.
+                    # Paths for the parts are searched for concurrently, in the executor.
+                    part_budget = budget._replace(fee_msat=budget.fee_msat // sc.config.number_parts())
+                    parts = []
                     for (chan_id, _), part_amounts_msat in sc.config.items():
                         for part_amount_msat in part_amounts_msat:
-                            channel = self.channels[chan_id]
-                            route = await run_in_thread(
-                                partial(
-                                    self.create_route_for_single_htlc,
-                                    amount_msat=part_amount_msat,
-                                    invoice_pubkey=paysession.invoice_pubkey,
-                                    min_final_cltv_delta=paysession.min_final_cltv_delta,
-                                    r_tags=paysession.r_tags,
-                                    invoice_features=paysession.invoice_features,
-                                    my_sending_channels=[channel] if is_multichan_mpp else my_active_channels,
-                                    full_path=full_path,
-                                    budget=budget._replace(fee_msat=budget.fee_msat // sc.config.number_parts()),
-                                )
-                            )
-                            shi = SentHtlcInfo(
-                                route=route,
-                                payment_secret_orig=paysession.payment_secret,
-                                payment_secret_bucket=paysession.payment_secret,
-                                amount_msat=part_amount_msat,
-                                bucket_msat=paysession.amount_to_pay,
-                                amount_receiver_msat=part_amount_msat,
-                                trampoline_fee_level=None,
-                                trampoline_route=None,
-                            )
-                            routes.append((shi, paysession.min_final_cltv_delta, fwd_trampoline_onion))
+                            key = (chan_id if is_multichan_mpp else None, part_amount_msat, part_budget)
+                            if key not in route_tasks:
+                                channel = self.channels[chan_id]
+                                route_tasks[key] = asyncio.ensure_future(run_in_thread(
+                                    partial(
+                                        self.create_route_for_single_htlc,
+                                        amount_msat=part_amount_msat,
+                                        invoice_pubkey=paysession.invoice_pubkey,
+                                        min_final_cltv_delta=paysession.min_final_cltv_delta,
+                                        r_tags=paysession.r_tags,
+                                        invoice_features=paysession.invoice_features,
+                                        my_sending_channels=[channel] if is_multichan_mpp else my_active_channels,
+                                        full_path=full_path,
+                                        budget=part_budget,
+                                        deadline=deadline,
+                                    )
+                                ))
+                            parts.append((part_amount_msat, route_tasks[key]))
+                    # wait for all parts, so that no task is left behind with an unretrieved exception
+                    part_routes = await asyncio.gather(*[task for _, task in parts], return_exceptions=True)
+                    for route in part_routes:
+                        if isinstance(route, BaseException):
+                            raise route
+                    for (part_amount_msat, _), route in zip(parts, part_routes):
+                        shi = SentHtlcInfo(
+                            route=list(route),
+                            payment_secret_orig=paysession.payment_secret,
+                            payment_secret_bucket=paysession.payment_secret,
+                            amount_msat=part_amount_msat,
+                            bucket_msat=paysession.amount_to_pay,
+                            amount_receiver_msat=part_amount_msat,
+                            trampoline_fee_level=None,
+                            trampoline_route=None,
+                        )
+                        routes.append((shi, paysession.min_final_cltv_delta, fwd_trampoline_onion))
             except NoPathFound:
                 continue
             for route in routes:
@@ -2065,6 +2127,7 @@ class LNWallet(LNWorker):
             my_sending_channels: List[Channel],
             full_path: Optional[LNPaymentPath],
             budget: PaymentFeeBudget,
+            deadline: Optional[float] = None,
     ) -> LNPaymentRoute:
 
         my_sending_aliases = set(chan.get_local_scid_alias() for chan in my_sending_channels)
@@ -2115,7 +2178,8 @@ class LNWallet(LNWorker):
                 invoice_amount_msat=amount_msat,
                 path=full_path,
                 my_sending_channels=my_sending_channels,
-                private_route_edges=private_route_edges)
+                private_route_edges=private_route_edges,
+                deadline=deadline)
         except NoChannelPolicy as e:
             raise NoPathFound() from e
         if not route:
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+#
+# Benchmarks the capital gains computation of get_detailed_history over a
+# synthetic wallet, where most txs are receives and the others spend a few
+# coins of the wallet, with change. Historical rates are served from memory.
+# The fiat fields of the history items are computed with per-tx lookups,
+# and with a CostBasis pass in 'average' and 'fifo' modes.
+#
+# usage: bench_cost_basis.py [num_txs]
+
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from electrum import keystore, util
+from electrum.bitcoin import address_to_script
+from electrum.cost_basis import CostBasis
+from electrum.exchange_rate import ExchangeBase, FxThread
+from electrum.simple_config import SimpleConfig
+from electrum.transaction import Transaction
+from electrum.util import TxMinedInfo
+from electrum.wallet import Standard_Wallet
+from electrum.wallet_db import WalletDB
+
+
+class BenchFx:
+    ccy = 'USD'
+    history_used_spot = False
+
+    def __init__(self, history):
+        self.exchange = ExchangeBase(None, None)
+        self.exchange._history = {self.ccy: history}
+
+    def is_enabled(self):
+        return True
+
+    def has_history(self):
+        return True
+
+    history_rate = FxThread.history_rate
+    timestamp_rate = FxThread.timestamp_rate
+    timestamp_rates = FxThread.timestamp_rates
+    fiat_value = FxThread.fiat_value
+    historical_value = FxThread.historical_value
+
+
+def serialize_tx(inputs, outputs, locktime: int) -> str:
+    raw = b'\x02\x00\x00\x00' + bytes([len(inputs)])
+    for prev_txid, prev_idx in inputs:
+        raw += prev_txid[::-1] + prev_idx.to_bytes(4, 'little') + b'\x00' + b'\xff' * 4
+    raw += bytes([len(outputs)])
+    for value, spk in outputs:
+        raw += value.to_bytes(8, 'little') + bytes([len(spk)]) + spk
+    return (raw + locktime.to_bytes(4, 'little')).hex()
+
+
+def make_synthetic_wallet(wallet: Standard_Wallet, num_txs: int) -> None:
+    rnd = random.Random(0)
+    addrs = wallet.get_receiving_addresses()
+    coins = []  # (txid, index, value) of our unspent outputs
+    for i in range(num_txs):
+        spk = bytes.fromhex(address_to_script(addrs[i % len(addrs)]))
+        if len(coins) < 3 or rnd.random() < 0.7:
+            value = rnd.randrange(10**5, 10**7)
+            tx = Transaction(serialize_tx([(rnd.randbytes(32), 0)], [(value, spk)], i))
+        else:
+            spent = [coins.pop(rnd.randrange(len(coins))) for _ in range(rnd.randint(1, 3))]
+            total = sum(v for _, _, v in spent)
+            value = total // rnd.randint(2, 4)
+            payment = b'\x76\xa9\x14' + rnd.randbytes(20) + b'\x88\xac'
+            tx = Transaction(serialize_tx(
+                [(bytes.fromhex(txid), idx) for txid, idx, _ in spent],
+                [(value, spk), (total - value - 500, payment)], i))
+        txid = tx.txid()
+        coins.append((txid, 0, value))
+        wallet.adb.add_transaction(tx)
+        wallet.adb.add_verified_tx(txid, TxMinedInfo(
+            height=100 + i // 10, timestamp=1_500_000_000 + i * 3600, txpos=i % 10, header_hash='00'*32))
+    wallet.db.put('stored_height', 100 + num_txs // 10)
+
+
+def make_rates(num_txs: int):
+    rnd = random.Random(1)
+    history = {}
+    rate = 5000.0
+    for day in range(1_500_000_000 // 86400 - 1, (1_500_000_000 + num_txs * 3600) // 86400 + 2):
+        rate *= 1 + rnd.gauss(0, 0.03)
+        date = datetime.fromtimestamp(day * 86400, timezone.utc)
+        history[date.strftime('%Y-%m-%d')] = str(round(rate, 2))
+    return history
+
+
+def fiat_fields(wallet: Standard_Wallet, fx: BenchFx, method: str = None):
+    cost_basis = CostBasis(wallet, fx, method=method) if method else None
+    wallet._coin_price_cache.clear()
+    for item in wallet.get_onchain_history():
+        wallet.get_tx_item_fiat(
+            tx_hash=item['txid'], amount_sat=item['bc_value'].value, fx=fx, tx_fee=item['fee_sat'],
+            cost_basis=cost_basis)
+    coins = wallet.get_utxos()
+    if cost_basis:
+        cost_basis.get_holdings_acquisition_price(coins, None)
+    else:
+        wallet.acquisition_price(coins, fx.timestamp_rate, fx.ccy)
+
+
+def main():
+    num_txs = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        config = SimpleConfig({'electrum_path': tmp_dir})
+        db = WalletDB('', storage=None, upgrade=True)
+        ks = keystore.from_seed('cycle rocket west magnet parrot shuffle foot correct salt library feed song', passphrase='')
+        db.put('keystore', ks.dump())
+        db.put('gap_limit', 20)
+        wallet = Standard_Wallet(db, config=config)
+        print(f"building synthetic wallet with {num_txs} txs...")
+        make_synthetic_wallet(wallet, num_txs)
+        fx = BenchFx(make_rates(num_txs))
+        list(wallet.get_onchain_history())  # warm up the history cache
+        for method in (None, 'average', 'fifo'):
+            label = method or 'per-tx lookups'
+            t0 = time.monotonic()
+            try:
+                fiat_fields(wallet, fx, method)
+            except RecursionError:
+                print(f"{label:>15}: RecursionError after {time.monotonic() - t0:.2f} sec")
+                continue
+            dt = time.monotonic() - t0
+            if method is None:
+                print(f"{label:>15}: {dt:.2f} sec")
+                continue
+            t0 = time.monotonic()
+            h = wallet.get_detailed_history(fx=fx, cost_basis=method)
+            dt2 = time.monotonic() - t0
+            print(f"{label:>15}: {dt:.2f} sec, get_detailed_history {dt2:.2f} sec, "
+                  f"realized capital gains {h['summary']['flow']['realized_capital_gains'].value:.2f}")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    loop, stopping_fut, loop_thread = util.create_and_start_event_loop()
+    try:
+        main()
+    finally:
+        loop.call_soon_threadsafe(stopping_fut.set_result, 1)
+        loop_thread.join()
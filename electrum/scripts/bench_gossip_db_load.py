@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+#
+# Benchmarks ChannelDB.load_data over a synthetic gossip_db.
+# Compares a full decode of the stored messages against loading the snapshot.
+#
+# usage: bench_gossip_db_load.py [num_channels]
+
+import asyncio
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+from electrum import constants, channel_db, util
+from electrum.channel_db import ChannelDB
+from electrum.lnmsg import encode_msg
+from electrum.lnutil import ShortChannelID
+from electrum.simple_config import SimpleConfig
+
+
+def node_id(i: int) -> bytes:
+    return b'\x02' + i.to_bytes(32, 'big')
+
+
+def make_synthetic_db(path: str, num_channels: int) -> None:
+    chain_hash = constants.net.rev_genesis_bytes()
+    conn = sqlite3.connect(path)
+    for create in (channel_db.create_channel_info, channel_db.create_policy,
+                   channel_db.create_node_info, channel_db.create_address):
+        conn.execute(create)
+    num_nodes = max(2, num_channels // 5)
+    for i in range(num_channels):
+        scid = ShortChannelID.from_components(700_000 + i // 1000, i % 1000, 0)
+        node1, node2 = sorted([node_id(i % num_nodes), node_id((i + 1) % num_nodes)])
+        msg = encode_msg(
+            'channel_announcement', len=0, features=b'', chain_hash=chain_hash, short_channel_id=scid,
+            node_id_1=node1, node_id_2=node2, bitcoin_key_1=node1, bitcoin_key_2=node2)
+        conn.execute("INSERT INTO channel_info (short_channel_id, msg) VALUES (?,?)", (scid, msg))
+        for direction, start_node in enumerate([node1, node2]):
+            msg = encode_msg(
+                'channel_update', short_channel_id=scid, channel_flags=bytes([direction]), message_flags=b'\x01',
+                cltv_expiry_delta=40, htlc_minimum_msat=1000, htlc_maximum_msat=10**9, fee_base_msat=1000,
+                fee_proportional_millionths=i % 1000, chain_hash=chain_hash, timestamp=1_700_000_000 + i)
+            conn.execute("INSERT INTO policy (key, msg) VALUES (?,?)", (scid + start_node, msg))
+    for i in range(num_nodes):
+        msg = encode_msg(
+            'node_announcement', flen=0, features=b'', timestamp=1_700_000_000 + i, rgb_color=bytes(3),
+            node_id=node_id(i), alias=f'node{i}'.encode().ljust(32, b'\x00'), addrlen=0, addresses=b'')
+        conn.execute("INSERT INTO node_info (node_id, msg) VALUES (?,?)", (node_id(i), msg))
+    conn.commit()
+    conn.close()
+
+
+async def bench_load_data(config: SimpleConfig) -> float:
+    class FakeNetwork:
+        asyncio_loop = util.get_asyncio_loop()
+        interface = None
+    network = FakeNetwork()
+    network.config = config
+    cdb = ChannelDB(network)
+    t0 = time.monotonic()
+    await cdb.load_data()
+    dt = time.monotonic() - t0
+    cdb.stop()
+    await cdb.stopped_event.wait()
+    return dt
+
+
+async def main():
+    num_channels = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        config = SimpleConfig({'electrum_path': tmp_dir})
+        path = ChannelDB.get_file_path(config)
+        print(f"building synthetic gossip_db with {num_channels} channels...")
+        make_synthetic_db(path, num_channels)
+        dt = await bench_load_data(config)
+        print(f"full decode: {dt:.2f} sec")
+        dt = await bench_load_data(config)
+        print(f"snapshot:    {dt:.2f} sec")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    loop, stopping_fut, loop_thread = util.create_and_start_event_loop()
+    try:
+        asyncio.run_coroutine_threadsafe(main(), loop).result()
+    finally:
+        loop.call_soon_threadsafe(stopping_fut.set_result, 1)
+        loop_thread.join()
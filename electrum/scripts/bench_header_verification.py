@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+#
+# Benchmarks header chunk verification over a synthetic regtest chain.
+# Compares hashing in-process against hashing in a process pool.
+#
+# usage: bench_header_verification.py [num_headers] [num_processes]
+
+import os
+import sys
+import shutil
+import tempfile
+import time
+
+from electrum import constants, blockchain
+from electrum.blockchain import Blockchain, HEADER_SIZE
+from electrum.simple_config import SimpleConfig
+from electrum.util import bfh, make_dir
+
+
+# regtest genesis
+GENESIS_HEADER = bfh("0100000000000000000000000000000000000000000000000000000000000000000000003ba3edfd7a7b12b27ac72c3e67768f617fc81bc3888a51323a9fb8aa4b1e5e4adae5494dffff7f2002000000")
+
+
+def make_synthetic_chain(num_headers: int) -> bytes:
+    headers = [GENESIS_HEADER]
+    prev_hash = blockchain.hash_raw_headers(GENESIS_HEADER)[0]
+    timestamp = int.from_bytes(GENESIS_HEADER[68:72], byteorder='little')
+    for height in range(1, num_headers):
+        header = (int(0x20000000).to_bytes(4, byteorder='little')
+                  + prev_hash
+                  + height.to_bytes(32, byteorder='little')  # merkle root
+                  + (timestamp + 600 * height).to_bytes(4, byteorder='little')
+                  + int(0x207fffff).to_bytes(4, byteorder='little')
+                  + int(0).to_bytes(4, byteorder='little'))
+        headers.append(header)
+        prev_hash = blockchain.hash_raw_headers(header)[0]
+    return b''.join(headers)
+
+
+def new_chain(data_dir: str) -> Blockchain:
+    shutil.rmtree(data_dir, ignore_errors=True)
+    make_dir(data_dir)
+    make_dir(os.path.join(data_dir, 'forks'))
+    config = SimpleConfig({'electrum_path': data_dir})
+    blockchain.blockchains = {}
+    chain = Blockchain(config=config, forkpoint=0, parent=None,
+                       forkpoint_hash=constants.net.GENESIS, prev_hash=None)
+    blockchain.blockchains[constants.net.GENESIS] = chain
+    open(chain.path(), 'w+').close()
+    chain.update_size()
+    return chain
+
+
+def split_chunks(data: bytes):
+    chunk_size = 2016 * HEADER_SIZE
+    return [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+
+
+def bench_in_process(chain: Blockchain, chunks) -> float:
+    t0 = time.monotonic()
+    for index, chunk in enumerate(chunks):
+        assert chain.connect_chunk(index, chunk.hex())
+    return time.monotonic() - t0
+
+
+def bench_process_pool(chain: Blockchain, chunks, num_processes: int) -> float:
+    executor = blockchain.get_header_hash_executor(num_processes)
+    assert executor is not None
+    executor.submit(int).result()  # warm up workers
+    t0 = time.monotonic()
+    futures = [executor.submit(blockchain.hash_raw_headers, chunk) for chunk in chunks]
+    for index, (chunk, fut) in enumerate(zip(chunks, futures)):
+        assert chain.connect_chunk(index, chunk.hex(), header_hashes=fut.result())
+    return time.monotonic() - t0
+
+
+def main():
+    num_headers = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    num_processes = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+    constants.set_regtest()
+    print(f"building synthetic chain of {num_headers} headers...")
+    chunks = split_chunks(make_synthetic_chain(num_headers))
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        dt = bench_in_process(new_chain(os.path.join(tmp_dir, 'a')), chunks)
+        print(f"in-process:        {dt:.2f} sec, {num_headers / dt:.0f} headers/sec")
+        dt = bench_process_pool(new_chain(os.path.join(tmp_dir, 'b')), chunks, num_processes)
+        print(f"{num_processes} processes:       {dt:.2f} sec, {num_headers / dt:.0f} headers/sec")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        executor = blockchain.get_header_hash_executor(num_processes)
+        if executor is not None:
+            executor.shutdown()
+
+
+if __name__ == '__main__':
+    main()
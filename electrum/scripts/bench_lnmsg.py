@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+#
+# Micro-benchmark of lnmsg decode_msg/encode_msg, with and without
+# compiled message schemes.
+#
+# The corpus is read from the channel_info, node_info and policy tables
+# of a gossip_db file (e.g. ~/.electrum/testnet/gossip_db), if one is given.
+# Otherwise a synthetic corpus of gossip and htlc messages is used.
+#
+# usage: bench_lnmsg.py [gossip_db]
+
+import os
+import random
+import sqlite3
+import sys
+import time
+from typing import List
+
+from electrum import constants
+from electrum.lnmsg import LNSerializer
+from electrum.lnutil import ShortChannelID
+
+
+def read_gossip_db(path: str) -> List[bytes]:
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        msgs = []
+        for table in ('channel_info', 'node_info', 'policy'):
+            msgs += [r[0] for r in conn.execute(f"SELECT msg FROM {table}")]
+        return msgs
+    finally:
+        conn.close()
+
+
+def make_synthetic_corpus(num_msgs: int) -> List[bytes]:
+    rnd = random.Random(0)
+    ser = LNSerializer()
+    chain_hash = constants.net.rev_genesis_bytes()
+    msgs = []
+    for i in range(num_msgs):
+        scid = ShortChannelID.from_components(700_000 + i // 1000, i % 1000, 0)
+        kind = i % 8
+        if kind == 0:
+            msgs.append(ser.encode_msg(
+                'channel_announcement', len=0, features=b'', chain_hash=chain_hash, short_channel_id=scid,
+                node_id_1=rnd.randbytes(33), node_id_2=rnd.randbytes(33),
+                bitcoin_key_1=rnd.randbytes(33), bitcoin_key_2=rnd.randbytes(33)))
+        elif kind == 1:
+            msgs.append(ser.encode_msg(
+                'node_announcement', flen=2, features=b'\x02\x00', timestamp=1_700_000_000 + i,
+                rgb_color=bytes(3), node_id=rnd.randbytes(33), alias=f'node{i}'.encode().ljust(32, b'\x00'),
+                addrlen=7, addresses=b'\x01' + rnd.randbytes(4) + b'\x26\x07'))
+        elif kind == 2:
+            msgs.append(ser.encode_msg(
+                'update_add_htlc', channel_id=rnd.randbytes(32), id=i, amount_msat=rnd.randrange(10**9),
+                payment_hash=rnd.randbytes(32), cltv_expiry=800_000, onion_routing_packet=rnd.randbytes(1366)))
+        else:
+            msgs.append(ser.encode_msg(
+                'channel_update', short_channel_id=scid, channel_flags=bytes([i % 2]), message_flags=b'\x01',
+                cltv_expiry_delta=40, htlc_minimum_msat=1000, htlc_maximum_msat=10**9, fee_base_msat=1000,
+                fee_proportional_millionths=rnd.randrange(1000), chain_hash=chain_hash, timestamp=1_700_000_000 + i))
+    return msgs
+
+
+def bench(ser: LNSerializer, msgs: List[bytes]):
+    t0 = time.monotonic()
+    decoded = [ser.decode_msg(msg) for msg in msgs]
+    t_decode = time.monotonic() - t0
+    t0 = time.monotonic()
+    for msg_type, payload in decoded:
+        ser.encode_msg(msg_type, **payload)
+    t_encode = time.monotonic() - t0
+    return t_decode, t_encode
+
+
+def main():
+    if len(sys.argv) > 1:
+        msgs = read_gossip_db(sys.argv[1])
+        print(f"read {len(msgs)} messages from {sys.argv[1]}")
+    else:
+        constants.set_testnet()
+        msgs = make_synthetic_corpus(100_000)
+        print(f"synthetic corpus of {len(msgs)} messages")
+    for name, ser in (('generic', LNSerializer(compile_schemes=False)), ('compiled', LNSerializer())):
+        t_decode, t_encode = bench(ser, msgs)
+        print(f"{name:>8}: decode {t_decode:.2f} sec ({len(msgs) / t_decode:.0f} msg/s), "
+              f"encode {t_encode:.2f} sec ({len(msgs) / t_encode:.0f} msg/s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+#
+# Benchmarks the read path of LNTransport over a loopback connection.
+# The client sends a stream of encrypted gossip-sized messages, the
+# server reads them with read_messages(), first with 1 KiB reads, then
+# with the default read size.
+#
+# usage: bench_lntransport.py [num_messages]
+
+import asyncio
+import os
+import random
+import sys
+import time
+
+from electrum.ecc import ECPrivkey
+from electrum.lnutil import LNPeerAddr
+from electrum.lntransport import LNResponderTransport, LNTransport, LNTransportBase
+
+
+async def bench(num_messages: int, msgs) -> float:
+    responder_key = ECPrivkey.generate_random_key()
+    initiator_key = ECPrivkey.generate_random_key()
+    done = asyncio.get_running_loop().create_future()
+
+    async def cb(reader, writer):
+        t = LNResponderTransport(responder_key.get_secret_bytes(), reader, writer)
+        await t.handshake()
+        t0 = time.monotonic()
+        num_read = 0
+        async for msg in t.read_messages():
+            num_read += 1
+            if num_read == num_messages:
+                break
+        done.set_result(time.monotonic() - t0)
+        t.close()
+
+    server = await asyncio.start_server(cb, '127.0.0.1', port=None)
+    try:
+        port = server.sockets[0].getsockname()[1]
+        peer_addr = LNPeerAddr('127.0.0.1', port, responder_key.get_public_key_bytes())
+        t = LNTransport(initiator_key.get_secret_bytes(), peer_addr, proxy=None)
+        await t.handshake()
+        # encrypt everything first, so that we only measure the reading side
+        writer, data = t.writer, bytearray()
+        t.writer = type('Buffer', (), {'write': data.extend})
+        for i in range(num_messages):
+            t.send_bytes(msgs[i % len(msgs)])
+        t.writer = writer
+        writer.write(data)
+        await writer.drain()
+        dt = await done
+        t.close()
+        return dt
+    finally:
+        server.close()
+
+
+async def main():
+    num_messages = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    rnd = random.Random(0)
+    # sizes of channel_update, node_announcement and channel_announcement messages
+    msgs = [os.urandom(rnd.choice([138, 140, 150, 230, 432])) for _ in range(1000)]
+    num_bytes = sum(len(msgs[i % len(msgs)]) for i in range(num_messages))
+    for label, read_size in (('1 KiB reads', 2**10), ('default reads', LNTransportBase.READ_SIZE)):
+        LNTransportBase.READ_SIZE = read_size
+        dt = await bench(num_messages, msgs)
+        print(f"{label:>14}: {num_messages / dt:.0f} msg/s, {num_bytes / dt / 2**20:.1f} MiB/s")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+#
+# Benchmarks LNPathFinder.find_path_for_payment over a synthetic graph.
+# The first searches also build the adjacency cache of ChannelDB.
+#
+# usage: bench_pathfinding.py [num_nodes] [num_channels] [num_searches]
+
+import asyncio
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from electrum import constants, util
+from electrum.channel_db import ChannelDB
+from electrum.lnrouter import LNPathFinder
+from electrum.lnutil import ShortChannelID
+from electrum.simple_config import SimpleConfig
+
+
+def node_id(i: int) -> bytes:
+    return b'\x02' + i.to_bytes(32, 'big')
+
+
+def make_synthetic_graph(cdb: ChannelDB, num_nodes: int, num_channels: int) -> None:
+    rnd = random.Random(0)
+    chain_hash = constants.net.rev_genesis_bytes()
+    for i in range(num_channels):
+        # preferential attachment, so that the graph has hubs like the real one
+        a = rnd.randrange(num_nodes)
+        b = int(num_nodes * rnd.random() ** 3)
+        if a == b:
+            continue
+        node1, node2 = sorted([node_id(a), node_id(b)])
+        scid = ShortChannelID.from_components(700_000 + i // 1000, i % 1000, 0)
+        cdb.add_channel_announcements({
+            'node_id_1': node1, 'node_id_2': node2,
+            'bitcoin_key_1': node1, 'bitcoin_key_2': node2,
+            'short_channel_id': scid, 'chain_hash': chain_hash,
+            'len': 0, 'features': b''
+        }, trusted=True)
+        for direction in (0, 1):
+            cdb.add_channel_update({
+                'short_channel_id': scid, 'message_flags': b'\x00', 'channel_flags': bytes([direction]),
+                'cltv_expiry_delta': rnd.choice([40, 80, 144]), 'htlc_minimum_msat': 1,
+                'fee_base_msat': rnd.randrange(1000), 'fee_proportional_millionths': rnd.randrange(500),
+                'chain_hash': chain_hash, 'timestamp': int(time.time())}, verify=False, verbose=False)
+
+
+async def main():
+    num_nodes = int(sys.argv[1]) if len(sys.argv) > 1 else 15_000
+    num_channels = int(sys.argv[2]) if len(sys.argv) > 2 else 60_000
+    num_searches = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        class FakeNetwork:
+            asyncio_loop = util.get_asyncio_loop()
+            interface = None
+            config = SimpleConfig({'electrum_path': tmp_dir})
+        cdb = ChannelDB(FakeNetwork())
+        cdb.data_loaded.set()
+        print(f"building synthetic graph with {num_nodes} nodes and {num_channels} channels...")
+        make_synthetic_graph(cdb, num_nodes, num_channels)
+        path_finder = LNPathFinder(cdb)
+        rnd = random.Random(1)
+        for label in ('cold cache', 'warm cache'):
+            found = 0
+            t0 = time.monotonic()
+            for _ in range(num_searches):
+                path = path_finder.find_path_for_payment(
+                    nodeA=node_id(rnd.randrange(num_nodes)),
+                    nodeB=node_id(rnd.randrange(num_nodes)),
+                    invoice_amount_msat=100_000_000)
+                found += path is not None
+            dt = time.monotonic() - t0
+            print(f"{label}: {1000 * dt / num_searches:.1f} ms per search ({found}/{num_searches} paths found)")
+        cdb.stop()
+        await cdb.stopped_event.wait()
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    loop, stopping_fut, loop_thread = util.create_and_start_event_loop()
+    try:
+        asyncio.run_coroutine_threadsafe(main(), loop).result()
+    finally:
+        loop.call_soon_threadsafe(stopping_fut.set_result, 1)
+        loop_thread.join()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+#
+# Benchmarks PartialTransaction.sign for consolidations of many inputs,
+# all spent with the same key, for legacy (p2pkh) and segwit (p2wpkh)
+# inputs. Most of the time of a large legacy tx used to go into
+# serializing its preimages.
+#
+# usage: bench_sighash.py [num_inputs ...]
+
+import random
+import sys
+import time
+
+from electrum import descriptor
+from electrum.bitcoin import address_to_script
+from electrum.ecc import ECPrivkey
+from electrum.transaction import PartialTransaction, PartialTxInput, PartialTxOutput, TxOutpoint, TxOutput
+
+
+def make_tx(num_inputs: int, script_type: str, privkey: ECPrivkey) -> PartialTransaction:
+    rnd = random.Random(0)
+    pubkey = privkey.get_public_key_hex(compressed=True)
+    desc = descriptor.get_singlesig_descriptor_from_legacy_leaf(pubkey=pubkey, script_type=script_type)
+    scriptpubkey = desc.expand().output_script
+    inputs = []
+    for i in range(num_inputs):
+        txin = PartialTxInput(prevout=TxOutpoint(txid=rnd.randbytes(32), out_idx=rnd.randrange(4)))
+        txin.script_descriptor = desc
+        txin.witness_utxo = TxOutput(scriptpubkey=scriptpubkey, value=rnd.randrange(10**4, 10**6))
+        inputs.append(txin)
+    total = sum(txin.value_sats() for txin in inputs)
+    address = desc.expand().address()
+    outputs = [PartialTxOutput(scriptpubkey=bytes.fromhex(address_to_script(address)), value=total - 100 * num_inputs)]
+    return PartialTransaction.from_io(inputs, outputs, locktime=0, version=2)
+
+
+def main():
+    sizes = [int(x) for x in sys.argv[1:]] or [100, 250, 500, 1000]
+    privkey = ECPrivkey(bytes(31) + b'\x01')
+    keypairs = {privkey.get_public_key_hex(compressed=True): (privkey.get_secret_bytes(), True)}
+    for script_type in ('p2pkh', 'p2wpkh'):
+        for num_inputs in sizes:
+            tx = make_tx(num_inputs, script_type, privkey)
+            t0 = time.monotonic()
+            tx.sign(keypairs)
+            dt = time.monotonic() - t0
+            assert tx.is_complete()
+            print(f"{script_type:>6} {num_inputs:>5} inputs: {dt:.2f} sec ({1000 * dt / num_inputs:.2f} ms per input)")
+
+
+if __name__ == '__main__':
+    main()
@@ -938,6 +938,9 @@ class SimpleConfig(Logger):
     NETWORK_SERVERFINGERPRINT = ConfigVar('serverfingerprint', default=None, type_=str)
     NETWORK_MAX_INCOMING_MSG_SIZE = ConfigVar('network_max_incoming_msg_size', default=1_000_000, type_=int)  # in bytes
     NETWORK_TIMEOUT = ConfigVar('network_timeout', default=None, type_=int)
+    NETWORK_HEADER_CHUNK_PIPELINE_DEPTH = ConfigVar('network_header_chunk_pipeline_depth', default=4, type_=int)
+    NETWORK_HEADER_HASH_PROCESSES = ConfigVar('network_header_hash_processes', default=0, type_=int)
+    NETWORK_REQUEST_BATCH_SIZE = ConfigVar('network_request_batch_size', default=50, type_=int)  # max requests per JSON-RPC batch
 
     WALLET_BATCH_RBF = ConfigVar(
         'batch_rbf', default=False, type_=bool,
@@ -996,6 +999,13 @@ class SimpleConfig(Logger):
         'history_rates_capital_gains', default=False, type_=bool,
         short_desc=lambda: _('Show Capital Gains'),
     )
+    FX_HISTORY_COST_BASIS = ConfigVar(
+        'history_rates_cost_basis', default='average', type_=str,
+        short_desc=lambda: _('Cost basis method'),
+        long_desc=lambda: _("How the acquisition price of spent coins is computed for capital gains: "
+                            "'average' prices a coin at the average price of the coins spent to create it, "
+                            "'fifo' spends the oldest coins of the wallet first."),
+    )
     FX_SHOW_FIAT_BALANCE_FOR_ADDRESSES = ConfigVar(
         'fiat_address', default=False, type_=bool,
         short_desc=lambda: _('Show Fiat balances'),
@@ -1038,6 +1048,8 @@ This will result in longer routes; it might increase your fees and decrease the
     INITIAL_TRAMPOLINE_FEE_LEVEL = ConfigVar('initial_trampoline_fee_level', default=1, type_=int)
 
     LIGHTNING_NODE_ALIAS = ConfigVar('lightning_node_alias', default='', type_=str)
+    LIGHTNING_GOSSIP_VERIFY_PROCESSES = ConfigVar('lightning_gossip_verify_processes', default=0, type_=int)
+    LIGHTNING_PATHFINDING_TIMEOUT = ConfigVar('lightning_pathfinding_timeout', default=30, type_=int)
     EXPERIMENTAL_LN_FORWARD_PAYMENTS = ConfigVar('lightning_forward_payments', default=False, type_=bool)
     EXPERIMENTAL_LN_FORWARD_TRAMPOLINE_PAYMENTS = ConfigVar('lightning_forward_trampoline_payments', default=False, type_=bool)
     TEST_FAIL_HTLCS_WITH_TEMP_NODE_FAILURE = ConfigVar('test_fail_htlcs_with_temp_node_failure', default=False, type_=bool)
@@ -64,6 +64,10 @@ class WalletStorage(Logger):
         self.logger.info(f"wallet path {self.path}")
         self.pubkey = None
         self.decrypted = ''
+        # (encryption version, pubkey) of the data currently on disk.
+        # Encrypted records can only be appended if these did not change.
+        self._encryption_on_disk = None
+        self._has_incomplete_record = False
         try:
             test_read_write_permissions(self.path)
         except IOError as e:
@@ -79,6 +83,7 @@ class WalletStorage(Logger):
             self._encryption_version = StorageEncryptionVersion.PLAINTEXT
             self.pos = 0
             self.init_pos = 0
+        self._encryption_on_disk = (self._encryption_version, self.pubkey)
 
     def read(self):
         return self.decrypted if self.is_encrypted() else self.raw
@@ -101,11 +106,19 @@ class WalletStorage(Logger):
         os.replace(temp_path, self.path)
         os_chmod(self.path, mode)
         self._file_exists = True
+        self._encryption_on_disk = (self._encryption_version, self.pubkey)
+        self._has_incomplete_record = False
         self.logger.info(f"saved {self.path}")
 
     def append(self, data: str) -> None:
-        """ append data to file. for the moment, only non-encrypted file"""
-        assert not self.is_encrypted()
+        """ append data to file.
+        For encrypted files, data is encrypted as a separate record, on its own line.
+        Each record is authenticated by its own MAC.
+        """
+        if self.is_encrypted():
+            assert self._encryption_on_disk == (self._encryption_version, self.pubkey)
+            self.decrypted += data
+            data = '\n' + self._encrypt(data)
         with open(self.path, "rb+") as f:
             pos = f.seek(0, os.SEEK_END)
             assert pos == self.pos, (self.pos, pos)
@@ -115,6 +128,12 @@ class WalletStorage(Logger):
             os.fsync(f.fileno())
 
     def needs_consolidation(self):
+        if self._encryption_on_disk != (self._encryption_version, self.pubkey):
+            # e.g. password changed: appended records must use the same key as the rest of the file
+            return True
+        if self._has_incomplete_record:
+            # anything appended would follow the garbage
+            return True
         return self.pos > 2 * self.init_pos
 
     def file_exists(self) -> bool:
@@ -152,7 +171,8 @@ class WalletStorage(Logger):
 
     def _init_encryption_version(self):
         try:
-            magic = base64.b64decode(self.raw)[0:4]
+            # note: encrypted files might have appended records, one per line
+            magic = base64.b64decode(self.raw.split('\n', 1)[0])[0:4]
             if magic == b'BIE1':
                 return StorageEncryptionVersion.USER_PASSWORD
             elif magic == b'BIE2':
@@ -186,23 +206,37 @@ class WalletStorage(Logger):
         ec_key = self.get_eckey_from_password(password)
         if self.raw:
             enc_magic = self._get_encryption_magic()
-            s = zlib.decompress(ec_key.decrypt_message(self.raw, enc_magic))
+            # the first record is the full db, the others are appended changes
+            records = self.raw.split('\n')
+            s = zlib.decompress(ec_key.decrypt_message(records[0], enc_magic))
             s = s.decode('utf8')
+            for i, record in enumerate(records[1:], start=1):
+                try:
+                    s += zlib.decompress(ec_key.decrypt_message(record, enc_magic)).decode('utf8')
+                except Exception as e:
+                    if i == len(records) - 1:
+                        # interrupted while appending the last record; its changes are lost
+                        self.logger.warning(f"ignoring incomplete last record of encrypted wallet file: {repr(e)}")
+                        self._has_incomplete_record = True
+                        break
+                    raise WalletFileException(f"Cannot decrypt record {i} of wallet file") from e
         else:
             s = ''
         self.pubkey = ec_key.get_public_key_hex()
         self.decrypted = s
+        self._encryption_on_disk = (self._encryption_version, self.pubkey)
+
+    def _encrypt(self, plaintext: str) -> str:
+        c = zlib.compress(bytes(plaintext, 'utf8'), level=zlib.Z_BEST_SPEED)
+        enc_magic = self._get_encryption_magic()
+        public_key = ecc.ECPubkey(bfh(self.pubkey))
+        return public_key.encrypt_message(c, enc_magic).decode('utf8')
 
     def encrypt_before_writing(self, plaintext: str) -> str:
         s = plaintext
         if self.pubkey:
             self.decrypted = plaintext
-            s = bytes(s, 'utf8')
-            c = zlib.compress(s, level=zlib.Z_BEST_SPEED)
-            enc_magic = self._get_encryption_magic()
-            public_key = ecc.ECPubkey(bfh(self.pubkey))
-            s = public_key.encrypt_message(c, enc_magic)
-            s = s.decode('utf8')
+            s = self._encrypt(plaintext)
         return s
 
     def check_password(self, password: Optional[str]) -> None:
@@ -23,8 +23,7 @@
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 import asyncio
-import hashlib
-from typing import Dict, List, TYPE_CHECKING, Tuple, Set
+from typing import Dict, List, TYPE_CHECKING, Tuple, Set, Sequence
 from collections import defaultdict
 import logging
 
@@ -32,10 +31,11 @@ from aiorpcx import run_in_thread, RPCError
 
 from . import util
 from .transaction import Transaction, PartialTransaction
-from .util import make_aiohttp_session, NetworkJobOnDefaultServer, random_shuffled_copy, OldTaskGroup
+from .util import make_aiohttp_session, NetworkJobOnDefaultServer, random_shuffled_copy, OldTaskGroup, chunks
 from .bitcoin import address_to_scripthash, is_address
 from .logging import Logger
 from .interface import GracefulDisconnect, NetworkTimeout
+from .wallet_db import history_status
 
 if TYPE_CHECKING:
     from .network import Network
@@ -45,15 +45,6 @@ if TYPE_CHECKING:
 class SynchronizerFailure(Exception): pass
 
 
-def history_status(h):
-    if not h:
-        return None
-    status = ''
-    for tx_hash, height in h:
-        status += tx_hash + ':%d:' % height
-    return hashlib.sha256(status.encode('ascii')).digest().hex()
-
-
 class SynchronizerBase(NetworkJobOnDefaultServer):
     """Subscribe over the network to a set of addresses, and monitor their statuses.
     Every time a status changes, run a coroutine provided by the subclass.
@@ -86,15 +77,24 @@ class SynchronizerBase(NetworkJobOnDefaultServer):
     def add(self, addr):
         if not is_address(addr): raise ValueError(f"invalid globalBoost address {addr}")
         self._adding_addrs.add(addr)  # this lets is_up_to_date already know about addr
+        self.wake_up()
 
     async def _add_address(self, addr: str):
+        await self._add_addresses([addr])
+
+    async def _add_addresses(self, addrs: Sequence[str]):
         try:
-            if not is_address(addr): raise ValueError(f"invalid globalBoost address {addr}")
-            if addr in self.requested_addrs: return
-            self.requested_addrs.add(addr)
-            await self.taskgroup.spawn(self._subscribe_to_address, addr)
+            new_addrs = []
+            for addr in addrs:
+                if not is_address(addr): raise ValueError(f"invalid globalBoost address {addr}")
+                if addr in self.requested_addrs: continue
+                self.requested_addrs.add(addr)
+                new_addrs.append(addr)
+            for batch in chunks(new_addrs, self._get_batch_size()):
+                await self.taskgroup.spawn(self._subscribe_to_addresses, batch)
         finally:
-            self._adding_addrs.discard(addr)  # ok for addr not to be present
+            for addr in addrs:
+                self._adding_addrs.discard(addr)  # ok for addr not to be present
 
     async def _on_address_status(self, addr, status):
         """Handle the change of the status of an address.
@@ -102,18 +102,25 @@ class SynchronizerBase(NetworkJobOnDefaultServer):
         """
         raise NotImplementedError()  # implemented by subclasses
 
-    async def _subscribe_to_address(self, addr):
-        h = address_to_scripthash(addr)
-        self.scripthash_to_address[h] = addr
-        self._requests_sent += 1
+    async def _subscribe_to_addresses(self, addrs: Sequence[str]):
+        hashes = []
+        for addr in addrs:
+            h = address_to_scripthash(addr)
+            self.scripthash_to_address[h] = addr
+            hashes.append(h)
+        self._requests_sent += len(addrs)
         try:
             async with self._network_request_semaphore:
-                await self.session.subscribe('blockchain.scripthash.subscribe', [h], self.status_queue)
+                if len(hashes) == 1:
+                    await self.session.subscribe('blockchain.scripthash.subscribe', [hashes[0]], self.status_queue)
+                else:
+                    await self.session.subscribe_batch(
+                        'blockchain.scripthash.subscribe', [[h] for h in hashes], self.status_queue)
         except RPCError as e:
             if e.message == 'history too large':  # no unique error code
                 raise GracefulDisconnect(e, log_level=logging.ERROR) from e
             raise
-        self._requests_answered += 1
+        self._requests_answered += len(addrs)
 
     async def handle_status(self):
         while True:
@@ -123,6 +130,7 @@ class SynchronizerBase(NetworkJobOnDefaultServer):
             self.requested_addrs.discard(addr)  # ok for addr not to be present
             await self.taskgroup.spawn(self._on_address_status, addr, status)
             self._processed_some_notifications = True
+            self.wake_up()
 
     async def main(self):
         raise NotImplementedError()  # implemented by subclasses
@@ -145,6 +153,7 @@ class Synchronizer(SynchronizerBase):
         self._init_done = False
         self.requested_tx = {}
         self.requested_histories = set()
+        self._history_queue = asyncio.Queue()  # type: asyncio.Queue[Tuple[str, str]]
         self._stale_histories = dict()  # type: Dict[str, asyncio.Task]
 
     def diagnostic_name(self):
@@ -158,12 +167,12 @@ class Synchronizer(SynchronizerBase):
                 and not self.requested_histories
                 and not self.requested_tx
                 and not self._stale_histories
-                and self.status_queue.empty())
+                and self.status_queue.empty()
+                and self._history_queue.empty())
 
     async def _on_address_status(self, addr, status):
         try:
-            history = self.adb.db.get_addr_history(addr)
-            if history_status(history) == status:
+            if self.adb.db.get_addr_history_status(addr) == status:
                 return
             # No point in requesting history twice for the same announced status.
             # However if we got announced a new status, we should request history again:
@@ -174,11 +183,40 @@ class Synchronizer(SynchronizerBase):
             self._stale_histories.pop(addr, asyncio.Future()).cancel()
         finally:
             self._handling_addr_statuses.discard(addr)
-        h = address_to_scripthash(addr)
-        self._requests_sent += 1
+            self.wake_up()
+        await self._history_queue.put((addr, status))
+
+    async def _process_history_queue(self):
+        # requests that got queued while the previous batch was being sent are batched together
+        while True:
+            requests = [await self._history_queue.get()]
+            while len(requests) < self._get_batch_size() and not self._history_queue.empty():
+                requests.append(self._history_queue.get_nowait())
+            await self.taskgroup.spawn(self._request_histories, requests)
+
+    async def _request_histories(self, requests: Sequence[Tuple[str, str]]):
+        hashes = [address_to_scripthash(addr) for addr, status in requests]
+        self._requests_sent += len(requests)
         async with self._network_request_semaphore:
-            result = await self.interface.get_history_for_scripthash(h)
-        self._requests_answered += 1
+            if len(hashes) == 1:
+                results = [await self.interface.get_history_for_scripthash(hashes[0])]
+            else:
+                results = await self.interface.get_histories_for_scripthashes(hashes)
+        self._requests_answered += len(requests)
+        missing_txs = []
+        for (addr, status), result in zip(requests, results):
+            missing_txs += await self._on_address_history(addr, status, result)
+        # Request transactions we don't have
+        await self._request_missing_txs(missing_txs)
+        # Remove requests; this allows up_to_date to be True
+        for addr, status in requests:
+            self.requested_histories.discard((addr, status))
+        self.wake_up()
+
+    async def _on_address_history(self, addr, status, result) -> Sequence[Tuple[str, int]]:
+        """Handles the history received for an address. Returns the
+        history if it got stored, so that missing txs can be requested.
+        """
         self.logger.info(f"receiving history {addr} {len(result)}")
         hist = list(map(lambda item: (item['tx_hash'], item['height']), result))
         # tx_fees
@@ -195,15 +233,11 @@ class Synchronizer(SynchronizerBase):
                 await asyncio.sleep(timeout)
                 raise SynchronizerFailure(f"timeout reached waiting for addr {addr}: history still stale")
             self._stale_histories[addr] = await self.taskgroup.spawn(disconnect_if_still_stale)
-        else:
-            self._stale_histories.pop(addr, asyncio.Future()).cancel()
-            # Store received history
-            self.adb.receive_history_callback(addr, hist, tx_fees)
-            # Request transactions we don't have
-            await self._request_missing_txs(hist)
-
-        # Remove request; this allows up_to_date to be True
-        self.requested_histories.discard((addr, status))
+            return []
+        self._stale_histories.pop(addr, asyncio.Future()).cancel()
+        # Store received history
+        self.adb.receive_history_callback(addr, hist, tx_fees)
+        return hist
 
     async def _request_missing_txs(self, hist, *, allow_server_not_finding_tx=False):
         # "hist" is a list of [tx_hash, tx_height] lists
@@ -219,8 +253,29 @@ class Synchronizer(SynchronizerBase):
 
         if not transaction_hashes: return
         async with OldTaskGroup() as group:
-            for tx_hash in transaction_hashes:
-                await group.spawn(self._get_transaction(tx_hash, allow_server_not_finding_tx=allow_server_not_finding_tx))
+            for batch in chunks(transaction_hashes, self._get_batch_size()):
+                await group.spawn(self._get_transactions(batch, allow_server_not_finding_tx=allow_server_not_finding_tx))
+
+    async def _get_transactions(self, tx_hashes: Sequence[str], *, allow_server_not_finding_tx=False):
+        if len(tx_hashes) == 1:
+            await self._get_transaction(tx_hashes[0], allow_server_not_finding_tx=allow_server_not_finding_tx)
+            return
+        self._requests_sent += len(tx_hashes)
+        try:
+            async with self._network_request_semaphore:
+                raw_txs = await self.interface.get_transactions(tx_hashes)
+        finally:
+            self._requests_answered += len(tx_hashes)
+        failed = []
+        for tx_hash, raw_tx in zip(tx_hashes, raw_txs):
+            if isinstance(raw_tx, RPCError):
+                failed.append(tx_hash)
+                continue
+            self._receive_transaction(tx_hash, raw_tx)
+        # Retry failed ones individually. Besides the server not finding the tx,
+        # a batch response might exceed the size limit of the server.
+        for tx_hash in failed:
+            await self._get_transaction(tx_hash, allow_server_not_finding_tx=allow_server_not_finding_tx)
 
     async def _get_transaction(self, tx_hash, *, allow_server_not_finding_tx=False):
         self._requests_sent += 1
@@ -231,37 +286,44 @@ class Synchronizer(SynchronizerBase):
             # most likely, "No such mempool or blockchain transaction"
             if allow_server_not_finding_tx:
                 self.requested_tx.pop(tx_hash)
+                self.wake_up()
                 return
             else:
                 raise
         finally:
             self._requests_answered += 1
+        self._receive_transaction(tx_hash, raw_tx)
+
+    def _receive_transaction(self, tx_hash: str, raw_tx: str):
         tx = Transaction(raw_tx)
         if tx_hash != tx.txid():
             raise SynchronizerFailure(f"received tx does not match expected txid ({tx_hash} != {tx.txid()})")
         tx_height = self.requested_tx.pop(tx_hash)
         self.adb.receive_tx_callback(tx, tx_height)
         self.logger.info(f"received tx {tx_hash} height: {tx_height} bytes: {len(raw_tx)}")
+        self.wake_up()
 
     async def main(self):
         self.adb.up_to_date_changed()
+        await self.taskgroup.spawn(self._process_history_queue())
         # request missing txns, if any
+        hist = []
         for addr in random_shuffled_copy(self.adb.db.get_history()):
             history = self.adb.db.get_addr_history(addr)
             # Old electrum servers returned ['*'] when all history for the address
             # was pruned. This no longer happens but may remain in old wallets.
             if history == ['*']: continue
-            await self._request_missing_txs(history, allow_server_not_finding_tx=True)
+            hist += history
+        await self._request_missing_txs(hist, allow_server_not_finding_tx=True)
         # add addresses to bootstrap
-        for addr in random_shuffled_copy(self.adb.get_addresses()):
-            await self._add_address(addr)
-        # main loop
+        await self._add_addresses(random_shuffled_copy(self.adb.get_addresses()))
+        # main loop. it runs when woken up by a change that might
+        # affect is_up_to_date, e.g. a request being answered
         self._init_done = True
         prev_uptodate = False
         while True:
-            await asyncio.sleep(0.1)
-            for addr in self._adding_addrs.copy(): # copy set to ensure iterator stability
-                await self._add_address(addr)
+            if self._adding_addrs:
+                await self._add_addresses(list(self._adding_addrs))  # copy set to ensure iterator stability
             up_to_date = self.adb.is_up_to_date()
             # see if status changed
             if (up_to_date != prev_uptodate
@@ -269,6 +331,7 @@ class Synchronizer(SynchronizerBase):
                 self._processed_some_notifications = False
                 self.adb.up_to_date_changed()
             prev_uptodate = up_to_date
+            await self._wait_for_work()
 
 
 class Notifier(SynchronizerBase):
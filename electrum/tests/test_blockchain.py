@@ -4,7 +4,7 @@ import os
 
 from electrum import constants, blockchain
 from electrum.simple_config import SimpleConfig
-from electrum.blockchain import Blockchain, deserialize_header, hash_header, InvalidHeader
+from electrum.blockchain import Blockchain, BlockHeader, deserialize_header, hash_header, InvalidHeader
 from electrum.util import bfh, make_dir
 
 from . import ElectrumTestCase
@@ -268,6 +268,50 @@ class TestBlockchain(ElectrumTestCase):
         self.assertEqual(hash_header(self.HEADERS['M']), chain_z.get_hash(9))
         self.assertEqual(hash_header(self.HEADERS['Z']), chain_z.get_hash(13))
 
+    def test_cached_hashes_invalidated_on_write(self):
+        blockchain.blockchains[constants.net.GENESIS] = chain_u = Blockchain(
+            config=self.config, forkpoint=0, parent=None,
+            forkpoint_hash=constants.net.GENESIS, prev_hash=None)
+        open(chain_u.path(), 'w+').close()
+        for name in 'ABCDEFOP':
+            self._append_header(chain_u, self.HEADERS[name])
+        self.assertEqual(hash_header(self.HEADERS['O']), chain_u.get_hash(6))
+        self.assertEqual(hash_header(self.HEADERS['P']), chain_u.get_hash(7))
+        # overwrite O with G, truncating P
+        chain_u.write(bfh(blockchain.serialize_header(self.HEADERS['G'])), 6 * 80)
+        self.assertEqual(6, chain_u.height())
+        self.assertEqual(hash_header(self.HEADERS['G']), chain_u.get_hash(6))
+        self.assertEqual(self.HEADERS['G'], chain_u.read_header(6))
+        self.assertIsNone(chain_u.read_header(7))
+        with self.assertRaises(blockchain.MissingHeader):
+            chain_u.get_hash(7)
+
+    def test_verify_chunk(self):
+        blockchain.blockchains[constants.net.GENESIS] = chain_u = Blockchain(
+            config=self.config, forkpoint=0, parent=None,
+            forkpoint_hash=constants.net.GENESIS, prev_hash=None)
+        open(chain_u.path(), 'w+').close()
+        headers = [self.HEADERS[name] for name in 'ABCDEFOPQRSTU']
+        data = b''.join(bfh(blockchain.serialize_header(h)) for h in headers)
+        chain_u.verify_chunk(0, data)
+        header_hashes = blockchain.hash_raw_headers(data)
+        self.assertEqual([hash_header(h) for h in headers], [h[::-1].hex() for h in header_hashes])
+        chain_u.verify_chunk(0, data, header_hashes=header_hashes)
+        # broken link: G does not connect to E
+        headers_bad = [self.HEADERS[name] for name in 'ABCDEGHI']
+        data_bad = b''.join(bfh(blockchain.serialize_header(h)) for h in headers_bad)
+        with self.assertRaises(InvalidHeader):
+            chain_u.verify_chunk(0, data_bad)
+        with self.assertRaises(InvalidHeader):
+            chain_u.verify_chunk(0, data, header_hashes=header_hashes[:-1])
+        # headers we already have must not be replaced by a chunk
+        self.assertTrue(chain_u.connect_chunk(0, data.hex()))
+        self.assertEqual(12, chain_u.height())
+        data_fork = b''.join(bfh(blockchain.serialize_header(self.HEADERS[name])) for name in 'ABCDEFGHI')
+        with self.assertRaises(InvalidHeader):
+            chain_u.verify_chunk(0, data_fork)
+        self.assertFalse(chain_u.connect_chunk(0, data_fork.hex()))
+
     def test_doing_multiple_swaps_after_single_new_header(self):
         blockchain.blockchains[constants.net.GENESIS] = chain_u = Blockchain(
             config=self.config, forkpoint=0, parent=None,
@@ -458,3 +502,125 @@ class TestVerifyHeader(ElectrumTestCase):
         with self.assertRaises(InvalidHeader):
             self.header["nonce"] = 42
             Blockchain.verify_header(self.header, self.prev_hash, self.target)
+
+    def test_valid_block_header(self):
+        Blockchain.verify_header(BlockHeader(bfh(self.valid_header), 100), self.prev_hash, self.target)
+
+    def test_prev_hash_mismatch_block_header(self):
+        with self.assertRaises(InvalidHeader):
+            Blockchain.verify_header(BlockHeader(bfh(self.valid_header), 100), "foo", self.target)
+
+
+class TestBlockHeader(ElectrumTestCase):
+
+    raw_header = TestVerifyHeader.valid_header
+
+    def test_fields_match_deserialize_header(self):
+        header = BlockHeader(bfh(self.raw_header), 100)
+        header_dict = deserialize_header(bfh(self.raw_header), 100)
+        self.assertEqual(header_dict, header.to_dict())
+        self.assertEqual(header_dict, header)
+        for key, value in header_dict.items():
+            self.assertEqual(value, header[key])
+            self.assertEqual(value, header.get(key))
+        self.assertNotIn('mock', header)
+        self.assertIsNone(header.get('mock'))
+        with self.assertRaises(KeyError):
+            header['mock']
+
+    def test_hash(self):
+        header = BlockHeader(bfh(self.raw_header), 100)
+        self.assertEqual("000000007bc154e0fa7ea32218a72fe2c1bb9f86cf8c9ebf9a715ed27fdb229a", hash_header(header))
+        self.assertEqual(hash_header(deserialize_header(bfh(self.raw_header), 100)), hash_header(header))
+        self.assertEqual(TestVerifyHeader.prev_hash, header.prev_block_hash)
+        self.assertEqual(bfh(TestVerifyHeader.prev_hash)[::-1], header.prev_hash_bytes())
+
+    def test_invalid_length(self):
+        with self.assertRaises(InvalidHeader):
+            BlockHeader(bfh(self.raw_header)[:-1], 100)
+        with self.assertRaises(InvalidHeader):
+            BlockHeader(b'', 100)
+
+
+class TestChainworkIndex(ElectrumTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self._orig_checkpoints = constants.net.CHECKPOINTS
+        constants.net.CHECKPOINTS = []
+        self._orig_chainwork_cache = dict(blockchain._CHAINWORK_CACHE)
+        make_dir(os.path.join(self.electrum_path, 'forks'))
+        self.config = SimpleConfig({'electrum_path': self.electrum_path})
+        blockchain.blockchains = {}
+
+    def tearDown(self):
+        constants.net.CHECKPOINTS = self._orig_checkpoints
+        blockchain._CHAINWORK_CACHE.clear()
+        blockchain._CHAINWORK_CACHE.update(self._orig_chainwork_cache)
+        super().tearDown()
+
+    @staticmethod
+    def _make_headers(num_headers: int, *, nonce: int = 0) -> bytes:
+        headers = []
+        prev_hash = bytes(32)
+        for height in range(num_headers):
+            header = (int(0x20000000).to_bytes(4, byteorder='little')
+                      + prev_hash
+                      + height.to_bytes(32, byteorder='little')
+                      + (1600000000 + 300 * height).to_bytes(4, byteorder='little')
+                      + int(0x1d00ffff).to_bytes(4, byteorder='little')
+                      + nonce.to_bytes(4, byteorder='little'))
+            headers.append(header)
+            prev_hash = blockchain.hash_raw_headers(header)[0]
+        return b''.join(headers)
+
+    def _new_chain(self) -> Blockchain:
+        chain = Blockchain(config=self.config, forkpoint=0, parent=None,
+                           forkpoint_hash=constants.net.GENESIS, prev_hash=None)
+        blockchain.blockchains[constants.net.GENESIS] = chain
+        return chain
+
+    def test_index_persists_targets_and_chainwork(self):
+        chain = self._new_chain()
+        open(chain.path(), 'w+').close()
+        chain.write(self._make_headers(3 * 2016 + 10), 0)
+        chain.update_chainwork_index()
+        self.assertEqual(3 * blockchain.CHAINWORK_INDEX_RECORD_SIZE, os.path.getsize(chain.chainwork_index_path()))
+        expected_targets = [chain.get_target(i) for i in range(3)]
+        expected_chainwork = chain.get_chainwork()
+
+        # "restart"
+        blockchain._CHAINWORK_CACHE.clear()
+        blockchain._CHAINWORK_CACHE.update(self._orig_chainwork_cache)
+        chain = self._new_chain()
+        chain.load_chainwork_index()
+        self.assertEqual({i: t for i, t in enumerate(expected_targets)}, chain._target_cache)
+        self.assertEqual(len(self._orig_chainwork_cache) + 3, len(blockchain._CHAINWORK_CACHE))
+        self.assertEqual(expected_chainwork, chain.get_chainwork())
+
+    def test_index_truncated_on_rewrite(self):
+        chain = self._new_chain()
+        open(chain.path(), 'w+').close()
+        chain.write(self._make_headers(3 * 2016), 0)
+        chain.update_chainwork_index()
+        self.assertEqual(3 * blockchain.CHAINWORK_INDEX_RECORD_SIZE, os.path.getsize(chain.chainwork_index_path()))
+        # replace the headers from the middle of chunk 1 onwards
+        other_headers = self._make_headers(3 * 2016, nonce=1)
+        chain.write(other_headers[2100 * 80:], 2100 * 80)
+        self.assertEqual(1 * blockchain.CHAINWORK_INDEX_RECORD_SIZE, os.path.getsize(chain.chainwork_index_path()))
+        chain.update_chainwork_index()
+        self.assertEqual(3 * blockchain.CHAINWORK_INDEX_RECORD_SIZE, os.path.getsize(chain.chainwork_index_path()))
+
+    def test_stale_records_discarded_on_load(self):
+        chain = self._new_chain()
+        open(chain.path(), 'w+').close()
+        chain.write(self._make_headers(3 * 2016), 0)
+        chain.update_chainwork_index()
+        # headers file changed behind our back, e.g. by an older version
+        with open(chain.path(), 'rb+') as f:
+            f.seek(2100 * 80)
+            f.write(self._make_headers(3 * 2016, nonce=1)[2100 * 80:])
+        chain = self._new_chain()
+        chain.load_chainwork_index()
+        self.assertEqual(1 * blockchain.CHAINWORK_INDEX_RECORD_SIZE, os.path.getsize(chain.chainwork_index_path()))
+        self.assertEqual({0}, set(chain._target_cache))
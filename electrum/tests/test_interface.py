@@ -1,4 +1,10 @@
-from electrum.interface import ServerAddr
+import asyncio
+from unittest import mock
+
+import aiorpcx
+
+from electrum.interface import ServerAddr, NotificationSession
+from electrum.simple_config import SimpleConfig
 
 from . import ElectrumTestCase
 
@@ -46,3 +52,71 @@ class TestServerAddr(ElectrumTestCase):
                          ServerAddr(host="2400:6180:0:d1::86b:e001", port=50002, protocol="s").to_friendly_name())
         self.assertEqual("[2400:6180:0:d1::86b:e001]:50001:t",
                          ServerAddr(host="2400:6180:0:d1::86b:e001", port=50001, protocol="t").to_friendly_name())
+
+
+class _ServerSession(aiorpcx.RPCSession):
+
+    async def handle_request(self, request):
+        if request.method == 'blockchain.scripthash.subscribe':
+            return 'status_' + request.args[0]
+        if request.method == 'blockchain.transaction.get':
+            if request.args[0] == 'missing':
+                raise aiorpcx.RPCError(2, 'No such mempool or blockchain transaction')
+            if request.args[0] == 'large':
+                return 'ff' * 150_000
+            return request.args[0]
+        raise aiorpcx.RPCError(aiorpcx.JSONRPC.METHOD_NOT_FOUND, 'unknown method')
+
+
+class TestNotificationSession(ElectrumTestCase):
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.server = await aiorpcx.serve_rs(_ServerSession, '127.0.0.1', 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.config = SimpleConfig({'electrum_path': self.electrum_path})
+        self.interface = mock.Mock(debug=False, network=mock.Mock(debug=False, config=self.config))
+
+    async def asyncTearDown(self):
+        self.server.close()
+        await self.server.wait_closed()
+        await super().asyncTearDown()
+
+    def _connect(self):
+        return aiorpcx.connect_rs(
+            '127.0.0.1', self.port,
+            session_factory=lambda *args, **kwargs: NotificationSession(*args, interface=self.interface, **kwargs))
+
+    async def test_send_request_batch(self):
+        async with self._connect() as session:
+            results = await session.send_request_batch([
+                ('blockchain.transaction.get', ['aa']),
+                ('blockchain.transaction.get', ['missing']),
+                ('blockchain.transaction.get', ['bb']),
+            ])
+        self.assertEqual('aa', results[0])
+        self.assertIsInstance(results[1], aiorpcx.RPCError)
+        self.assertEqual('bb', results[2])
+
+    async def test_send_request_batch_reply_over_max_msg_size(self):
+        # each result fits in a message, but the reply to the whole batch does not
+        requests = [('blockchain.transaction.get', ['large']) for _ in range(5)]
+        requests.append(('blockchain.transaction.get', ['missing']))
+        async with self._connect() as session:
+            session.set_default_timeout(1)
+            results = await session.send_request_batch(requests)
+        self.assertEqual(6, len(results))
+        self.assertEqual(['ff' * 150_000] * 5, results[:5])
+        self.assertIsInstance(results[5], aiorpcx.RPCError)
+
+    async def test_subscribe_batch(self):
+        queue = asyncio.Queue()
+        async with self._connect() as session:
+            await session.subscribe_batch('blockchain.scripthash.subscribe', [['aa'], ['bb']], queue)
+            # cached subscriptions are not requested again
+            with mock.patch.object(session, 'send_request_batch', side_effect=Exception('unexpected request')):
+                await session.subscribe_batch('blockchain.scripthash.subscribe', [['bb']], queue)
+        items = []
+        while not queue.empty():
+            items.append(queue.get_nowait())
+        self.assertEqual([['aa', 'status_aa'], ['bb', 'status_bb'], ['bb', 'status_bb']], items)
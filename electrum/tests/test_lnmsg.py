@@ -1,10 +1,11 @@
 import io
+import random
 
 from electrum.lnmsg import (read_bigsize_int, write_bigsize_int, FieldEncodingNotMinimal,
                             UnexpectedEndOfStream, LNSerializer, UnknownMandatoryTLVRecordType,
                             MalformedMsg, MsgTrailingGarbage, MsgInvalidFieldOrder, encode_msg,
                             decode_msg, UnexpectedFieldSizeForEncoder, OnionWireSerializer,
-                            UnknownMsgType)
+                            UnknownMsgType, FailedToParseMsg)
 from electrum.lnonion import OnionRoutingFailure
 from electrum.util import bfh
 from electrum.lnutil import ShortChannelID, LnFeatures
@@ -370,3 +371,45 @@ class TestLNMsg(ElectrumTestCase):
             OnionWireSerializer.decode_msg(orf2.to_bytes())
         self.assertEqual(None, orf2.decode_data())
 
+
+    def test_compiled_schemes_match_generic_code(self):
+        ser = LNSerializer()
+        for msg_type in ('channel_announcement', 'node_announcement', 'channel_update', 'update_add_htlc'):
+            self.assertIn(ser.msg_type_from_name[msg_type], ser.compiled_msg_scheme_from_type)
+        rnd = random.Random(42)
+        for compiled_ser, generic_ser in (
+                (LNSerializer(), LNSerializer(compile_schemes=False)),
+                (LNSerializer(for_onion_wire=True), LNSerializer(for_onion_wire=True, compile_schemes=False))):
+            for msg_type, msg_type_bytes in compiled_ser.msg_type_from_name.items():
+                with self.subTest(msg_type=msg_type):
+                    kwargs = {}
+                    for row in compiled_ser.msg_scheme_from_type[msg_type_bytes][1:]:
+                        field_name, field_type, field_count_str = row[2], row[3], row[4]
+                        if field_name == 'tlvs':
+                            continue
+                        if field_type in ('u8', 'u16', 'u32', 'u64', 'bigsize'):
+                            # small values, as some of them are counts of other fields
+                            kwargs[field_name] = rnd.randrange(4)
+                            continue
+                        type_len = {'byte': 1, 'signature': 64, 'point': 33, 'short_channel_id': 8}.get(field_type, 32)
+                        count = kwargs[field_count_str] if field_count_str in kwargs else int(field_count_str or 1)
+                        kwargs[field_name] = rnd.randbytes(count * type_len)
+                    data = compiled_ser.encode_msg(msg_type, **kwargs)
+                    self.assertEqual(generic_ser.encode_msg(msg_type, **kwargs), data)
+                    # missing fields are set to zeroes, except for counts
+                    try:
+                        expected = generic_ser.encode_msg(msg_type)
+                    except KeyError:
+                        with self.assertRaises(KeyError):
+                            compiled_ser.encode_msg(msg_type)
+                    else:
+                        self.assertEqual(expected, compiled_ser.encode_msg(msg_type))
+                    self.assertEqual(generic_ser.decode_msg(data), compiled_ser.decode_msg(data))
+                    for n in range(2, len(data)):
+                        try:
+                            expected = generic_ser.decode_msg(data[:n])
+                        except FailedToParseMsg as e:
+                            with self.assertRaises(type(e)):
+                                compiled_ser.decode_msg(data[:n])
+                        else:
+                            self.assertEqual(expected, compiled_ser.decode_msg(data[:n]))
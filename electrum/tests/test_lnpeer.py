@@ -1169,6 +1169,60 @@ class TestPeerDirect(TestPeer):
         with self.assertRaises(GracefulDisconnect):
             await gath
 
+    async def test_gossip_back_pressure_released_when_gossip_stops(self):
+        alice_channel, bob_channel = create_test_channels()
+        p1, p2, w1, w2, _q1, _q2 = self.prepare_peers(alice_channel, bob_channel)
+        p1.GOSSIP_QUEUE_RECHECK_INTERVAL = 0.05
+        w1.network.lngossip = object()
+        # a peer we have no channels with
+        w1.channels_for_peer = lambda node_id: {}
+
+        async def ping():
+            p2.pong_event.clear()
+            p2.send_message('ping', num_pong_bytes=4, byteslen=4)
+
+        async def action():
+            await util.wait_for2(p1.initialized, 1)
+            await util.wait_for2(p2.initialized, 1)
+            for i in range(p1.GOSSIP_QUEUE_MAX_SIZE):
+                p1.gossip_queue.put_nowait(('channel_update', {}))
+            # alice answers, then stops reading
+            await ping()
+            await util.wait_for2(p2.pong_event.wait(), 1)
+            await ping()
+            await asyncio.sleep(0.2)
+            self.assertFalse(p2.pong_event.is_set())
+            # gossip gets stopped, e.g. when switching to trampoline
+            w1.network.lngossip = None
+            await util.wait_for2(p2.pong_event.wait(), 1)
+            gath.cancel()
+        gath = asyncio.gather(action(), p1._message_loop(), p2._message_loop(), p1.htlc_switch(), p2.htlc_switch())
+        with self.assertRaises(asyncio.CancelledError):
+            await gath
+
+    async def test_gossip_dropped_instead_of_back_pressure_for_channel_peer(self):
+        alice_channel, bob_channel = create_test_channels()
+        p1, p2, w1, w2, _q1, _q2 = self.prepare_peers(alice_channel, bob_channel)
+        w1.network.lngossip = object()
+
+        async def action():
+            await util.wait_for2(p1.initialized, 1)
+            await util.wait_for2(p2.initialized, 1)
+            for i in range(p1.GOSSIP_QUEUE_MAX_SIZE):
+                p1.gossip_queue.put_nowait(('node_announcement', {}))
+            # alice keeps reading, so that the channel is not held up
+            for i in range(2):
+                p2.pong_event.clear()
+                p2.send_message('ping', num_pong_bytes=4, byteslen=4)
+                await util.wait_for2(p2.pong_event.wait(), 1)
+            # but gossip that does not fit is dropped
+            p1.on_node_announcement({})
+            self.assertEqual(p1.GOSSIP_QUEUE_MAX_SIZE, p1.gossip_queue.qsize())
+            gath.cancel()
+        gath = asyncio.gather(action(), p1._message_loop(), p2._message_loop(), p1.htlc_switch(), p2.htlc_switch())
+        with self.assertRaises(asyncio.CancelledError):
+            await gath
+
     async def test_close_upfront_shutdown_script(self):
         alice_channel, bob_channel = create_test_channels()
 
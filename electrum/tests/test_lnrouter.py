@@ -3,6 +3,10 @@ import unittest
 import tempfile
 import shutil
 import asyncio
+import os
+import struct
+import time
+from unittest import mock
 from typing import Optional
 
 from electrum import util
@@ -11,10 +15,13 @@ from electrum.lnutil import ShortChannelID
 from electrum.lnonion import (OnionHopsDataSingle, new_onion_packet,
                               process_onion_packet, _decode_onion_error, decode_onion_error,
                               OnionFailureCode, OnionPacket)
-from electrum import bitcoin, lnrouter
+from electrum import bitcoin, lnrouter, ecc
+from electrum.crypto import sha256d
 from electrum.constants import BitcoinTestnet
 from electrum.simple_config import SimpleConfig
-from electrum.lnrouter import PathEdge, LiquidityHintMgr, DEFAULT_PENALTY_PROPORTIONAL_MILLIONTH, DEFAULT_PENALTY_BASE_MSAT, fee_for_edge_msat
+from electrum.channel_db import verify_gossip_signatures, GossipSnapshot
+from electrum.lnmsg import encode_msg
+from electrum.lnrouter import PathEdge, LiquidityHintMgr, DEFAULT_PENALTY_PROPORTIONAL_MILLIONTH, DEFAULT_PENALTY_BASE_MSAT, fee_for_edge_msat, PathFindingTimeout
 
 from . import ElectrumTestCase
 from .test_bitcoin import needs_test_with_all_chacha20_implementations
@@ -158,6 +165,47 @@ class Test_LNRouter(ElectrumTestCase):
         self.assertEqual(node('b'), route[0].node_id)
         self.assertEqual(channel(3), route[0].short_channel_id)
 
+    async def test_find_path_after_graph_changes(self):
+        self.prepare_graph()
+        amount_to_send = 100000
+        path = self.path_finder.find_path_for_payment(
+            nodeA=node('a'),
+            nodeB=node('e'),
+            invoice_amount_msat=amount_to_send)
+        self.assertEqual([channel(3), channel(2)], [edge.short_channel_id for edge in path])
+        # channel 3 gets disabled: the cached edges of A and B are rebuilt
+        def update_chan_3(channel_flags: bytes, timestamp: int):
+            self.cdb.add_channel_update({'short_channel_id': channel(3), 'message_flags': b'\x00', 'channel_flags': channel_flags, 'cltv_expiry_delta': 10, 'htlc_minimum_msat': 250, 'fee_base_msat': 100, 'fee_proportional_millionths': 150, 'chain_hash': BitcoinTestnet.rev_genesis_bytes(), 'timestamp': timestamp}, verify=False)
+        update_chan_3(b'\x02', 100)
+        path = self.path_finder.find_path_for_payment(
+            nodeA=node('a'),
+            nodeB=node('e'),
+            invoice_amount_msat=amount_to_send)
+        self.assertEqual([channel(6), channel(5)], [edge.short_channel_id for edge in path])
+        # channel 3 enabled again, and channel 6 removed
+        update_chan_3(b'\x00', 200)
+        self.cdb.remove_channel(channel(6))
+        path = self.path_finder.find_path_for_payment(
+            nodeA=node('a'),
+            nodeB=node('e'),
+            invoice_amount_msat=amount_to_send)
+        self.assertEqual([channel(3), channel(2)], [edge.short_channel_id for edge in path])
+
+    async def test_find_path_deadline(self):
+        self.prepare_graph()
+        with self.assertRaises(PathFindingTimeout):
+            self.path_finder.find_path_for_payment(
+                nodeA=node('a'),
+                nodeB=node('e'),
+                invoice_amount_msat=100000,
+                deadline=time.monotonic() - 1)
+        path = self.path_finder.find_path_for_payment(
+            nodeA=node('a'),
+            nodeB=node('e'),
+            invoice_amount_msat=100000,
+            deadline=time.monotonic() + 60)
+        self.assertEqual([channel(3), channel(2)], [edge.short_channel_id for edge in path])
+
     async def test_find_path_liquidity_hints(self):
         self.prepare_graph()
         amount_to_send = 100000
@@ -253,6 +301,98 @@ class Test_LNRouter(ElectrumTestCase):
         self.assertEqual(channel(3), path[0].short_channel_id)
         self.assertEqual(channel(2), path[1].short_channel_id)
 
+    async def test_channel_updates_with_verified_sigs(self):
+        self.prepare_graph()
+        def chan_upd(short_channel_id, timestamp):
+            return {'short_channel_id': short_channel_id, 'message_flags': b'\x00', 'channel_flags': b'\x00', 'cltv_expiry_delta': 10, 'htlc_minimum_msat': 250, 'fee_base_msat': 100, 'fee_proportional_millionths': 200, 'chain_hash': BitcoinTestnet.rev_genesis_bytes(), 'timestamp': timestamp, 'raw': b'upd%d' % timestamp, 'signature': bytes(64)}
+        new_upd = chan_upd(channel(1), 100)
+        deprecated_upd = chan_upd(channel(1), 10)
+        orphaned_upd = chan_upd(channel(99), 100)
+        to_verify = self.cdb.get_channel_updates_to_verify([new_upd, deprecated_upd, orphaned_upd])
+        self.assertEqual([new_upd], to_verify)
+        self.assertEqual(node('b'), new_upd['start_node'])
+        # the signature is bogus, but has been verified by the caller
+        categorized = self.cdb.add_channel_updates(to_verify, verified_sigs={(new_upd['raw'], node('b'))})
+        self.assertEqual([new_upd], categorized.good)
+
+    def test_verify_gossip_signatures(self):
+        privkey1 = ecc.ECPrivkey(bytes([1] * 32))
+        privkey2 = ecc.ECPrivkey(bytes([2] * 32))
+        data = b'channel_update'
+        sig1 = privkey1.sign(sha256d(data))
+        sig2 = privkey2.sign(sha256d(data))
+        pubkey1 = privkey1.get_public_key_bytes()
+        pubkey2 = privkey2.get_public_key_bytes()
+        self.assertEqual(
+            [True, True, False, False],
+            verify_gossip_signatures([
+                (data, [(pubkey1, sig1)]),
+                (data, [(pubkey1, sig1), (pubkey2, sig2)]),
+                (data, [(pubkey1, sig1), (pubkey2, sig1)]),
+                (b'other data', [(pubkey1, sig1)]),
+            ]))
+
+    async def test_load_data_from_snapshot(self):
+        class fake_network:
+            config = self.config
+            asyncio_loop = util.get_asyncio_loop()
+            trigger_callback = lambda *args: None
+            register_callback = lambda *args: None
+            interface = None
+        chain_hash = BitcoinTestnet.rev_genesis_bytes()
+        chan_ann = encode_msg(
+            'channel_announcement', len=0, features=b'', chain_hash=chain_hash, short_channel_id=channel(1),
+            node_id_1=node('a'), node_id_2=node('b'), bitcoin_key_1=node('a'), bitcoin_key_2=node('b'))
+        chan_upd1 = encode_msg(
+            'channel_update', short_channel_id=channel(1), channel_flags=b'\x00', message_flags=b'\x01',
+            cltv_expiry_delta=40, htlc_minimum_msat=1000, htlc_maximum_msat=10**9, fee_base_msat=1000,
+            fee_proportional_millionths=1, chain_hash=chain_hash, timestamp=1_700_000_000)
+        def chan_upd2(fee_proportional_millionths):
+            return encode_msg(
+                'channel_update', short_channel_id=channel(1), channel_flags=b'\x01', message_flags=b'\x00',
+                cltv_expiry_delta=144, htlc_minimum_msat=1, fee_base_msat=0,
+                fee_proportional_millionths=fee_proportional_millionths, chain_hash=chain_hash, timestamp=1_700_000_001)
+        node_ann = encode_msg(
+            'node_announcement', flen=2, features=(1 << 9).to_bytes(2, 'big'), timestamp=1_700_000_002,
+            rgb_color=bytes(3), node_id=node('a'), alias=b'alice' + bytes(27), addrlen=0, addresses=b'')
+
+        async def load_channel_db(fee_proportional_millionths=100) -> lnrouter.ChannelDB:
+            cdb = lnrouter.ChannelDB(fake_network())
+            await cdb._db_save_channel(channel(1), chan_ann)
+            await cdb._db_save_policy(channel(1) + node('a'), chan_upd1)
+            await cdb._db_save_policy(channel(1) + node('b'), chan_upd2(fee_proportional_millionths))
+            await cdb._db_save_node_info(node('a'), node_ann)
+            await cdb.load_data()
+            cdb.stop()
+            await cdb.stopped_event.wait()
+            return cdb
+
+        cdb1 = await load_channel_db()
+        self.assertTrue(os.path.exists(cdb1.get_snapshot_path()))
+        self.assertEqual(1, len(cdb1._channels))
+        self.assertEqual(2, len(cdb1._policies))
+        self.assertEqual('alice', cdb1._nodes[node('a')].alias)
+        # the second time, nothing needs to be decoded
+        with mock.patch('electrum.channel_db.decode_msg', side_effect=Exception('decode_msg called')):
+            cdb2 = await load_channel_db()
+        self.assertEqual(cdb1._channels, cdb2._channels)
+        self.assertEqual(cdb1._policies, cdb2._policies)
+        self.assertEqual(cdb1._nodes, cdb2._nodes)
+        # rows whose message changed are decoded again
+        cdb3 = await load_channel_db(fee_proportional_millionths=200)
+        self.assertEqual(200, cdb3._policies[(node('b'), channel(1))].fee_proportional_millionths)
+        self.assertEqual(cdb1._nodes, cdb3._nodes)
+
+    def test_gossip_snapshot_version(self):
+        snapshot = GossipSnapshot()
+        snapshot.nodes[node('a')] = bytes(16), lnrouter.NodeInfo(node_id=node('a'), features=0, timestamp=0, alias='')
+        data = snapshot.serialize()
+        self.assertEqual(snapshot.nodes, GossipSnapshot.deserialize(data).nodes)
+        with mock.patch.object(GossipSnapshot, 'VERSION', GossipSnapshot.VERSION + 1):
+            self.assertIsNone(GossipSnapshot.deserialize(data))
+        with self.assertRaises(struct.error):
+            GossipSnapshot.deserialize(data[:-1])
+
     def test_liquidity_hints(self):
         liquidity_hints = LiquidityHintMgr()
         node_from = bytes(0)
@@ -1,9 +1,12 @@
 import asyncio
+import os
+import random
 
 from electrum import util
 from electrum.ecc import ECPrivkey
 from electrum.lnutil import LNPeerAddr
-from electrum.lntransport import LNResponderTransport, LNTransport
+from electrum.lntransport import LNResponderTransport, LNTransport, LNTransportBase
+from electrum.lnutil import LightningPeerConnectionClosed
 from electrum.util import OldTaskGroup
 
 from . import ElectrumTestCase
@@ -97,3 +100,39 @@ class TestLNTransport(ElectrumTestCase):
                 server.close()
 
         await f()
+
+    @needs_test_with_all_chacha20_implementations
+    async def test_read_message_batches(self):
+        # messages arrive in chunks of random size, and cross key rotations
+        ck, key = os.urandom(32), os.urandom(32)
+        sent = [os.urandom(2**16 - 1 if i == 5 else random.randrange(300)) for i in range(2500)]
+        class Writer:
+            data = bytearray()
+            def write(self, data):
+                self.data += data
+        class Reader:
+            def __init__(self, data):
+                self.data = data
+            async def read(self, num_bytes):
+                n = min(num_bytes, random.randrange(1, 5000))
+                s, self.data = self.data[:n], self.data[n:]
+                return s
+        sender = LNTransportBase()
+        sender.init_counters(ck)
+        sender.sk = key
+        sender.writer = Writer()
+        for msg in sent:
+            sender.send_bytes(msg)
+        receiver = LNTransportBase()
+        receiver.init_counters(ck)
+        receiver.rk = key
+        receiver.reader = Reader(bytes(sender.writer.data))
+        received = []
+        num_batches = 0
+        with self.assertRaises(LightningPeerConnectionClosed):
+            async for msgs in receiver.read_message_batches():
+                self.assertTrue(msgs)
+                received += msgs
+                num_batches += 1
+        self.assertEqual(sent, received)
+        self.assertLess(num_batches, len(sent))
@@ -126,6 +126,49 @@ class TestNetwork(ElectrumTestCase):
         self.assertEqual(('catchup', 7), res)
         self.assertEqual(self.interface.q.qsize(), 0)
 
+    async def test_pipelined_chunks_connect_in_order(self):
+        blockchain.blockchains = {}
+        ifa = self.interface
+        ifa.tip = 5 * 2016 + 100
+        fetched = []
+        connected = []
+        async def mock_fetch_chunk(index, size):
+            fetched.append(index)
+            # later chunks arrive first
+            await asyncio.sleep(0.01 * (10 - index))
+            return str(index) * size
+        def mock_connect_chunk(index, chunk_hex, *, header_hashes=None):
+            connected.append((index, len(chunk_hex)))
+            return True
+        ifa._fetch_chunk = mock_fetch_chunk
+        ifa.blockchain.connect_chunk = mock_connect_chunk
+        self.config.NETWORK_HEADER_CHUNK_PIPELINE_DEPTH = 3
+        res = await ifa.request_chunks_pipelined(2016 + 5, ifa.tip)
+        self.assertEqual((True, 4 * 2016 + 101), res)
+        self.assertEqual([1, 2, 3, 4, 5], sorted(fetched))
+        self.assertEqual([(1, 2016), (2, 2016), (3, 2016), (4, 2016), (5, 101)], connected)
+        self.assertEqual(set(), ifa._requested_chunks)
+
+    async def test_pipelined_chunks_stop_at_first_bad_chunk(self):
+        blockchain.blockchains = {}
+        ifa = self.interface
+        ifa.tip = 5 * 2016 + 100
+        async def mock_fetch_chunk(index, size):
+            return str(index) * size
+        connected = []
+        def mock_connect_chunk(index, chunk_hex, *, header_hashes=None):
+            if index == 3:
+                return False
+            connected.append(index)
+            return True
+        ifa._fetch_chunk = mock_fetch_chunk
+        ifa.blockchain.connect_chunk = mock_connect_chunk
+        self.config.NETWORK_HEADER_CHUNK_PIPELINE_DEPTH = 4
+        res = await ifa.request_chunks_pipelined(2016, ifa.tip)
+        self.assertEqual((False, 2 * 2016), res)
+        self.assertEqual([1, 2], connected)
+        self.assertEqual(set(), ifa._requested_chunks)
+
 
 if __name__=="__main__":
     constants.set_regtest()
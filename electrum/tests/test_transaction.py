@@ -153,6 +153,29 @@ class TestTransaction(ElectrumTestCase):
         self.assertEqual(tx.estimated_weight(), 561)
         self.assertEqual(tx.estimated_size(), 141)
 
+    def test_sign_mixed_legacy_and_segwit_inputs(self):
+        privkey = ECPrivkey(bfh('730fff80e1413068a05b57d6a58261f07551163369787f349438ea38ca80fac6'))
+        pubkey = privkey.get_public_key_hex(compressed=True)
+        inputs = []
+        for i, script_type in enumerate(['p2pkh', 'p2wpkh', 'p2pkh', 'p2wpkh-p2sh', 'p2pkh']):
+            desc = descriptor.get_singlesig_descriptor_from_legacy_leaf(pubkey=pubkey, script_type=script_type)
+            txin = PartialTxInput(prevout=TxOutpoint(txid=bytes([i + 1]) * 32, out_idx=i))
+            txin.script_descriptor = desc
+            txin.witness_utxo = transaction.TxOutput(scriptpubkey=desc.expand().output_script, value=100_000 * (i + 1))
+            txin.nsequence = 0xffffffff - i
+            inputs.append(txin)
+        outputs = [PartialTxOutput(scriptpubkey=bfh('76a914389ffce9cd9ae88dcc0631e88a821ffdbe9bfe2688ac'), value=1_000_000),
+                   PartialTxOutput(scriptpubkey=bfh('0014b65ce60857f7e7892b983851c2a8e3526d09e4ab'), value=450_000)]
+        tx = PartialTransaction.from_io(inputs, outputs, locktime=800_000, version=2, BIP69_sort=False)
+        # preimages do not depend on the signatures added in between, nor on the cache
+        sighash_cache = transaction.SighashCache(tx)
+        preimages = [tx.serialize_preimage(i, sighash_cache=sighash_cache) for i in range(len(inputs))]
+        tx.sign({pubkey: (privkey.get_secret_bytes(), True)})
+        self.assertTrue(tx.is_complete())
+        self.assertEqual(preimages, [tx.serialize_preimage(i) for i in range(len(inputs))])
+        self.assertEqual('020000000001050101010101010101010101010101010101010101010101010101010101010101000000006a47304402205d5f684f4efb3c0b555836abf78c8b9fc9538587213faffd57c25d459e97205702202a70b5b59c903d2709ab81b86ba66e0c939319fcc63ee99912934c3c32aaa9e701210307b8ae49ac90a048e9b53357a2354b3334e9c8bee813ecb98e99a7e07e8c3ba3ffffffff02020202020202020202020202020202020202020202020202020202020202020100000000feffffff0303030303030303030303030303030303030303030303030303030303030303020000006a47304402204794684b8100b0adcf96346566e5a75b97953acc0d97d9a3edab6d0374cd90440220543bd3bd3a5b28f903a080f9fb204d38b22be1884eb61a6f09b3f92697dc8a2201210307b8ae49ac90a048e9b53357a2354b3334e9c8bee813ecb98e99a7e07e8c3ba3fdffffff04040404040404040404040404040404040404040404040404040404040404040300000017160014876c4e6206b61a3574952b2a1d87404aa155c21bfcffffff0505050505050505050505050505050505050505050505050505050505050505040000006a473044022072e8cd0ba25790fa5f3534fa798f5b1f6c36b3c489d70dcd07f561e3e0e2bc74022053785f774a3d3d75ba1c7a31b0f8365cf8b87c8d3b5894a57f51345400b832d701210307b8ae49ac90a048e9b53357a2354b3334e9c8bee813ecb98e99a7e07e8c3ba3fbffffff0240420f00000000001976a914389ffce9cd9ae88dcc0631e88a821ffdbe9bfe2688acd0dd060000000000160014b65ce60857f7e7892b983851c2a8e3526d09e4ab0002473044022060592efd9b5e1b8747f1ab89b16a4ec1372493a9050ca4bb0e70eed2a05ebc6402201fd6f31927f7465c5e1e53d25d23db6f9bfee5b4b9f90058d14e6c02ac9dd6d401210307b8ae49ac90a048e9b53357a2354b3334e9c8bee813ecb98e99a7e07e8c3ba300024730440220651448d2a559bfb0f347bdc9975a25ca4107764ea06234aefbb754dc5c7e4fcd02204e7ec8ac282ce5e01b305451119b4470cd05b18fcda46b03c2b23e20ba72d78001210307b8ae49ac90a048e9b53357a2354b3334e9c8bee813ecb98e99a7e07e8c3ba30000350c00',
+                         tx.serialize())
+
     def test_version_field(self):
         tx = transaction.Transaction(v2_blob)
         self.assertEqual(tx.txid(), "b97f9180173ab141b61b9f944d841e60feec691d6daab4d4d932b24dd36606fe")
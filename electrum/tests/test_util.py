@@ -442,3 +442,17 @@ class TestUtil(ElectrumTestCase):
                          util.age(from_date=now.timestamp()+103012200, since_date=now))
 
 
+
+    def test_lru_cache(self):
+        cache = util.LRUCache(maxsize=2)
+        cache['a'] = 1
+        cache['b'] = 2
+        self.assertEqual(1, cache['a'])  # 'b' is now least recently used
+        cache['c'] = 3
+        self.assertEqual(['a', 'c'], list(cache))
+        self.assertEqual(None, cache.get('b'))
+        self.assertEqual(1, cache.get('a'))
+        cache['d'] = 4
+        self.assertEqual(['a', 'd'], list(cache))
+        self.assertEqual(4, cache.pop('d'))
+        self.assertEqual(1, len(cache))
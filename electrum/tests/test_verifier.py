@@ -1,8 +1,12 @@
 # -*- coding: utf-8 -*-
+import asyncio
+from unittest import mock
 
 from electrum.bitcoin import hash_encode
 from electrum.transaction import Transaction
-from electrum.util import bfh
+from electrum.blockchain import deserialize_header, hash_header
+from electrum.util import bfh, TxMinedInfo
+from electrum import constants
 from electrum.verifier import SPV, InnerNodeOfSpvProofIsValidTx
 
 from . import ElectrumTestCase
@@ -49,3 +53,93 @@ class VerifierTestCase(ElectrumTestCase):
         f_tx_hash = hash_encode(bfh(VALID_64_BYTE_TX[:64]))
         with self.assertRaises(InnerNodeOfSpvProofIsValidTx):
             SPV.hash_merkle_root(fake_mbranch, f_tx_hash, 6)
+
+
+class TestSPVMainLoop(ElectrumTestCase):
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.network = mock.Mock(asyncio_loop=asyncio.get_running_loop(), interface=None)
+        self.network.config.NETWORK_REQUEST_BATCH_SIZE = 50
+        self.blockchain = mock.Mock()
+        self.blockchain.height.return_value = 100
+        self.blockchain.read_header.side_effect = lambda height: deserialize_header(height.to_bytes(80, 'little'), height)
+        self.network.blockchain.return_value = self.blockchain
+        self.adb = mock.Mock(unverified_tx={'aa' * 32: 90}, synchronizer=None)
+        self.adb.get_unverified_txs.side_effect = lambda: dict(self.adb.unverified_tx)
+        self.spv = SPV(self.network, self.adb)
+        self.requested = []
+
+        async def request_proofs(tx_hashes, tx_height):
+            self.requested.append((sorted(tx_hashes), tx_height))
+        self.spv._request_and_verify_proofs = request_proofs
+        self.main_task = asyncio.create_task(self.spv.main())
+        await asyncio.sleep(0.01)
+
+    async def asyncTearDown(self):
+        self.main_task.cancel()
+        await self.spv.taskgroup.cancel_remaining()
+        await super().asyncTearDown()
+
+    def _add_unverified_tx(self, tx_hash, tx_height):
+        self.adb.unverified_tx[tx_hash] = tx_height
+        self.spv.add_tx_to_check(tx_hash)
+
+    async def test_new_unverified_tx_is_picked_up(self):
+        self.assertEqual([(['aa' * 32], 90)], self.requested)
+        self._add_unverified_tx('bb' * 32, 95)
+        await asyncio.sleep(0.01)
+        self.assertEqual([(['aa' * 32], 90), (['bb' * 32], 95)], self.requested)
+
+    async def test_tx_above_local_height_waits_for_headers(self):
+        self._add_unverified_tx('bb' * 32, 101)
+        await asyncio.sleep(0.01)
+        self.assertEqual([(['aa' * 32], 90)], self.requested)
+        self.blockchain.height.return_value = 101
+        self.spv._on_blockchain_updated()
+        await asyncio.sleep(0.01)
+        self.assertEqual([(['aa' * 32], 90), (['bb' * 32], 101)], self.requested)
+
+    async def test_proofs_are_batched_per_height(self):
+        for tx_hash in ('bb' * 32, 'cc' * 32, 'dd' * 32):
+            self.adb.unverified_tx[tx_hash] = 95
+        self.adb.unverified_tx['ee' * 32] = 96
+        for tx_hash in ('bb' * 32, 'cc' * 32, 'dd' * 32, 'ee' * 32):
+            self.spv.add_tx_to_check(tx_hash)
+        await asyncio.sleep(0.01)
+        self.assertEqual(
+            [(['aa' * 32], 90), (['bb' * 32, 'cc' * 32, 'dd' * 32], 95), (['ee' * 32], 96)],
+            sorted(self.requested, key=lambda x: x[1]))
+
+    async def test_verified_proof_is_reused_for_same_block(self):
+        header = self.blockchain.read_header(90)
+        self.spv._verified_proofs[('bb' * 32, hash_header(header))] = 3
+        self._add_unverified_tx('bb' * 32, 90)
+        await asyncio.sleep(0.01)
+        self.assertEqual([(['aa' * 32], 90)], self.requested)
+        self.adb.add_verified_tx.assert_called_once_with(
+            'bb' * 32, TxMinedInfo(height=90, timestamp=header['timestamp'], txpos=3, header_hash=hash_header(header)))
+        # a proof for another block at that height is requested again
+        self.spv.merkle_roots.clear()
+        self.blockchain.read_header.side_effect = lambda height: deserialize_header(bytes(80), height)
+        self._add_unverified_tx('bb' * 32, 90)
+        await asyncio.sleep(0.01)
+        self.assertEqual([(['aa' * 32], 90), (['bb' * 32], 90)], self.requested)
+
+    async def test_tx_waiting_for_chunk_in_flight_is_checked_when_it_arrives(self):
+        read_header = self.blockchain.read_header.side_effect
+        self.blockchain.read_header.side_effect = lambda height: None if height == 50 else read_header(height)
+        self.spv.interface = mock.Mock()
+        self.spv.interface.request_chunk = mock.AsyncMock(return_value=None)  # already being requested
+        self.spv.interface.is_requesting_chunk.return_value = True
+        with mock.patch('electrum.verifier.CHUNK_IN_FLIGHT_RECHECK_INTERVAL', 0.01), \
+                mock.patch.object(constants.net, 'max_checkpoint', return_value=2016):
+            self._add_unverified_tx('bb' * 32, 50)
+            await asyncio.sleep(0.05)
+            self.assertEqual([(['aa' * 32], 90)], self.requested)
+            # the chunk arrives, without any new headers on top of our chain
+            self.blockchain.read_header.side_effect = read_header
+            self.spv.interface.is_requesting_chunk.return_value = False
+            await asyncio.sleep(0.05)
+        self.assertEqual([(['aa' * 32], 90), (['bb' * 32], 50)], self.requested)
+        self.spv.interface.request_chunk.assert_awaited_once()
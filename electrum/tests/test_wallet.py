@@ -7,17 +7,19 @@ from decimal import Decimal
 import time
 from io import StringIO
 import asyncio
+from unittest import mock
 
-from electrum.storage import WalletStorage
+from electrum.storage import WalletStorage, StorageEncryptionVersion
 from electrum.wallet_db import FINAL_SEED_VERSION
 from electrum.wallet import (Abstract_Wallet, Standard_Wallet, create_new_wallet,
                              restore_wallet_from_text, Imported_Wallet, Wallet)
 from electrum.exchange_rate import ExchangeBase, FxThread
 from electrum.util import TxMinedInfo, InvalidPassword
+from electrum.transaction import Transaction, TxOutpoint
 from electrum.bitcoin import COIN
-from electrum.wallet_db import WalletDB, JsonDB
+from electrum.wallet_db import WalletDB, JsonDB, history_status
 from electrum.simple_config import SimpleConfig
-from electrum import util
+from electrum import util, json_db
 
 from . import ElectrumTestCase
 
@@ -84,6 +86,138 @@ class TestWalletStorage(WalletTestCase):
         for key, value in some_dict.items():
             self.assertEqual(d[key], value)
 
+    def _create_db_with_patches(self, num_patches):
+        storage = WalletStorage(self.wallet_path)
+        db = JsonDB('', storage=storage)
+        db.put('seed_version', FINAL_SEED_VERSION)
+        # large enough so that the appended patches do not trigger consolidation
+        db.put('bulk', os.urandom(50 * num_patches).hex())
+        db.write()
+        storage = WalletStorage(self.wallet_path)
+        db = JsonDB(storage.read(), storage=storage)
+        for i in range(num_patches):
+            db.put(f'k{i}', {'i': i})
+            db.write()
+        with open(self.wallet_path, "r") as f:
+            self.assertEqual(num_patches, f.read().count(',\n{"op"'))
+
+    def test_load_replays_patches(self):
+        n = 2 * json_db.PATCH_BATCH_SIZE + 5
+        self._create_db_with_patches(n)
+        progress = []
+        storage = WalletStorage(self.wallet_path)
+        db = JsonDB(storage.read(), progress_cb=progress.append)
+        for i in range(n):
+            self.assertEqual({'i': i}, db.get(f'k{i}'))
+        self.assertTrue(db.modified())
+        self.assertEqual(1.0, progress[-1])
+        self.assertTrue(len(progress) > 2)
+        self.assertEqual(sorted(progress), progress)
+
+    def test_load_ignores_incomplete_last_patch(self):
+        self._create_db_with_patches(3)
+        with open(self.wallet_path, "rb+") as f:
+            f.truncate(os.path.getsize(self.wallet_path) - 3)
+        storage = WalletStorage(self.wallet_path)
+        db = JsonDB(storage.read(), storage=storage)
+        self.assertEqual({'i': 1}, db.get('k1'))
+        self.assertEqual(None, db.get('k2'))
+        # the file was rewritten without the incomplete patch
+        with open(self.wallet_path, "r") as f:
+            self.assertEqual(0, f.read().count(',\n{"op"'))
+
+    def test_load_fails_on_corrupt_patch_before_the_last_one(self):
+        s = '{"a": 1},\n{"op": "replace", "path": "/a", "value": 2},\ngarbage,\n{"op": "add", "path": "/b", "value": 3}'
+        with self.assertRaises(util.WalletFileException):
+            JsonDB(s)
+        # only the last record can be incomplete
+        db = JsonDB('{"a": 1},\n{"op": "replace", "path": "/a", "value": 2},\n{"op": "add", "pa\n  ')
+        self.assertEqual(2, db.get('a'))
+        self.assertTrue(db.modified())
+
+    def _create_encrypted_db(self, password):
+        storage = WalletStorage(self.wallet_path)
+        storage.set_password(password, enc_version=StorageEncryptionVersion.USER_PASSWORD)
+        db = JsonDB('', storage=storage)
+        db.put('a', 'b')
+        # large enough so that a few appended records do not trigger consolidation
+        db.put('bulk', os.urandom(2000).hex())
+        db.put('seed_version', FINAL_SEED_VERSION)
+        db.write()
+        return storage, db
+
+    def _open_encrypted_db(self, password):
+        storage = WalletStorage(self.wallet_path)
+        self.assertTrue(storage.is_encrypted_with_user_pw())
+        storage.decrypt(password)
+        return storage, JsonDB(storage.read(), storage=storage)
+
+    def test_encrypted_changes_are_appended(self):
+        self._create_encrypted_db('pw')
+        storage, db = self._open_encrypted_db('pw')
+        size_before = os.path.getsize(self.wallet_path)
+        db.put('c', 'd')
+        db.write()
+        db.put('e', {'f': 1})
+        db.write()
+        with open(self.wallet_path, "r") as f:
+            lines = f.read().split('\n')
+        self.assertEqual(3, len(lines))
+        self.assertTrue(os.path.getsize(self.wallet_path) > size_before)
+        # changes are encrypted too
+        self.assertFalse(any('"c"' in line for line in lines))
+
+        storage, db = self._open_encrypted_db('pw')
+        self.assertEqual('b', db.get('a'))
+        self.assertEqual('d', db.get('c'))
+        self.assertEqual({'f': 1}, db.get('e'))
+        # opening a db with appended changes consolidates it
+        with open(self.wallet_path, "r") as f:
+            self.assertEqual(1, len(f.read().split('\n')))
+        with self.assertRaises(InvalidPassword):
+            WalletStorage(self.wallet_path).decrypt('wrong password')
+
+    def test_encrypted_incomplete_last_record_is_ignored(self):
+        self._create_encrypted_db('pw')
+        storage, db = self._open_encrypted_db('pw')
+        db.put('c', 'd')
+        db.write()
+        db.put('e', 'f')
+        db.write()
+        # simulate crash while appending the last record
+        with open(self.wallet_path, "rb+") as f:
+            f.truncate(os.path.getsize(self.wallet_path) - 10)
+        storage, db = self._open_encrypted_db('pw')
+        self.assertEqual('d', db.get('c'))
+        self.assertEqual(None, db.get('e'))
+        # the remaining changes were consolidated when opening
+        with open(self.wallet_path, "r") as f:
+            self.assertEqual(1, len(f.read().split('\n')))
+        # now with nothing to consolidate on open
+        db.put('e', 'f')
+        db.write()
+        with open(self.wallet_path, "rb+") as f:
+            f.truncate(os.path.getsize(self.wallet_path) - 10)
+        storage, db = self._open_encrypted_db('pw')
+        self.assertEqual(None, db.get('e'))
+        # next write must not append after the incomplete record
+        self.assertTrue(storage.needs_consolidation())
+        db.put('g', 'h')
+        db.write()
+        storage, db = self._open_encrypted_db('pw')
+        self.assertEqual('h', db.get('g'))
+
+    def test_encrypted_password_change_forces_consolidation(self):
+        self._create_encrypted_db('pw')
+        storage, db = self._open_encrypted_db('pw')
+        self.assertFalse(storage.needs_consolidation())
+        storage.set_password('new pw')
+        self.assertTrue(storage.needs_consolidation())
+        db.put('c', 'd')
+        db.write()
+        storage, db = self._open_encrypted_db('new pw')
+        self.assertEqual('d', db.get('c'))
+
     async def test_storage_imported_add_privkeys_persistence_test(self):
         text = ' '.join([
             'p2wpkh:L4jkdiXszG26SUYvwwJhzGwg37H2nLhrbip7u6crmgNeJysv5FHL',
@@ -118,6 +252,145 @@ class TestWalletStorage(WalletTestCase):
         self.assertTrue('02f11d5f222a728fd08226cb5a1e85a74d58fc257bd3764bf1234346f91defed72' in wallet.keystore.keypairs)
 
 
+TX_HEX = '01000000012a5c9a94fcde98f5581cd00162c60a13936ceb75389ea65bf38633b424eb4031000000006c493046022100a82bbc57a0136751e5433f41cf000b3f1a99c6744775e76ec764fb78c54ee100022100f9e80b7de89de861dc6fb0c1429d5da72c2b6b2ee2406bc9bfb1beedd729d985012102e61d176da16edd1d258a200ad9759ef63adf8e14cd97f53227bae35cdb84d2f6ffffffff0140420f00000000001976a914230ac37834073a42146f11ef8414ae929feaafc388ac00000000'
+TXID = '8334c637900f1d2cd1d8abbd94a676e0ac92c2a20d19b3ca210a0f538ab157c8'
+ADDR = '149fQ7dAv3HCibcyMXa8PKzokGDVJ7vXZq'
+
+
+class TestWalletDBTransactions(WalletTestCase):
+
+    def test_transactions_are_parsed_lazily(self):
+        db = WalletDB('', storage=WalletStorage(self.wallet_path), upgrade=True)
+        tx = Transaction(TX_HEX)
+        db.add_transaction(TXID, tx)
+        db.add_txo_addr(TXID, ADDR, 0, 1000000, False)
+        # the db does not share the object with the caller
+        self.assertIsNot(tx, db.get_transaction(TXID))
+        db.write()
+        storage = WalletStorage(self.wallet_path)
+        db = WalletDB(storage.read(), storage=storage, upgrade=True)
+        self.assertEqual(0, len(db._parsed_txs))
+        self.assertEqual(TX_HEX, db.transactions[TXID])
+        tx = db.get_transaction(TXID)
+        self.assertEqual(TXID, tx.txid())
+        self.assertIs(tx, db.get_transaction(TXID))
+        self.assertEqual(None, db.get_transaction('00' * 32))
+        self.assertEqual(TXID, db.remove_transaction(TXID).txid())
+        self.assertEqual(0, len(db._parsed_txs))
+
+    def test_complete_tx_replaces_partial_tx(self):
+        db = WalletDB('', storage=None, upgrade=True)
+        db.add_transaction(TXID, Transaction(TX_HEX))
+        db.transactions[TXID] = 'cHNidP8' + db.transactions[TXID]  # pretend it is a psbt
+        db.add_transaction(TXID, Transaction(TX_HEX))
+        self.assertEqual(TX_HEX, db.transactions[TXID])
+
+    def test_addr_history_status_is_persisted(self):
+        db = WalletDB('', storage=WalletStorage(self.wallet_path), upgrade=True)
+        self.assertEqual(None, db.get_addr_history_status(ADDR))
+        hist = [(TXID, 100)]
+        db.set_addr_history(ADDR, hist)
+        self.assertEqual(history_status(hist), db.get_addr_history_status(ADDR))
+        db.write()
+        storage = WalletStorage(self.wallet_path)
+        db = WalletDB(storage.read(), storage=storage, upgrade=True)
+        with mock.patch('electrum.wallet_db.history_status') as mock_history_status:
+            self.assertEqual(history_status(hist), db.get_addr_history_status(ADDR))
+            mock_history_status.assert_not_called()
+        # statuses missing from older wallet files are computed on first use
+        db.addr_status.clear()
+        self.assertEqual(history_status(hist), db.get_addr_history_status(ADDR))
+        db.set_addr_history(ADDR, [])
+        self.assertEqual(None, db.get_addr_history_status(ADDR))
+
+
+class TestWalletDBSqlEngine(WalletTestCase):
+
+    def _fill_db(self, db: WalletDB):
+        db.add_transaction(TXID, Transaction(TX_HEX))
+        db.add_txo_addr(TXID, ADDR, 0, 1000000, False)
+        db.add_txi_addr(TXID, ADDR, 'ab' * 32 + ':1', 2000)
+        db.set_addr_history(ADDR, [(TXID, 100)])
+        db.add_verified_tx(TXID, TxMinedInfo(height=100, timestamp=1234, txpos=1, header_hash='cd' * 32))
+        db.set_spent_outpoint('ab' * 32, 1, TXID)
+        db.add_prevout_by_scripthash('ef' * 32, prevout=TxOutpoint.from_str(TXID + ':0'), value=1000000)
+
+    def _check_db(self, db: WalletDB):
+        self.assertEqual([TXID], db.list_transactions())
+        self.assertEqual(TXID, db.get_transaction(TXID).txid())
+        self.assertEqual({0: (1000000, False)}, db.get_txo_addr(TXID, ADDR))
+        self.assertEqual([('ab' * 32 + ':1', 2000)], db.get_txi_addr(TXID, ADDR))
+        self.assertEqual([[TXID, 100]], [list(x) for x in db.get_addr_history(ADDR)])
+        self.assertEqual(1234, db.get_verified_tx(TXID).timestamp)
+        self.assertEqual(TXID, db.get_spent_outpoint('ab' * 32, 1))
+        self.assertEqual({(TxOutpoint.from_str(TXID + ':0'), 1000000)}, db.get_prevouts_by_scripthash('ef' * 32))
+
+    def _open_db(self) -> WalletDB:
+        storage = WalletStorage(self.wallet_path)
+        return WalletDB(storage.read(), storage=storage, upgrade=True)
+
+    def test_migrate_json_to_sqlite_and_back(self):
+        db = WalletDB('', storage=WalletStorage(self.wallet_path), upgrade=True)
+        self._fill_db(db)
+        db.write()
+        db = self._open_db()
+        db.set_storage_engine('sqlite')
+        db.write()
+        self.assertTrue(os.path.exists(self.wallet_path + '.sqlite'))
+        db = self._open_db()
+        self.assertEqual('sqlite', db.get_storage_engine())
+        self.assertNotIn('transactions', db.data)
+        self.assertNotIn('addr_history', db.data)
+        self._check_db(db)
+        # backups are self-contained json files
+        d = json.loads(db.dump(include_sql_tables=True))
+        self.assertNotIn('storage_engine', d)
+        self.assertIn(TXID, d['transactions'])
+        # and back to json
+        db.set_storage_engine('json')
+        self._check_db(db)
+        db.write()
+        self.assertFalse(os.path.exists(self.wallet_path + '.sqlite'))
+        db = self._open_db()
+        self.assertEqual('json', db.get_storage_engine())
+        self._check_db(db)
+
+    def test_sqlite_changes_persist(self):
+        db = WalletDB('', storage=WalletStorage(self.wallet_path), upgrade=True)
+        db.set_storage_engine('sqlite')
+        self._fill_db(db)
+        db.write()
+        db = self._open_db()
+        self._check_db(db)
+        # nested modifications are written back
+        db.add_txo_addr(TXID, ADDR, 1, 5, True)
+        db.remove_spent_outpoint('ab' * 32, 1)
+        db.remove_prevout_by_scripthash('ef' * 32, prevout=TxOutpoint.from_str(TXID + ':0'), value=1000000)
+        db.write()
+        db = self._open_db()
+        self.assertEqual({0: (1000000, False), 1: (5, True)}, db.get_txo_addr(TXID, ADDR))
+        self.assertEqual(None, db.get_spent_outpoint('ab' * 32, 1))
+        self.assertEqual([], db.list_spent_outpoints())
+        self.assertEqual(set(), db.get_prevouts_by_scripthash('ef' * 32))
+        # unreferenced txs are removed when loading
+        db.remove_txi(TXID)
+        db.remove_txo(TXID)
+        db.write()
+        db = self._open_db()
+        self.assertEqual([], db.list_transactions())
+        db.clear_history()
+        self.assertEqual([], db.get_history())
+
+    def test_sqlite_refused_for_encrypted_storage(self):
+        storage = WalletStorage(self.wallet_path)
+        storage.set_password('pw', enc_version=StorageEncryptionVersion.USER_PASSWORD)
+        db = WalletDB('', storage=storage, upgrade=True)
+        with self.assertRaises(util.WalletFileException):
+            db.set_storage_engine('sqlite')
+        with self.assertRaises(ValueError):
+            db.set_storage_engine('leveldb')
+
+
 class FakeExchange(ExchangeBase):
     def __init__(self, rate):
         super().__init__(lambda self: None, lambda self: None)
@@ -146,7 +419,8 @@ class FakeWallet:
         self.fiat_value = fiat_value
         self.db = WalletDB('', storage=None, upgrade=False)
         self.adb = FakeADB()
-        self.db.transactions = self.db.verified_tx = {'abc':'Tx'}
+        self.db.transactions = {'abc': TX_HEX}
+        self.db.verified_tx = {'abc':'Tx'}
 
     default_fiat_value = Abstract_Wallet.default_fiat_value
     price_at_timestamp = Abstract_Wallet.price_at_timestamp
@@ -5,6 +5,7 @@ import tempfile
 from typing import Sequence
 import asyncio
 import copy
+from decimal import Decimal
 
 from electrum import storage, bitcoin, keystore, bip32, slip39, wallet
 from electrum import Transaction
@@ -15,10 +16,11 @@ from electrum.wallet import (sweep, Multisig_Wallet, Standard_Wallet, Imported_W
                              restore_wallet_from_text, Abstract_Wallet, CannotBumpFee, BumpFeeStrategy,
                              TransactionPotentiallyDangerousException, TransactionDangerousException,
                              TxSighashRiskLevel)
-from electrum.util import bfh, NotEnoughFunds, UnrelatedTransactionException, UserFacingException
+from electrum.util import bfh, NotEnoughFunds, UnrelatedTransactionException, UserFacingException, TxMinedInfo
 from electrum.transaction import Transaction, PartialTxOutput, tx_from_any, Sighash
 from electrum.mnemonic import seed_type
 from electrum.network import Network
+from electrum.exchange_rate import FxThread
 
 from electrum.plugins.trustedcoin import trustedcoin
 
@@ -3920,6 +3922,105 @@ class TestWalletHistory_SimpleRandomOrder(ElectrumTestCase):
             w.adb.receive_tx_callback(tx, TX_HEIGHT_UNCONFIRMED)
         self.assertEqual(27633300, sum(w.get_balance()))
 
+    @mock.patch.object(wallet.Abstract_Wallet, 'save_db')
+    async def test_history_follows_verified_txs(self, mock_save_db):
+        w = self.create_old_wallet()
+        for i in [9, 18, 2, 0, 13, 3, 1, 11, 4, 17, 7, 14, 12, 15, 10, 8, 5, 6, 16]:
+            tx = Transaction(self.transactions[self.txid_list[i]])
+            w.adb.receive_tx_callback(tx, TX_HEIGHT_UNCONFIRMED)
+        domain = w.get_addresses()
+        hist = w.adb.get_history(domain)
+        self.assertEqual(27633300, hist[-1].balance)
+        # confirm txs in reverse order of the current history
+        for height, item in enumerate(reversed(hist), start=1000):
+            w.adb.add_verified_tx(item.txid, TxMinedInfo(height=height, conf=1, timestamp=0, txpos=0, header_hash="00"*32))
+        hist2 = w.adb.get_history(domain)
+        self.assertEqual([item.txid for item in reversed(hist)], [item.txid for item in hist2])
+        balance = 0
+        for item in hist2:
+            balance += item.delta
+            self.assertEqual(balance, item.balance)
+        self.assertEqual(27633300, balance)
+        self.assertEqual(27633300, sum(w.get_balance()))
+
+    @mock.patch.object(wallet.Abstract_Wallet, 'save_db')
+    async def test_full_history_follows_wallet_changes(self, mock_save_db):
+        w = self.create_old_wallet()
+        for i in [9, 18, 2, 0, 13, 3, 1, 11, 4, 17, 7, 14, 12, 15, 10, 8, 5, 6, 16]:
+            tx = Transaction(self.transactions[self.txid_list[i]])
+            w.adb.receive_tx_callback(tx, TX_HEIGHT_UNCONFIRMED)
+        hist = w.get_full_history()
+        self.assertEqual(list(hist.items()), list(w.iter_full_history(page_size=7)))
+        # (removing a tx also removes its children)
+        txid = next(txid for txid in hist if not w.adb.get_depending_transactions(txid))
+        # returned items can be modified by the caller
+        hist[txid]['label'] = 'modified'
+        self.assertEqual('', w.get_full_history()[txid]['label'])
+        w.set_label(txid, 'label1')
+        self.assertEqual('label1', w.get_full_history()[txid]['label'])
+        w.adb.add_verified_tx(txid, TxMinedInfo(height=1000, conf=1, timestamp=1, txpos=0, header_hash="00"*32))
+        w.db.put('stored_height', 1001)
+        item = w.get_full_history()[txid]
+        self.assertEqual((1000, 2, 'label1'), (item['height'], item['confirmations'], item['label']))
+        w.adb.remove_transaction(txid)
+        hist2 = w.get_full_history()
+        self.assertEqual(len(hist) - 1, len(hist2))
+        self.assertNotIn(txid, hist2)
+        self.assertEqual(list(hist2.items()), list(w.iter_full_history()))
+
+    @mock.patch.object(wallet.Abstract_Wallet, 'save_db')
+    async def test_detailed_history_cost_basis(self, mock_save_db):
+        w = self.create_old_wallet()
+        for i in [9, 18, 2, 0, 13, 3, 1, 11, 4, 17, 7, 14, 12, 15, 10, 8, 5, 6, 16]:
+            tx = Transaction(self.transactions[self.txid_list[i]])
+            w.adb.receive_tx_callback(tx, TX_HEIGHT_UNCONFIRMED)
+        w.db.put('stored_height', 2000)
+        # confirm parents first, three days apart
+        txids = [item.txid for item in w.adb.get_history(w.get_addresses())]
+        mined = []
+        while txids:
+            txid = next(txid for txid in txids if all(
+                txin.prevout.txid.hex() in mined or txin.prevout.txid.hex() not in txids
+                for txin in w.db.get_transaction(txid).inputs()))
+            txids.remove(txid)
+            mined.append(txid)
+            height = 1000 + len(mined)
+            w.adb.add_verified_tx(txid, TxMinedInfo(
+                height=height, conf=1, timestamp=1_600_000_000 + height * 3 * 24 * 3600, txpos=0, header_hash="00"*32))
+        # a fiat value entered by the user overrides the rate
+        w.fiat_value['TEST'] = {}
+        w.fiat_value['TEST'][mined[0]] = '123.45'
+
+        class FakeFx:
+            ccy = 'TEST'
+            is_enabled = has_history = lambda self: True
+            def history_rate(self, d_t):
+                return Decimal(d_t.toordinal() % 97) + Decimal('0.5')
+            timestamp_rate = FxThread.timestamp_rate
+            timestamp_rates = FxThread.timestamp_rates
+            fiat_value = FxThread.fiat_value
+            historical_value = FxThread.historical_value
+        fx = FakeFx()
+        h = w.get_detailed_history(fx=fx, cost_basis='average')
+        num_spends = 0
+        for item in h['transactions']:
+            value = item['bc_value'].value
+            expected = w.get_tx_item_fiat(tx_hash=item['txid'], amount_sat=value, fx=fx, tx_fee=item['fee_sat'])
+            for key in ('fiat_value', 'fiat_rate', 'acquisition_price', 'capital_gain'):
+                self.assertEqual(expected.get(key), item.get(key))
+            num_spends += value < 0
+        self.assertTrue(num_spends > 0)
+        end = h['summary']['end']
+        self.assertEqual(w.acquisition_price(w.get_utxos(), fx.timestamp_rate, fx.ccy), end['acquisition_price'].value)
+        # fifo: what we paid for our coins was either spent, or is still held
+        h = w.get_detailed_history(fx=fx, cost_basis='fifo')
+        paid = sum(item['fiat_value'].value for item in h['transactions'] if item['bc_value'].value > 0)
+        spent = sum(item['acquisition_price'].value for item in h['transactions'] if item['bc_value'].value < 0)
+        self.assertAlmostEqual(paid, spent + h['summary']['end']['acquisition_price'].value)
+        self.assertEqual(Decimal(0), h['summary']['begin']['acquisition_price'].value)
+        with self.assertRaises(ValueError):
+            w.get_detailed_history(fx=fx, cost_basis='lifo')
+
 
 class TestWalletHistory_EvilGapLimit(ElectrumTestCase):
     TESTNET = True
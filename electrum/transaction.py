@@ -212,9 +212,44 @@ class TxOutput:
 
 
 class BIP143SharedTxDigestFields(NamedTuple):
-    hashPrevouts: str
-    hashSequence: str
-    hashOutputs: str
+    hashPrevouts: bytes
+    hashSequence: bytes
+    hashOutputs: bytes
+
+
+class SighashCache:
+    """Parts of the sighash preimages that are shared by the inputs of a tx.
+
+    The cache is only valid as long as the tx is not modified (other than
+    adding signatures), e.g. during a single sign() call.
+    """
+
+    def __init__(self, tx: 'Transaction'):
+        self.tx = tx
+        self._bip143_fields = None  # type: Optional[BIP143SharedTxDigestFields]
+        self._txouts = None  # type: Optional[bytes]
+        self._legacy_txins = None  # type: Optional[bytes]
+        self._legacy_txin_offsets = None  # type: Optional[List[int]]
+
+    def get_txouts(self) -> bytes:
+        """Serialized outputs of the tx, without their count."""
+        if self._txouts is None:
+            self._txouts = b''.join(o.serialize_to_network() for o in self.tx.outputs())
+        return self._txouts
+
+    def get_bip143_fields(self) -> BIP143SharedTxDigestFields:
+        if self._bip143_fields is None:
+            self._bip143_fields = self.tx._calc_bip143_shared_txdigest_fields(txouts=self.get_txouts())
+        return self._bip143_fields
+
+    def get_legacy_txins_around(self, txin_index: int) -> Tuple[bytes, bytes]:
+        """Serialized inputs of the tx before and after txin_index, with empty scriptSigs."""
+        if self._legacy_txins is None:
+            txins = [txin.serialize_to_network(script_sig=b"") for txin in self.tx.inputs()]
+            self._legacy_txins = b''.join(txins)
+            self._legacy_txin_offsets = list(itertools.accumulate(map(len, txins), initial=0))
+        offsets = self._legacy_txin_offsets
+        return self._legacy_txins[:offsets[txin_index]], self._legacy_txins[offsets[txin_index+1]:]
 
 
 class TxOutpoint(NamedTuple):
@@ -901,12 +936,13 @@ class Transaction:
             raise Exception(f"don't know scriptcode for descriptor: {desc.to_string()}")
         raise UnknownTxinType(f'cannot construct preimage_script')
 
-    def _calc_bip143_shared_txdigest_fields(self) -> BIP143SharedTxDigestFields:
+    def _calc_bip143_shared_txdigest_fields(self, *, txouts: bytes = None) -> BIP143SharedTxDigestFields:
         inputs = self.inputs()
-        outputs = self.outputs()
-        hashPrevouts = sha256d(b''.join(txin.prevout.serialize_to_network() for txin in inputs)).hex()
-        hashSequence = sha256d(bfh(''.join(int_to_hex(txin.nsequence, 4) for txin in inputs))).hex()
-        hashOutputs = sha256d(bfh(''.join(o.serialize_to_network().hex() for o in outputs))).hex()
+        if txouts is None:
+            txouts = b''.join(o.serialize_to_network() for o in self.outputs())
+        hashPrevouts = sha256d(b''.join(txin.prevout.serialize_to_network() for txin in inputs))
+        hashSequence = sha256d(b''.join(bfh(int_to_hex(txin.nsequence, 4)) for txin in inputs))
+        hashOutputs = sha256d(txouts)
         return BIP143SharedTxDigestFields(hashPrevouts=hashPrevouts,
                                           hashSequence=hashSequence,
                                           hashOutputs=hashOutputs)
@@ -2073,52 +2109,57 @@ class PartialTransaction(Transaction):
             self._outputs.sort(key = lambda o: (o.value, o.scriptpubkey))
         self.invalidate_ser_cache()
 
-    def serialize_preimage(self, txin_index: int, *,
-                           bip143_shared_txdigest_fields: BIP143SharedTxDigestFields = None) -> str:
-        nVersion = int_to_hex(self.version, 4)
-        nLocktime = int_to_hex(self.locktime, 4)
+    def serialize_preimage(self, txin_index: int, *, sighash_cache: SighashCache = None) -> str:
+        return self.serialize_preimage_bytes(txin_index, sighash_cache=sighash_cache).hex()
+
+    def serialize_preimage_bytes(self, txin_index: int, *, sighash_cache: SighashCache = None) -> bytes:
+        if sighash_cache is None:
+            sighash_cache = SighashCache(self)
+        nVersion = bfh(int_to_hex(self.version, 4))
+        nLocktime = bfh(int_to_hex(self.locktime, 4))
         inputs = self.inputs()
         outputs = self.outputs()
         txin = inputs[txin_index]
         sighash = txin.sighash if txin.sighash is not None else Sighash.ALL
         if not Sighash.is_valid(sighash):
             raise Exception(f"SIGHASH_FLAG ({sighash}) not supported!")
-        nHashType = int_to_hex(sighash, 4)
-        preimage_script = self.get_preimage_script(txin)
+        nHashType = bfh(int_to_hex(sighash, 4))
+        preimage_script = bfh(self.get_preimage_script(txin))
         if txin.is_segwit():
-            if bip143_shared_txdigest_fields is None:
-                bip143_shared_txdigest_fields = self._calc_bip143_shared_txdigest_fields()
+            bip143_shared_txdigest_fields = sighash_cache.get_bip143_fields()
             if not (sighash & Sighash.ANYONECANPAY):
                 hashPrevouts = bip143_shared_txdigest_fields.hashPrevouts
             else:
-                hashPrevouts = '00' * 32
+                hashPrevouts = bytes(32)
             if not (sighash & Sighash.ANYONECANPAY) and (sighash & 0x1f) != Sighash.SINGLE and (sighash & 0x1f) != Sighash.NONE:
                 hashSequence = bip143_shared_txdigest_fields.hashSequence
             else:
-                hashSequence = '00' * 32
+                hashSequence = bytes(32)
             if (sighash & 0x1f) != Sighash.SINGLE and (sighash & 0x1f) != Sighash.NONE:
                 hashOutputs = bip143_shared_txdigest_fields.hashOutputs
             elif (sighash & 0x1f) == Sighash.SINGLE and txin_index < len(outputs):
-                hashOutputs = sha256d(outputs[txin_index].serialize_to_network()).hex()
+                hashOutputs = sha256d(outputs[txin_index].serialize_to_network())
             else:
-                hashOutputs = '00' * 32
-            outpoint = txin.prevout.serialize_to_network().hex()
-            scriptCode = var_int(len(preimage_script) // 2) + preimage_script
-            amount = int_to_hex(txin.value_sats(), 8)
-            nSequence = int_to_hex(txin.nsequence, 4)
+                hashOutputs = bytes(32)
+            outpoint = txin.prevout.serialize_to_network()
+            scriptCode = bfh(var_int(len(preimage_script))) + preimage_script
+            amount = bfh(int_to_hex(txin.value_sats(), 8))
+            nSequence = bfh(int_to_hex(txin.nsequence, 4))
             preimage = nVersion + hashPrevouts + hashSequence + outpoint + scriptCode + amount + nSequence + hashOutputs + nLocktime + nHashType
         else:
             if sighash != Sighash.ALL:
                 raise Exception(f"SIGHASH_FLAG ({sighash}) not supported! (for legacy sighash)")
-            txins = var_int(len(inputs)) + ''.join(txin.serialize_to_network(script_sig=bfh(preimage_script) if txin_index==k else b"").hex()
-                                                   for k, txin in enumerate(inputs))
-            txouts = var_int(len(outputs)) + ''.join(o.serialize_to_network().hex() for o in outputs)
+            # only the input being signed has a scriptSig; the others are reused from the cache
+            txins_before, txins_after = sighash_cache.get_legacy_txins_around(txin_index)
+            txins = (bfh(var_int(len(inputs))) + txins_before
+                     + txin.serialize_to_network(script_sig=preimage_script) + txins_after)
+            txouts = bfh(var_int(len(outputs))) + sighash_cache.get_txouts()
             preimage = nVersion + txins + txouts + nLocktime + nHashType
         return preimage
 
     def sign(self, keypairs) -> None:
         # keypairs:  pubkey_hex -> (secret_bytes, is_compressed)
-        bip143_shared_txdigest_fields = self._calc_bip143_shared_txdigest_fields()
+        sighash_cache = SighashCache(self)
         for i, txin in enumerate(self.inputs()):
             pubkeys = [pk.hex() for pk in txin.pubkeys]
             for pubkey in pubkeys:
@@ -2128,18 +2169,17 @@ class PartialTransaction(Transaction):
                     continue
                 _logger.info(f"adding signature for {pubkey}. spending utxo {txin.prevout.to_str()}")
                 sec, compressed = keypairs[pubkey]
-                sig = self.sign_txin(i, sec, bip143_shared_txdigest_fields=bip143_shared_txdigest_fields)
+                sig = self.sign_txin(i, sec, sighash_cache=sighash_cache)
                 self.add_signature_to_txin(txin_idx=i, signing_pubkey=pubkey, sig=sig)
 
         _logger.debug(f"is_complete {self.is_complete()}")
         self.invalidate_ser_cache()
 
-    def sign_txin(self, txin_index, privkey_bytes, *, bip143_shared_txdigest_fields=None) -> str:
+    def sign_txin(self, txin_index, privkey_bytes, *, sighash_cache: SighashCache = None) -> str:
         txin = self.inputs()[txin_index]
         txin.validate_data(for_signing=True)
         sighash = txin.sighash if txin.sighash is not None else Sighash.ALL
-        pre_hash = sha256d(bfh(self.serialize_preimage(txin_index,
-                                                       bip143_shared_txdigest_fields=bip143_shared_txdigest_fields)))
+        pre_hash = sha256d(self.serialize_preimage_bytes(txin_index, sighash_cache=sighash_cache))
         privkey = ecc.ECPrivkey(privkey_bytes)
         sig = privkey.sign_transaction(pre_hash)
         sig = sig.hex() + Sighash.to_sigbytes(sighash).hex()
@@ -1440,6 +1440,29 @@ class NetworkJobOnDefaultServer(Logger, ABC):
         """
         self.taskgroup = OldTaskGroup()
         self.reset_request_counters()
+        self._wakeup_event = asyncio.Event()
+
+    def _get_batch_size(self) -> int:
+        """Max number of requests to send in a single JSON-RPC batch."""
+        return max(1, self.network.config.NETWORK_REQUEST_BATCH_SIZE)
+
+    def wake_up(self) -> None:
+        """Tells the job there is new work to pick up, see _wait_for_work.
+        Can be called from any thread.
+        """
+        event = self._wakeup_event
+        loop = self.network.asyncio_loop
+        if get_running_loop() == loop:
+            event.set()
+        else:
+            loop.call_soon_threadsafe(event.set)
+
+    async def _wait_for_work(self) -> None:
+        """Waits until wake_up gets called. Returns immediately if it was
+        called since the last time this returned.
+        """
+        await self._wakeup_event.wait()
+        self._wakeup_event.clear()
 
     async def _start(self, interface: 'Interface'):
         self.logger.debug(f"starting. interface.server={repr(str(interface.server))}")
@@ -1602,6 +1625,34 @@ def create_and_start_event_loop() -> Tuple[asyncio.AbstractEventLoop,
     return loop, stopping_fut, loop_thread
 
 
+class LRUCache(OrderedDict):
+    """An OrderedDict that holds at most 'maxsize' items.
+    Reading an item marks it as recently used; adding an item to a full
+    cache evicts the least recently used one.
+    """
+
+    def __init__(self, *, maxsize: int):
+        super().__init__()
+        assert maxsize > 0, maxsize
+        self.maxsize = maxsize
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        return value
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        if len(self) > self.maxsize:
+            self.popitem(last=False)
+
+
 class OrderedDictWithIndex(OrderedDict):
     """An OrderedDict that keeps track of the positions of keys.
 
@@ -22,11 +22,13 @@
 # SOFTWARE.
 
 import asyncio
-from typing import Sequence, Optional, TYPE_CHECKING
+from collections import defaultdict
+from typing import Sequence, Optional, TYPE_CHECKING, Dict, Set, Tuple, List
 
 import aiorpcx
 
-from .util import TxMinedInfo, NetworkJobOnDefaultServer
+from . import util
+from .util import TxMinedInfo, NetworkJobOnDefaultServer, LRUCache, chunks
 from .crypto import sha256d
 from .bitcoin import hash_decode, hash_encode
 from .transaction import Transaction
@@ -39,6 +41,12 @@ if TYPE_CHECKING:
     from .address_synchronizer import AddressSynchronizer
 
 
+# max number of verified (txid, header hash) proofs remembered
+VERIFIED_PROOFS_CACHE_SIZE = 10000
+# how often we check whether a chunk requested by someone else has arrived, in seconds
+CHUNK_IN_FLIGHT_RECHECK_INTERVAL = 1
+
+
 class MerkleVerificationFailure(Exception): pass
 class MissingBlockHeader(MerkleVerificationFailure): pass
 class MerkleRootMismatch(MerkleVerificationFailure): pass
@@ -50,50 +58,147 @@ class SPV(NetworkJobOnDefaultServer):
 
     def __init__(self, network: 'Network', wallet: 'AddressSynchronizer'):
         self.wallet = wallet
+        # (txid, header hash) -> pos, for proofs that passed verification.
+        # kept across restarts of the job, e.g. when switching servers
+        self._verified_proofs = LRUCache(maxsize=VERIFIED_PROOFS_CACHE_SIZE)  # type: Dict[Tuple[str, str], int]
         NetworkJobOnDefaultServer.__init__(self, network)
 
     def _reset(self):
         super()._reset()
         self.merkle_roots = {}  # txid -> merkle root (once it has been verified)
         self.requested_merkle = set()  # txid set of pending requests
+        self._txs_to_check = set()  # txids that might need a proof requested
+        self._txs_waiting_for_headers = set()  # txids mined above our local height
+        self._txs_waiting_for_chunk = {}  # type: Dict[int, Set[str]]  # chunk index -> txids
 
     async def _run_tasks(self, *, taskgroup):
         await super()._run_tasks(taskgroup=taskgroup)
-        async with taskgroup as group:
-            await group.spawn(self.main)
+        util.register_callback(self._on_blockchain_updated, ['blockchain_updated'])
+        try:
+            async with taskgroup as group:
+                await group.spawn(self.main)
+        finally:
+            util.unregister_callback(self._on_blockchain_updated)
 
     def diagnostic_name(self):
         return self.wallet.diagnostic_name()
 
+    def add_tx_to_check(self, tx_hash: str) -> None:
+        """Tells the verifier that tx_hash was (re-)added to the unverified txs.
+        Can be called from any thread.
+        """
+        self._txs_to_check.add(tx_hash)
+        self.wake_up()
+
+    def _on_blockchain_updated(self, *args):
+        # new headers. txs waiting for them are checked again
+        self._txs_to_check |= self._txs_waiting_for_headers
+        self._txs_waiting_for_headers.clear()
+        self.wake_up()
+
+    def _notify_synchronizer(self):
+        # our requests are part of what makes the wallet up to date
+        synchronizer = self.wallet.synchronizer
+        if synchronizer:
+            synchronizer.wake_up()
+
     async def main(self):
         self.blockchain = self.network.blockchain()
+        self._txs_to_check |= set(self.wallet.get_unverified_txs())
         while True:
             await self._maybe_undo_verifications()
             await self._request_proofs()
-            await asyncio.sleep(0.1)
+            await self._wait_for_work()
 
     async def _request_proofs(self):
         local_height = self.blockchain.height()
-        unverified = self.wallet.get_unverified_txs()
-
-        for tx_hash, tx_height in unverified.items():
+        to_request = defaultdict(list)  # type: Dict[int, List[str]]  # height -> txids
+        header_hashes = {}  # type: Dict[int, str]
+        num_from_cache = 0
+        while self._txs_to_check:
+            tx_hash = self._txs_to_check.pop()
+            tx_height = self.wallet.unverified_tx.get(tx_hash)
+            if tx_height is None:
+                continue  # already verified, or removed
             # do not request merkle branch if we already requested it
             if tx_hash in self.requested_merkle or tx_hash in self.merkle_roots:
                 continue
             # or before headers are available
             if not (0 < tx_height <= local_height):
+                if tx_height > local_height:
+                    self._txs_waiting_for_headers.add(tx_hash)
                 continue
             # if it's in the checkpoint region, we still might not have the header
             header = self.blockchain.read_header(tx_height)
             if header is None:
                 if tx_height < constants.net.max_checkpoint():
-                    # FIXME these requests are not counted (self._requests_sent += 1)
-                    await self.taskgroup.spawn(self.interface.request_chunk(tx_height, None, can_return_early=True))
+                    index = tx_height // 2016
+                    if index not in self._txs_waiting_for_chunk:
+                        self._txs_waiting_for_chunk[index] = set()
+                        await self.taskgroup.spawn(self._request_chunk, index)
+                    self._txs_waiting_for_chunk[index].add(tx_hash)
+                else:
+                    self._txs_waiting_for_headers.add(tx_hash)
+                continue
+            # a proof we already verified against this very block is still valid,
+            # e.g. after switching back to a chain, or to another server
+            if tx_height not in header_hashes:
+                header_hashes[tx_height] = hash_header(header)
+            pos = self._verified_proofs.get((tx_hash, header_hashes[tx_height]))
+            if pos is not None:
+                self._add_verified_tx(tx_hash, tx_height, pos, header, header_hashes[tx_height])
+                num_from_cache += 1
                 continue
-            # request now
-            self.logger.info(f'requested merkle {tx_hash}')
             self.requested_merkle.add(tx_hash)
-            await self.taskgroup.spawn(self._request_and_verify_single_proof, tx_hash, tx_height)
+            to_request[tx_height].append(tx_hash)
+        if num_from_cache:
+            self._notify_synchronizer()
+        # request now, batching txs mined at the same height
+        for tx_height, tx_hashes in to_request.items():
+            for batch in chunks(tx_hashes, self._get_batch_size()):
+                self.logger.info(f'requested merkle {batch[0]}' if len(batch) == 1 else
+                                 f'requested merkle for {len(batch)} txs at height {tx_height}')
+                await self.taskgroup.spawn(self._request_and_verify_proofs, batch, tx_height)
+
+    async def _request_chunk(self, index: int):
+        connected = False
+        try:
+            # FIXME these requests are not counted (self._requests_sent += 1)
+            res = await self.interface.request_chunk(index * 2016, None, can_return_early=True)
+            if res is None:
+                # the chunk was already being requested, e.g. by the header sync.
+                # wait for that request to finish, then check the txs again
+                while self.interface.is_requesting_chunk(index):
+                    await asyncio.sleep(CHUNK_IN_FLIGHT_RECHECK_INTERVAL)
+                connected = True
+            else:
+                connected = bool(res[0])
+        finally:
+            txs = self._txs_waiting_for_chunk.pop(index)
+            if connected:
+                self._txs_to_check |= txs
+            else:
+                self._txs_waiting_for_headers |= txs
+            self.wake_up()
+
+    async def _request_and_verify_proofs(self, tx_hashes: Sequence[str], tx_height: int):
+        """Requests the proofs of txs mined at the same height, as a single batch."""
+        if len(tx_hashes) == 1:
+            await self._request_and_verify_single_proof(tx_hashes[0], tx_height)
+            return
+        try:
+            self._requests_sent += len(tx_hashes)
+            async with self._network_request_semaphore:
+                merkles = await self.interface.get_merkles_for_transactions(tx_hashes, tx_height)
+        finally:
+            self._requests_answered += len(tx_hashes)
+        proofs = []
+        for tx_hash, merkle in zip(tx_hashes, merkles):
+            if isinstance(merkle, aiorpcx.jsonrpc.RPCError):
+                self._on_tx_not_at_height(tx_hash, tx_height)
+            else:
+                proofs.append((tx_hash, tx_height, merkle))
+        await self._verify_proofs(proofs)
 
     async def _request_and_verify_single_proof(self, tx_hash, tx_height):
         try:
@@ -101,36 +206,58 @@ class SPV(NetworkJobOnDefaultServer):
             async with self._network_request_semaphore:
                 merkle = await self.interface.get_merkle_for_transaction(tx_hash, tx_height)
         except aiorpcx.jsonrpc.RPCError:
-            self.logger.info(f'tx {tx_hash} not at height {tx_height}')
-            self.wallet.remove_unverified_tx(tx_hash, tx_height)
-            self.requested_merkle.discard(tx_hash)
+            self._on_tx_not_at_height(tx_hash, tx_height)
             return
         finally:
             self._requests_answered += 1
-        # Verify the hash of the server-provided merkle branch to a
-        # transaction matches the merkle root of its block
-        if tx_height != merkle.get('block_height'):
-            self.logger.info('requested tx_height {} differs from received tx_height {} for txid {}'
-                             .format(tx_height, merkle.get('block_height'), tx_hash))
-        tx_height = merkle.get('block_height')
-        pos = merkle.get('pos')
-        merkle_branch = merkle.get('merkle')
+        await self._verify_proofs([(tx_hash, tx_height, merkle)])
+
+    def _on_tx_not_at_height(self, tx_hash: str, tx_height: int):
+        self.logger.info(f'tx {tx_hash} not at height {tx_height}')
+        self.wallet.remove_unverified_tx(tx_hash, tx_height)
+        self.requested_merkle.discard(tx_hash)
+        self._notify_synchronizer()
+
+    async def _verify_proofs(self, proofs: Sequence[Tuple[str, int, dict]]):
+        """Verifies server-provided merkle proofs, given as (tx_hash, tx_height, merkle).
+        Each header is read and hashed only once, however many txs it contains.
+        """
+        heights = set(merkle.get('block_height') for tx_hash, tx_height, merkle in proofs)
         # we need to wait if header sync/reorg is still ongoing, hence lock:
         async with self.network.bhi_lock:
-            header = self.network.blockchain().read_header(tx_height)
-        try:
-            verify_tx_is_in_block(tx_hash, merkle_branch, pos, header, tx_height)
-        except MerkleVerificationFailure as e:
-            if self.network.config.NETWORK_SKIPMERKLECHECK:
-                self.logger.info(f"skipping merkle proof check {tx_hash}")
-            else:
-                self.logger.info(repr(e))
-                raise GracefulDisconnect(e) from e
-        # we passed all the tests
+            chain = self.network.blockchain()
+            headers = {height: chain.read_header(height) for height in heights}
+        header_hashes = {}
+        for tx_hash, tx_height, merkle in proofs:
+            # Verify the hash of the server-provided merkle branch to a
+            # transaction matches the merkle root of its block
+            if tx_height != merkle.get('block_height'):
+                self.logger.info('requested tx_height {} differs from received tx_height {} for txid {}'
+                                 .format(tx_height, merkle.get('block_height'), tx_hash))
+            tx_height = merkle.get('block_height')
+            pos = merkle.get('pos')
+            merkle_branch = merkle.get('merkle')
+            header = headers[tx_height]
+            try:
+                verify_tx_is_in_block(tx_hash, merkle_branch, pos, header, tx_height)
+            except MerkleVerificationFailure as e:
+                if self.network.config.NETWORK_SKIPMERKLECHECK:
+                    self.logger.info(f"skipping merkle proof check {tx_hash}")
+                else:
+                    self.logger.info(repr(e))
+                    raise GracefulDisconnect(e) from e
+            # we passed all the tests
+            if tx_height not in header_hashes:
+                header_hashes[tx_height] = hash_header(header)
+            header_hash = header_hashes[tx_height]
+            self._verified_proofs[(tx_hash, header_hash)] = pos
+            self._add_verified_tx(tx_hash, tx_height, pos, header, header_hash)
+        self._notify_synchronizer()
+
+    def _add_verified_tx(self, tx_hash: str, tx_height: int, pos: int, header: dict, header_hash: str):
         self.merkle_roots[tx_hash] = header.get('merkle_root')
         self.requested_merkle.discard(tx_hash)
         self.logger.info(f"verified {tx_hash}")
-        header_hash = hash_header(header)
         tx_info = TxMinedInfo(height=tx_height,
                               timestamp=header.get('timestamp'),
                               txpos=pos,
@@ -189,6 +316,7 @@ class SPV(NetworkJobOnDefaultServer):
     def remove_spv_proof_for_tx(self, tx_hash):
         self.merkle_roots.pop(tx_hash, None)
         self.requested_merkle.discard(tx_hash)
+        self.add_tx_to_check(tx_hash)
 
     def is_up_to_date(self):
         return (not self.requested_merkle
@@ -40,7 +40,7 @@ from functools import partial
 from collections import defaultdict
 from numbers import Number
 from decimal import Decimal
-from typing import TYPE_CHECKING, List, Optional, Tuple, Union, NamedTuple, Sequence, Dict, Any, Set, Iterable
+from typing import TYPE_CHECKING, List, Optional, Tuple, Union, NamedTuple, Sequence, Dict, Any, Set, Iterable, Iterator
 from abc import ABC, abstractmethod
 import itertools
 import threading
@@ -78,6 +78,7 @@ from .address_synchronizer import (AddressSynchronizer, TX_HEIGHT_LOCAL,
 from .invoices import BaseInvoice, Invoice, Request
 from .invoices import PR_PAID, PR_UNPAID, PR_UNKNOWN, PR_EXPIRED, PR_UNCONFIRMED, PR_INFLIGHT
 from .contacts import Contacts
+from .cost_basis import CostBasis
 from .interface import NetworkException
 from .mnemonic import Mnemonic
 from .logging import get_logger, Logger
@@ -410,6 +411,8 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         self.transaction_lock = self.adb.transaction_lock
         self._last_full_history = None
         self._tx_parents_cache = {}
+        self._onchain_history_items = {}  # cache of get_onchain_history
+        self._labels_version = 0  # incremented when labels, or what default labels depend on, change
 
         self.taskgroup = OldTaskGroup()
 
@@ -487,7 +490,7 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         new_storage._encryption_version = self.storage._encryption_version
         new_storage.pubkey = self.storage.pubkey
 
-        new_db = WalletDB(self.db.dump(), storage=new_storage, upgrade=True)
+        new_db = WalletDB(self.db.dump(include_sql_tables=True), storage=new_storage, upgrade=True)
         if self.lnworker:
             channel_backups = new_db.get_dict('imported_channel_backups')
             for chan_id, chan in self.lnworker.channels.items():
@@ -698,6 +701,7 @@ class Abstract_Wallet(ABC, Logger, EventListener):
                 self._labels.pop(key, None)
             else:
                 self._labels[key] = value
+            self._labels_version += 1
 
     def set_label(self, name: str, text: str = None) -> bool:
         if not name:
@@ -714,6 +718,8 @@ class Abstract_Wallet(ABC, Logger, EventListener):
                 if old_text is not None:
                     self._labels.pop(name)
                     changed = True
+            if changed:
+                self._labels_version += 1
         if changed:
             run_hook('set_label', self, name, text)
         return changed
@@ -1124,28 +1130,53 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         return balance
 
     def get_onchain_history(self, *, domain=None):
+        is_full_domain = domain is None
         if domain is None:
             domain = self.get_addresses()
         monotonic_timestamp = 0
+        cache = self._onchain_history_items  # txid -> (item_key, item)
+        seen = set()
         for hist_item in self.adb.get_history(domain=domain):
-            monotonic_timestamp = max(monotonic_timestamp, (hist_item.tx_mined_status.timestamp or TX_TIMESTAMP_INF))
-            d = {
-                'txid': hist_item.txid,
-                'fee_sat': hist_item.fee,
-                'height': hist_item.tx_mined_status.height,
-                'confirmations': hist_item.tx_mined_status.conf,
-                'timestamp': hist_item.tx_mined_status.timestamp,
-                'monotonic_timestamp': monotonic_timestamp,
-                'incoming': True if hist_item.delta>0 else False,
-                'bc_value': Satoshis(hist_item.delta),
-                'bc_balance': Satoshis(hist_item.balance),
-                'date': timestamp_to_datetime(hist_item.tx_mined_status.timestamp),
-                'label': self.get_label_for_txid(hist_item.txid),
-                'txpos_in_block': hist_item.tx_mined_status.txpos,
-            }
-            if wanted_height := hist_item.tx_mined_status.wanted_height:
-                d['wanted_height'] = wanted_height
+            txid = hist_item.txid
+            tx_mined_status = hist_item.tx_mined_status
+            monotonic_timestamp = max(monotonic_timestamp, (tx_mined_status.timestamp or TX_TIMESTAMP_INF))
+            # items are only rebuilt if something else than their number of confirmations changed
+            item_key = (
+                hist_item.delta, hist_item.fee, hist_item.balance,
+                tx_mined_status.height, tx_mined_status.timestamp, tx_mined_status.txpos,
+                tx_mined_status.wanted_height, monotonic_timestamp,
+                self._labels_version,
+                self.lnworker.get_label_for_txid(txid) if self.lnworker else None,
+            )
+            cached = cache.get(txid)
+            if cached is not None and cached[0] == item_key:
+                d = dict(cached[1])
+                d['confirmations'] = tx_mined_status.conf
+            else:
+                d = {
+                    'txid': txid,
+                    'fee_sat': hist_item.fee,
+                    'height': tx_mined_status.height,
+                    'confirmations': tx_mined_status.conf,
+                    'timestamp': tx_mined_status.timestamp,
+                    'monotonic_timestamp': monotonic_timestamp,
+                    'incoming': True if hist_item.delta>0 else False,
+                    'bc_value': Satoshis(hist_item.delta),
+                    'bc_balance': Satoshis(hist_item.balance),
+                    'date': timestamp_to_datetime(tx_mined_status.timestamp),
+                    'label': self.get_label_for_txid(txid),
+                    'txpos_in_block': tx_mined_status.txpos,
+                }
+                if wanted_height := tx_mined_status.wanted_height:
+                    d['wanted_height'] = wanted_height
+                cache[txid] = (item_key, d)
+                d = dict(d)
+            seen.add(txid)
             yield d
+        if is_full_domain and len(cache) > len(seen):
+            # forget txs that were removed from the wallet
+            for txid in cache.keys() - seen:
+                cache.pop(txid, None)
 
     def create_invoice(self, *, outputs: List[PartialTxOutput], message, pr, URI) -> Invoice:
         height = self.adb.get_local_height()
@@ -1187,16 +1218,19 @@ class Abstract_Wallet(ABC, Logger, EventListener):
                 for txout in invoice.get_outputs():
                     self._invoices_from_scriptpubkey_map[txout.scriptpubkey].add(key)
         self._invoices[key] = invoice
+        self._labels_version += 1
         if write_to_disk:
             self.save_db()
 
     def clear_invoices(self):
         self._invoices.clear()
+        self._labels_version += 1
         self.save_db()
 
     def clear_requests(self):
         self._receive_requests.clear()
         self._requests_addr_to_key.clear()
+        self._labels_version += 1
         self.save_db()
 
     def get_invoices(self) -> List[Invoice]:
@@ -1272,6 +1306,7 @@ class Abstract_Wallet(ABC, Logger, EventListener):
             if is_paid:
                 for txid in relevant_txs:
                     self._invoices_from_txid_map[txid].add(invoice_key)
+                self._labels_version += 1
             for txout in invoice.get_outputs():
                 self._invoices_from_scriptpubkey_map[txout.scriptpubkey].add(invoice_key)
             # update invoice status
@@ -1320,7 +1355,36 @@ class Abstract_Wallet(ABC, Logger, EventListener):
 
     @profiler
     def get_full_history(self, fx=None, *, onchain_domain=None, include_lightning=True, include_fiat=False):
-        transactions_tmp = OrderedDictWithIndex()
+        transactions = OrderedDictWithIndex()
+        for key, tx_item in self.iter_full_history(
+                fx, onchain_domain=onchain_domain, include_lightning=include_lightning, include_fiat=include_fiat):
+            transactions[key] = tx_item
+        return transactions
+
+    def iter_full_history(
+            self,
+            fx=None,
+            *,
+            onchain_domain=None,
+            include_lightning=True,
+            include_fiat=False,
+            page_size: int = 100,
+    ) -> Iterator[Tuple[str, dict]]:
+        """Yields the (key, item) pairs of get_full_history, in the same order.
+        Fiat values are computed one page of items at a time, when that page is reached.
+        """
+        transactions = self._get_full_history_items(
+            fx, onchain_domain=onchain_domain, include_lightning=include_lightning)
+        now = time.time()
+        for i in range(0, len(transactions), page_size):
+            page = transactions[i:i + page_size]
+            if include_fiat:
+                for key, tx_item in page:
+                    self._add_fiat_to_history_item(tx_item, fx, now=now)
+            yield from page
+
+    def _get_full_history_items(self, fx=None, *, onchain_domain=None, include_lightning=True) -> List[Tuple[str, dict]]:
+        transactions_tmp = {}
         # add on-chain txns
         onchain_history = self.get_onchain_history(domain=onchain_domain)
         for tx_item in onchain_history:
@@ -1365,7 +1429,7 @@ class Abstract_Wallet(ABC, Logger, EventListener):
             height = self.adb.tx_height_to_sort_height(tx_item.get('height'))
             return ts, height
         # create groups
-        transactions = OrderedDictWithIndex()
+        transactions = {}
         for k, tx_item in sorted(list(transactions_tmp.items()), key=sort_key):
             group_id = tx_item.get('group_id')
             if not group_id:
@@ -1401,28 +1465,30 @@ class Abstract_Wallet(ABC, Logger, EventListener):
                     parent['confirmations'] = tx_item['confirmations']
                 parent['children'].append(tx_item)
 
-        now = time.time()
+        items = []
         for key, item in transactions.items():
             children = item.get('children', [])
             if len(children) == 1:
-                transactions[key] = children[0]
+                item = children[0]
             # add on-chain and lightning values
             # note: 'value' has msat precision (as LN has msat precision)
             item['value'] = item.get('bc_value', Satoshis(0)) + item.get('ln_value', Satoshis(0))
             for child in item.get('children', []):
                 child['value'] = child.get('bc_value', Satoshis(0)) + child.get('ln_value', Satoshis(0))
-            if include_fiat:
-                value = item['value'].value
-                txid = item.get('txid')
-                if not item.get('lightning') and txid:
-                    fiat_fields = self.get_tx_item_fiat(tx_hash=txid, amount_sat=value, fx=fx, tx_fee=item['fee_sat'])
-                    item.update(fiat_fields)
-                else:
-                    timestamp = item['timestamp'] or now
-                    fiat_value = value / Decimal(bitcoin.COIN) * fx.timestamp_rate(timestamp)
-                    item['fiat_value'] = Fiat(fiat_value, fx.ccy)
-                    item['fiat_default'] = True
-        return transactions
+            items.append((key, item))
+        return items
+
+    def _add_fiat_to_history_item(self, item: dict, fx: 'FxThread', *, now: float) -> None:
+        value = item['value'].value
+        txid = item.get('txid')
+        if not item.get('lightning') and txid:
+            fiat_fields = self.get_tx_item_fiat(tx_hash=txid, amount_sat=value, fx=fx, tx_fee=item['fee_sat'])
+            item.update(fiat_fields)
+        else:
+            timestamp = item['timestamp'] or now
+            fiat_value = value / Decimal(bitcoin.COIN) * fx.timestamp_rate(timestamp)
+            item['fiat_value'] = Fiat(fiat_value, fx.ccy)
+            item['fiat_default'] = True
 
     @profiler
     def get_detailed_history(
@@ -1432,14 +1498,18 @@ class Abstract_Wallet(ABC, Logger, EventListener):
             fx=None,
             show_addresses=False,
             from_height=None,
-            to_height=None):
-        # History with capital gains, using utxo pricing
-        # FIXME: Lightning capital gains would requires FIFO
+            to_height=None,
+            cost_basis: str = None):
+        # History with capital gains, using utxo pricing (or FIFO, see CostBasis)
+        # FIXME: Lightning capital gains are not taken into account
         if (from_timestamp is not None or to_timestamp is not None) \
                 and (from_height is not None or to_height is not None):
             raise Exception('timestamp and block height based filtering cannot be used together')
 
         show_fiat = fx and fx.is_enabled() and fx.has_history()
+        cost_basis_engine = None
+        if show_fiat:
+            cost_basis_engine = CostBasis(self, fx, method=cost_basis or self.config.FX_HISTORY_COST_BASIS)
         out = []
         income = 0
         expenditures = 0
@@ -1474,7 +1544,8 @@ class Abstract_Wallet(ABC, Logger, EventListener):
                 income += value
             # fiat computations
             if show_fiat:
-                fiat_fields = self.get_tx_item_fiat(tx_hash=tx_hash, amount_sat=value, fx=fx, tx_fee=tx_fee)
+                fiat_fields = self.get_tx_item_fiat(
+                    tx_hash=tx_hash, amount_sat=value, fx=fx, tx_fee=tx_fee, cost_basis=cost_basis_engine)
                 fiat_value = fiat_fields['fiat_value'].value
                 item.update(fiat_fields)
                 if value < 0:
@@ -1525,7 +1596,7 @@ class Abstract_Wallet(ABC, Logger, EventListener):
                     'BTC_balance': Satoshis(balance),
                 }
                 if show_fiat:
-                    ap = self.acquisition_price(coins, fx.timestamp_rate, fx.ccy)
+                    ap = cost_basis_engine.get_holdings_acquisition_price(coins, height)
                     lp = self.liquidation_price(coins, fx.timestamp_rate, timestamp)
                     out['acquisition_price'] = Fiat(ap, fx.ccy)
                     out['liquidation_price'] = Fiat(lp, fx.ccy)
@@ -1575,12 +1646,16 @@ class Abstract_Wallet(ABC, Logger, EventListener):
             amount_sat: int,
             fx: 'FxThread',
             tx_fee: Optional[int],
+            cost_basis: 'CostBasis' = None,
     ) -> Dict[str, Any]:
         item = {}
         fiat_value = self.get_fiat_value(tx_hash, fx.ccy)
         fiat_default = fiat_value is None
-        fiat_rate = self.price_at_timestamp(tx_hash, fx.timestamp_rate)
-        fiat_value = fiat_value if fiat_value is not None else self.default_fiat_value(tx_hash, fx, amount_sat)
+        if cost_basis is not None:
+            fiat_rate = cost_basis.get_rate(tx_hash)
+        else:
+            fiat_rate = self.price_at_timestamp(tx_hash, fx.timestamp_rate)
+        fiat_value = fiat_value if fiat_value is not None else amount_sat / Decimal(COIN) * fiat_rate
         fiat_fee = tx_fee / Decimal(COIN) * fiat_rate if tx_fee is not None else None
         item['fiat_currency'] = fx.ccy
         item['fiat_rate'] = Fiat(fiat_rate, fx.ccy)
@@ -1588,7 +1663,10 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         item['fiat_fee'] = Fiat(fiat_fee, fx.ccy) if fiat_fee is not None else None
         item['fiat_default'] = fiat_default
         if amount_sat < 0:
-            acquisition_price = - amount_sat / Decimal(COIN) * self.average_price(tx_hash, fx.timestamp_rate, fx.ccy)
+            if cost_basis is not None:
+                acquisition_price = cost_basis.get_acquisition_price(tx_hash, -amount_sat)
+            else:
+                acquisition_price = - amount_sat / Decimal(COIN) * self.average_price(tx_hash, fx.timestamp_rate, fx.ccy)
             liquidation_price = - fiat_value
             item['acquisition_price'] = Fiat(acquisition_price, fx.ccy)
             cg = liquidation_price - acquisition_price
@@ -2801,6 +2879,7 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         self._receive_requests[request_id] = req
         if addr:=req.get_address():
             self._requests_addr_to_key[addr].add(request_id)
+        self._labels_version += 1
         if write_to_disk:
             self.save_db()
         return request_id
@@ -2813,6 +2892,7 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         self._receive_requests.pop(request_id, None)
         if addr:=req.get_address():
             self._requests_addr_to_key[addr].discard(request_id)
+        self._labels_version += 1
         if req.is_lightning() and self.lnworker:
             self.lnworker.delete_payment_info(req.rhash)
         if write_to_disk:
@@ -2823,6 +2903,7 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         inv = self._invoices.pop(invoice_id, None)
         if inv is None:
             return
+        self._labels_version += 1
         if inv.is_lightning() and self.lnworker:
             self.lnworker.delete_payment_info(inv.rhash)
         if write_to_disk:
@@ -2923,6 +3004,9 @@ class Abstract_Wallet(ABC, Logger, EventListener):
             else:
                 enc_version = StorageEncryptionVersion.PLAINTEXT
             self.storage.set_password(new_pw, enc_version)
+            if self.storage.is_encrypted():
+                # the sqlite db is not encrypted
+                self.db.set_storage_engine('json')
         # make sure next storage.write() saves changes
         self.db.set_modified(True)
 
@@ -2989,7 +3073,7 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         """
         if txin_value is None:
             return Decimal('NaN')
-        cache_key = "{}:{}:{}".format(str(txid), str(ccy), str(txin_value))
+        cache_key = (txid, ccy, txin_value)
         result = self._coin_price_cache.get(cache_key, None)
         if result is not None:
             return result
@@ -24,6 +24,7 @@
 # SOFTWARE.
 import os
 import ast
+import hashlib
 import datetime
 import json
 import copy
@@ -37,7 +38,7 @@ from functools import partial
 import attr
 
 from . import util, bitcoin
-from .util import profiler, WalletFileException, multisig_type, TxMinedInfo, bfh, MyEncoder
+from .util import profiler, WalletFileException, multisig_type, TxMinedInfo, bfh, MyEncoder, LRUCache
 from .invoices import Invoice, Request
 from .keystore import bip44_derivation
 from .transaction import Transaction, TxOutpoint, tx_from_any, PartialTransaction, PartialTxOutput
@@ -46,6 +47,7 @@ from .logging import Logger
 from .lnutil import LOCAL, REMOTE, HTLCOwner, ChannelType
 from . import json_db
 from .json_db import StoredDict, JsonDB, locked, modifier, StoredObject, stored_in, stored_as
+from .wallet_sql_db import WalletSqlDB, SqlStoredDict, delete_sql_db
 from .plugin import run_hook, plugin_loaders
 from .version import ELECTRUM_VERSION
 
@@ -100,7 +102,6 @@ class WalletFileExceptionVersion51(WalletFileException): pass
 
 
 # register dicts that require value conversions not handled by constructor
-json_db.register_dict('transactions', lambda x: tx_from_any(x, deserialize=False), None)
 json_db.register_dict('prevouts_by_scripthash', lambda x: set(tuple(k) for k in x), None)
 json_db.register_dict('data_loss_protect_remote_pcp', lambda x: bytes.fromhex(x), None)
 json_db.register_dict('contacts', tuple, None)
@@ -115,6 +116,34 @@ for key in ['locked_in', 'fails', 'settles']:
     json_db.register_parent_key(key, lambda x: HTLCOwner(int(x)))
 
 
+# max number of Transaction objects WalletDB keeps parsed.
+# transactions are stored serialized, and parsed on first access
+PARSED_TX_CACHE_SIZE = 5000
+
+
+def _is_raw_psbt(raw: str) -> bool:
+    return raw.startswith('cHNidP') or raw.startswith('70736274ff')
+
+
+def history_status(h) -> Optional[str]:
+    """Status of an address history, as defined by the Electrum protocol."""
+    if not h:
+        return None
+    status = ''
+    for tx_hash, height in h:
+        status += tx_hash + ':%d:' % height
+    return hashlib.sha256(status.encode('ascii')).digest().hex()
+
+
+# tables that can be kept in a sqlite file next to the wallet file,
+# instead of the wallet file itself (see WalletDB.set_storage_engine)
+SQL_TABLE_NAMES = (
+    'transactions', 'txi', 'txo', 'addr_history', 'addr_status', 'verified_tx3',
+    'spent_outpoints', 'prevouts_by_scripthash',
+)
+STORAGE_ENGINES = ('json', 'sqlite')
+
+
 class WalletDBUpgrader(Logger):
     def __init__(self, data):
         Logger.__init__(self)
@@ -1230,8 +1259,11 @@ def upgrade_wallet_db(data: dict, do_upgrade) -> Tuple[dict, bool]:
 
 class WalletDB(JsonDB):
 
-    def __init__(self, s, *, storage=None, upgrade=False):
-        JsonDB.__init__(self, s, storage, encoder=MyEncoder, upgrader=partial(upgrade_wallet_db, do_upgrade=upgrade))
+    def __init__(self, s, *, storage=None, upgrade=False, progress_cb=None):
+        self._sql_db = None  # type: Optional[WalletSqlDB]
+        self._sql_db_path_to_delete = None
+        JsonDB.__init__(self, s, storage, encoder=MyEncoder, upgrader=partial(upgrade_wallet_db, do_upgrade=upgrade),
+                        progress_cb=progress_cb)
         # create pointers
         self.load_transactions()
         # load plugins that are conditional on wallet type
@@ -1359,18 +1391,22 @@ class WalletDB(JsonDB):
         assert isinstance(scripthash, str)
         assert isinstance(prevout, TxOutpoint)
         assert isinstance(value, int)
-        if scripthash not in self._prevouts_by_scripthash:
-            self._prevouts_by_scripthash[scripthash] = set()
-        self._prevouts_by_scripthash[scripthash].add((prevout.to_str(), value))
+        prevouts_and_values = self._prevouts_by_scripthash.get(scripthash, set())
+        prevouts_and_values.add((prevout.to_str(), value))
+        # sets are stored as plain values: assign again, for SqlStoredDict to write it
+        self._prevouts_by_scripthash[scripthash] = prevouts_and_values
 
     @modifier
     def remove_prevout_by_scripthash(self, scripthash: str, *, prevout: TxOutpoint, value: int) -> None:
         assert isinstance(scripthash, str)
         assert isinstance(prevout, TxOutpoint)
         assert isinstance(value, int)
-        self._prevouts_by_scripthash[scripthash].discard((prevout.to_str(), value))
-        if not self._prevouts_by_scripthash[scripthash]:
+        prevouts_and_values = self._prevouts_by_scripthash[scripthash]
+        prevouts_and_values.discard((prevout.to_str(), value))
+        if not prevouts_and_values:
             self._prevouts_by_scripthash.pop(scripthash)
+        else:
+            self._prevouts_by_scripthash[scripthash] = prevouts_and_values
 
     @locked
     def get_prevouts_by_scripthash(self, scripthash: str) -> Set[Tuple[TxOutpoint, int]]:
@@ -1382,29 +1418,41 @@ class WalletDB(JsonDB):
     def add_transaction(self, tx_hash: str, tx: Transaction) -> None:
         assert isinstance(tx_hash, str)
         assert isinstance(tx, Transaction), tx
-        # note that tx might be a PartialTransaction
-        # serialize and de-serialize tx now. this might e.g. convert a complete PartialTx to a Tx
-        tx = tx_from_any(str(tx))
+        # note that tx might be a PartialTransaction.
+        # we store its serialization: a complete PartialTx is stored as a Tx
         if not tx_hash:
             raise Exception("trying to add tx to db without txid")
         if tx_hash != tx.txid():
             raise Exception(f"trying to add tx to db with inconsistent txid: {tx_hash} != {tx.txid()}")
         # don't allow overwriting complete tx with partial tx
-        tx_we_already_have = self.transactions.get(tx_hash, None)
-        if tx_we_already_have is None or isinstance(tx_we_already_have, PartialTransaction):
-            self.transactions[tx_hash] = tx
+        raw_we_already_have = self.transactions.get(tx_hash, None)
+        if raw_we_already_have is None or _is_raw_psbt(raw_we_already_have):
+            self.transactions[tx_hash] = tx.serialize()
+            # parsed again on next access, so that the caller does not share it
+            self._parsed_txs.pop(tx_hash, None)
 
     @modifier
     def remove_transaction(self, tx_hash: str) -> Optional[Transaction]:
         assert isinstance(tx_hash, str)
-        return self.transactions.pop(tx_hash, None)
+        tx = self._parsed_txs.pop(tx_hash, None)
+        raw = self.transactions.pop(tx_hash, None)
+        if tx is None and raw is not None:
+            tx = tx_from_any(raw, deserialize=False)
+        return tx
 
     @locked
     def get_transaction(self, tx_hash: Optional[str]) -> Optional[Transaction]:
         if tx_hash is None:
             return None
         assert isinstance(tx_hash, str)
-        return self.transactions.get(tx_hash)
+        tx = self._parsed_txs.get(tx_hash)
+        if tx is None:
+            raw = self.transactions.get(tx_hash)
+            if raw is None:
+                return None
+            tx = tx_from_any(raw, deserialize=False)
+            self._parsed_txs[tx_hash] = tx
+        return tx
 
     @locked
     def list_transactions(self) -> Sequence[str]:
@@ -1428,11 +1476,31 @@ class WalletDB(JsonDB):
     def set_addr_history(self, addr: str, hist) -> None:
         assert isinstance(addr, str)
         self.history[addr] = hist
+        status = history_status(hist)
+        if status is not None:
+            self.addr_status[addr] = status
+        else:
+            self.addr_status.pop(addr, None)
 
     @modifier
     def remove_addr_history(self, addr: str) -> None:
         assert isinstance(addr, str)
         self.history.pop(addr, None)
+        self.addr_status.pop(addr, None)
+
+    @locked
+    def get_addr_history_status(self, addr: str) -> Optional[str]:
+        """Returns history_status(self.get_addr_history(addr)),
+        without having to hash the history.
+        """
+        assert isinstance(addr, str)
+        status = self.addr_status.get(addr)
+        if status is None:
+            # not stored yet, if the history was set by an older version
+            status = history_status(self.history.get(addr))
+            if status is not None:
+                self.addr_status[addr] = status
+        return status
 
     @locked
     def list_verified_tx(self) -> Sequence[str]:
@@ -1602,31 +1670,138 @@ class WalletDB(JsonDB):
 
     @profiler
     def load_transactions(self):
-        # references in self.data
+        if self.get_storage_engine() == 'sqlite':
+            self._open_sql_db()
+            get_table = self._get_sql_table
+        else:
+            get_table = self.get_dict
+        # references in self.data (or in the sqlite db)
         # TODO make all these private
         # txid -> address -> prev_outpoint -> value
-        self.txi = self.get_dict('txi')                          # type: Dict[str, Dict[str, Dict[str, int]]]
+        self.txi = get_table('txi')                              # type: Dict[str, Dict[str, Dict[str, int]]]
         # txid -> address -> output_index -> (value, is_coinbase)
-        self.txo = self.get_dict('txo')                          # type: Dict[str, Dict[str, Dict[str, Tuple[int, bool]]]]
-        self.transactions = self.get_dict('transactions')        # type: Dict[str, Transaction]
-        self.spent_outpoints = self.get_dict('spent_outpoints')  # txid -> output_index -> next_txid
-        self.history = self.get_dict('addr_history')             # address -> list of (txid, height)
-        self.verified_tx = self.get_dict('verified_tx3')         # txid -> (height, timestamp, txpos, header_hash)
+        self.txo = get_table('txo')                              # type: Dict[str, Dict[str, Dict[str, Tuple[int, bool]]]]
+        self.transactions = get_table('transactions')            # txid -> raw tx (hex, or base64 psbt)
+        self._parsed_txs = LRUCache(maxsize=PARSED_TX_CACHE_SIZE)  # type: Dict[str, Transaction]
+        self.spent_outpoints = get_table('spent_outpoints')      # txid -> output_index -> next_txid
+        self.history = get_table('addr_history')                 # address -> list of (txid, height)
+        self.addr_status = get_table('addr_status')              # address -> history_status of addr_history
+        self.verified_tx = get_table('verified_tx3')             # txid -> (height, timestamp, txpos, header_hash)
         self.tx_fees = self.get_dict('tx_fees')                  # type: Dict[str, TxFeesValue]
         # scripthash -> set of (outpoint, value)
-        self._prevouts_by_scripthash = self.get_dict('prevouts_by_scripthash')  # type: Dict[str, Set[Tuple[str, int]]]
+        self._prevouts_by_scripthash = get_table('prevouts_by_scripthash')  # type: Dict[str, Set[Tuple[str, int]]]
+        if self._sql_db:
+            # let sqlite find these, so that rows do not have to be decoded
+            unreferenced_txids = self._sql_db.get_unreferenced_keys('transactions', ['txi', 'txo'])
+            dangling_outpoints = self._sql_db.get_dangling_spent_outpoints()
+        else:
+            unreferenced_txids = [
+                tx_hash for tx_hash in self.transactions.keys()
+                if not self.get_txi_addresses(tx_hash) and not self.get_txo_addresses(tx_hash)]
+            dangling_outpoints = [
+                (prevout_hash, prevout_n)
+                for prevout_hash, d in self.spent_outpoints.items()
+                for prevout_n, spending_txid in d.items()
+                if spending_txid not in self.transactions]
         # remove unreferenced tx
-        for tx_hash in list(self.transactions.keys()):
-            if not self.get_txi_addresses(tx_hash) and not self.get_txo_addresses(tx_hash):
-                self.logger.info(f"removing unreferenced tx: {tx_hash}")
-                self.transactions.pop(tx_hash)
+        for tx_hash in unreferenced_txids:
+            self.logger.info(f"removing unreferenced tx: {tx_hash}")
+            self.transactions.pop(tx_hash)
+            self._parsed_txs.pop(tx_hash, None)
         # remove unreferenced outpoints
-        for prevout_hash in self.spent_outpoints.keys():
-            d = self.spent_outpoints[prevout_hash]
-            for prevout_n, spending_txid in list(d.items()):
-                if spending_txid not in self.transactions:
-                    self.logger.info("removing unreferenced spent outpoint")
-                    d.pop(prevout_n)
+        for prevout_hash, prevout_n in dangling_outpoints:
+            self.logger.info("removing unreferenced spent outpoint")
+            self.spent_outpoints[prevout_hash].pop(prevout_n)
+
+    def get_storage_engine(self) -> str:
+        return self.get('storage_engine', 'json')
+
+    def _get_sql_db_path(self) -> str:
+        return self.storage.path + '.sqlite' if self.storage else ':memory:'
+
+    def _get_sql_table(self, name: str) -> SqlStoredDict:
+        return self._sql_db.get_table(name, self)
+
+    @locked
+    def _open_sql_db(self):
+        if self._sql_db is None:
+            self._sql_db = WalletSqlDB(self._get_sql_db_path(), SQL_TABLE_NAMES)
+        # tables still found in the json file are moved to the sqlite db.
+        # they are committed there before the json file stops referencing them.
+        data = {name: self.data[name] for name in SQL_TABLE_NAMES if name in self.data}
+        if not data:
+            return
+        self.logger.info(f"moving {sum(map(len, data.values()))} records to sqlite db")
+        tables = {name: self._get_sql_table(name) for name in data}
+        self._sql_db.update_tables(tables, data)
+        for name in data:
+            self.data.pop(name)
+
+    @modifier
+    def set_storage_engine(self, engine: str) -> None:
+        """Selects where the transaction tables of this wallet are kept,
+        and migrates them. The wallet file is updated by the next write().
+        Note: the sqlite file is not encrypted.
+        """
+        if engine not in STORAGE_ENGINES:
+            raise ValueError(f"unknown storage engine: {engine!r}")
+        if engine == self.get_storage_engine():
+            return
+        if engine == 'sqlite':
+            if self.storage and self.storage.is_encrypted():
+                raise WalletFileException("Cannot use sqlite storage engine with an encrypted wallet file")
+            # a file found here is stale: left over from an interrupted
+            # migration, or from switching back to json
+            self._sql_db_path_to_delete = None
+            delete_sql_db(self._get_sql_db_path())
+            self.put('storage_engine', engine)
+        else:
+            tables = {name: self._sql_db.read_table(name) for name in SQL_TABLE_NAMES}
+            self._sql_db.close()
+            self._sql_db = None
+            if self.storage:
+                self._sql_db_path_to_delete = self._get_sql_db_path()
+            self.put('storage_engine', None)
+            for name, d in tables.items():
+                self.data[name] = d
+        self.load_transactions()
+
+    def _delete_sql_db_if_unused(self):
+        path = self._sql_db_path_to_delete
+        if path is None or self._sql_db is not None:
+            return
+        self.logger.info(f"deleting unused sqlite db {path}")
+        delete_sql_db(path)
+        self._sql_db_path_to_delete = None
+
+    @locked
+    def write(self):
+        JsonDB.write(self)
+        self._delete_sql_db_if_unused()
+
+    @locked
+    def write_and_force_consolidation(self):
+        JsonDB.write_and_force_consolidation(self)
+        self._delete_sql_db_if_unused()
+
+    @locked
+    def dump(self, *, human_readable: bool = True, include_sql_tables: bool = False) -> str:
+        """Serializes the DB as a string.
+        'include_sql_tables': inline tables kept in the sqlite db, so that the
+                              result is a self-contained json wallet file.
+        """
+        if not include_sql_tables or not self._sql_db:
+            return JsonDB.dump(self, human_readable=human_readable)
+        data = dict(self.data)
+        data.pop('storage_engine', None)
+        for name in SQL_TABLE_NAMES:
+            data[name] = self._sql_db.read_table(name)
+        return json.dumps(
+            data,
+            indent=4 if human_readable else None,
+            sort_keys=bool(human_readable),
+            cls=self.encoder,
+        )
 
     @modifier
     def clear_history(self):
@@ -1634,7 +1809,9 @@ class WalletDB(JsonDB):
         self.txo.clear()
         self.spent_outpoints.clear()
         self.transactions.clear()
+        self._parsed_txs.clear()
         self.history.clear()
+        self.addr_status.clear()
         self.verified_tx.clear()
         self.tx_fees.clear()
         self._prevouts_by_scripthash.clear()
@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+#
+# Electrum - lightweight Bitcoin client
+# Copyright (C) 2024 The Electrum Developers
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import json
+import os
+import sqlite3
+import weakref
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, Sequence, Tuple
+
+from .json_db import StoredDict, StoredList, locked
+from .logging import Logger
+from .util import test_read_write_permissions
+
+if TYPE_CHECKING:
+    from .json_db import JsonDB
+
+
+# number of decoded rows per table that are kept alive after use
+ROW_CACHE_SIZE = 1000
+
+
+def delete_sql_db(path: str) -> None:
+    for p in (path, path + '-wal', path + '-shm'):
+        if os.path.exists(p):
+            os.unlink(p)
+
+
+class _SqlRow:
+    """Stands in for the JsonDB of the StoredDict/StoredList holding a row.
+    Nested modifications are written back as a whole row.
+    """
+
+    def __init__(self, table: 'SqlStoredDict', key: str):
+        self.table = table
+        self.key = key
+        self.value = None
+        self.lock = table.db.lock
+        self.encoder = table.db.encoder
+
+    def _should_convert_to_stored_dict(self, key) -> bool:
+        return self.table.db._should_convert_to_stored_dict(key)
+
+    def _convert_dict(self, path, key, v):
+        return self.table.db._convert_dict(path, key, v)
+
+    def _convert_value(self, path, key, v):
+        return self.table.db._convert_value(path, key, v)
+
+    def add_patch(self, patch):
+        self.table._write_row(self.key, self.value)
+
+
+class SqlStoredDict(MutableMapping):
+    """dict-like view of a table in WalletSqlDB.
+
+    Rows are json-encoded, and only decoded when accessed. Decoded rows are
+    converted the same way JsonDB converts values of the dict named after
+    the table.
+    """
+
+    def __init__(self, sql_db: 'WalletSqlDB', name: str, db: 'JsonDB'):
+        self.sql_db = sql_db
+        self.name = name
+        self.db = db
+        self.lock = db.lock
+        self._cache = OrderedDict()  # LRU of decoded rows
+        self._live = weakref.WeakValueDictionary()  # decoded rows still referenced elsewhere
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        return self.sql_db.conn
+
+    def _decode_row(self, key: str, s: str):
+        v = json.loads(s)
+        v = self.db._convert_dict([], self.name, {key: v})[key]
+        row = _SqlRow(self, key)
+        if isinstance(v, dict):
+            v = StoredDict(v, row, [self.name, key])
+        elif isinstance(v, list):
+            v = StoredList(v, row, [self.name, key])
+        row.value = v
+        return v
+
+    def _cache_row(self, key: str, v) -> None:
+        self._cache[key] = v
+        if len(self._cache) > ROW_CACHE_SIZE:
+            self._cache.popitem(last=False)
+        try:
+            self._live[key] = v
+        except TypeError:
+            pass
+
+    def _uncache_row(self, key: str) -> None:
+        self._cache.pop(key, None)
+        self._live.pop(key, None)
+
+    @locked
+    def _write_row(self, key: str, v) -> None:
+        s = json.dumps(v, cls=self.db.encoder)
+        self.conn.execute(f"INSERT OR REPLACE INTO {self.name} (key, value) VALUES (?, ?)", (key, s))
+
+    @locked
+    def __getitem__(self, key: str):
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        v = self._live.get(key)
+        if v is None:
+            r = self.conn.execute(f"SELECT value FROM {self.name} WHERE key=?", (key,)).fetchone()
+            if r is None:
+                raise KeyError(key)
+            v = self._decode_row(key, r[0])
+        self._cache_row(key, v)
+        return v
+
+    @locked
+    def __setitem__(self, key: str, v) -> None:
+        assert isinstance(key, str), key
+        self._write_row(key, v)
+        # the stored value is decoded again on next access, so that it
+        # gets converted the same way as a value loaded from disk
+        self._uncache_row(key)
+
+    @locked
+    def __delitem__(self, key: str) -> None:
+        c = self.conn.execute(f"DELETE FROM {self.name} WHERE key=?", (key,))
+        self._uncache_row(key)
+        if c.rowcount == 0:
+            raise KeyError(key)
+
+    @locked
+    def __contains__(self, key) -> bool:
+        if key in self._cache:
+            return True
+        r = self.conn.execute(f"SELECT 1 FROM {self.name} WHERE key=?", (key,)).fetchone()
+        return r is not None
+
+    @locked
+    def __iter__(self) -> Iterator[str]:
+        return iter([r[0] for r in self.conn.execute(f"SELECT key FROM {self.name}")])
+
+    @locked
+    def __len__(self) -> int:
+        return self.conn.execute(f"SELECT COUNT(*) FROM {self.name}").fetchone()[0]
+
+    @locked
+    def clear(self) -> None:
+        self.conn.execute(f"DELETE FROM {self.name}")
+        self._cache.clear()
+        self._live.clear()
+
+    @locked
+    def update_rows(self, items: Iterable[Tuple[str, object]]) -> None:
+        """Bulk insert, without keeping the values decoded."""
+        self.conn.executemany(
+            f"INSERT OR REPLACE INTO {self.name} (key, value) VALUES (?, ?)",
+            ((k, json.dumps(v, cls=self.db.encoder)) for k, v in items))
+        self._cache.clear()
+        self._live.clear()
+
+    def __repr__(self):
+        return f"<SqlStoredDict {self.name}>"
+
+
+class WalletSqlDB(Logger):
+    """SQLite file holding the transaction-related tables of a wallet.
+
+    Unlike SqlDB, this is accessed synchronously, from whichever thread
+    holds the lock of the WalletDB. Statements are committed as they are
+    executed (in WAL mode, without fsync), so that the file is never kept
+    locked between two writes.
+    """
+
+    def __init__(self, path: str, table_names: Sequence[str]):
+        Logger.__init__(self)
+        self.path = path
+        if path != ':memory:':
+            test_read_write_permissions(path)
+        self.table_names = tuple(table_names)
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.create_database()
+
+    def create_database(self):
+        for name in self.table_names:
+            self.conn.execute(f"CREATE TABLE IF NOT EXISTS {name} (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    def get_table(self, name: str, db: 'JsonDB') -> SqlStoredDict:
+        assert name in self.table_names, name
+        return SqlStoredDict(self, name, db)
+
+    def read_table(self, name: str) -> dict:
+        """Returns the whole table, json-decoded but not converted."""
+        return {k: json.loads(v) for k, v in self.conn.execute(f"SELECT key, value FROM {name}")}
+
+    def get_unreferenced_keys(self, name: str, referenced_by: Sequence[str]) -> Sequence[str]:
+        """Returns keys of table 'name' that have no non-empty row in any of 'referenced_by'."""
+        q = f"SELECT key FROM {name}"
+        for ref in referenced_by:
+            q += (" AND" if ' WHERE ' in q else " WHERE") + f" key NOT IN (SELECT key FROM {ref} WHERE value != '{{}}')"
+        return [r[0] for r in self.conn.execute(q)]
+
+    def get_dangling_spent_outpoints(self) -> Sequence[Tuple[str, str]]:
+        """Returns (prevout_hash, prevout_n) of spent outpoints whose spending tx is unknown."""
+        return self.conn.execute(
+            "SELECT s.key, j.key FROM spent_outpoints s, json_each(s.value) j"
+            " WHERE j.value NOT IN (SELECT key FROM transactions)").fetchall()
+
+    def update_tables(self, tables: Dict[str, SqlStoredDict], data: Dict[str, dict]) -> None:
+        """Bulk insert, in a single transaction."""
+        self.conn.execute("BEGIN")
+        try:
+            for name, d in data.items():
+                tables[name].update_rows(d.items())
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def close(self):
+        self.conn.close()